@@ -0,0 +1,67 @@
+"""Single worker throughput of GET /account/{username} as client concurrency rises.
+
+Runs against the memory storage backend with --latency-ms of simulated round trip per call, so the
+numbers show how well one event loop overlaps storage round trips rather than how fast AWS is.
+
+    cd src/gojenga && python -m bench.bench_concurrency --latency-ms 20 --requests 400
+"""
+import argparse
+import asyncio
+import json
+import time
+from decimal import Decimal
+
+import httpx
+
+from common.Auth import create_access_token
+from main import app
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+
+def install_memory_storage(latency: float):
+    storage = Memory(latency=latency)
+    for table_name in ('users', 'usersTest'):
+        storage.create_item(table_name, {'name': 'benchuser', 'password': 'unused'})
+    storage.create_item('ledger', {'name': 'benchuser', 'balance': Decimal('100.00')})
+    set_storage(storage)
+
+
+async def run_level(client: httpx.AsyncClient, headers: dict, concurrency: int, total: int) -> dict:
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            queue.get_nowait()
+            resp = await client.get('/account/benchuser', headers=headers)
+            if resp.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {'concurrency': concurrency, 'requests': total, 'errors': errors,
+            'seconds': round(elapsed, 3), 'throughput_rps': round(total / elapsed, 1)}
+
+
+async def main(args):
+    install_memory_storage(args.latency_ms / 1000)
+    token = create_access_token({'sub': 'benchuser'})
+    headers = {'Authorization': f'Bearer {token}'}
+    results = []
+    async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+        for concurrency in args.concurrency:
+            results.append(await run_level(client, headers, concurrency, args.requests))
+    print(json.dumps({'latency_ms': args.latency_ms, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    asyncio.run(main(parser.parse_args()))
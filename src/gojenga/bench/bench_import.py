@@ -0,0 +1,54 @@
+"""Bulk import throughput on the memory backend.
+
+Imports --users generated rows through ImportHandler with --latency-ms per storage round trip, once with
+rows that carry an existing bcrypt hash and once with plain passwords hashed in the password pool.
+
+    cd src/gojenga && python -m bench.bench_import --users 20000 --plain-users 200 --latency-ms 5
+"""
+import argparse
+import asyncio
+import json
+
+from common.PasswordPool import hash_password, password_pool
+from handlers.import_handler import ImportHandler
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+
+async def generate(count: int, prefix: str, password_hash: str | None):
+    for i in range(count):
+        if password_hash:
+            yield {'name': f'{prefix}{i}', 'password_hash': password_hash, 'balance': '10.00'}
+        else:
+            yield {'name': f'{prefix}{i}', 'password': 'loadtest', 'balance': '10.00'}
+
+
+async def run_level(count: int, prefix: str, password_hash: str | None, latency: float) -> dict:
+    set_storage(Memory(latency=latency))
+    summary: dict = {}
+    async for event in ImportHandler.handle_import(generate(count, prefix, password_hash), True):
+        summary = event.get('done', summary)
+    summary['users_per_minute'] = round(summary['imported'] / summary['elapsed_seconds'] * 60, 1)
+    return summary
+
+
+async def run(args) -> dict:
+    await password_pool.start()
+    try:
+        return {'prehashed': await run_level(args.users, 'hashed', hash_password('loadtest'), args.latency_ms / 1000),
+                'plain': await run_level(args.plain_users, 'plain', None, args.latency_ms / 1000)}
+    finally:
+        password_pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20000, help='rows with an existing bcrypt hash')
+    parser.add_argument('--plain-users', type=int, default=200, help='rows with a plain password')
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Login throughput with bcrypt inline on the event loop versus in the password process pool.
+
+While the logins run, a ticker measures event loop lag, i.e. how long any other request would wait behind bcrypt.
+Throughput only scales with workers up to the number of cores.
+
+    cd src/gojenga && python -m bench.bench_login --logins 64 --workers 0 1 2 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from common import Auth
+from common.PasswordPool import PasswordPool, hash_password
+from main import app
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+PASSWORD = 'benchpass'
+
+
+async def measure_lag(stop: asyncio.Event, lags: list[float], interval: float = 0.01):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def run_level(client: httpx.AsyncClient, workers: int, args) -> dict:
+    pool = PasswordPool(workers, max_pending=args.logins)
+    Auth.password_pool = pool
+    await pool.start()
+    remaining = args.logins
+    failures = 0
+
+    async def worker():
+        nonlocal remaining, failures
+        while remaining > 0:
+            remaining -= 1
+            resp = await client.post('/login', data={'username': 'benchuser', 'password': PASSWORD},
+                                     headers={'Is-Test': 'True'})
+            failures += resp.status_code != 200
+
+    stop = asyncio.Event()
+    lags: list[float] = []
+    lag_task = asyncio.create_task(measure_lag(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+    pool.shutdown()
+    return {'workers': workers, 'logins': args.logins, 'failures': failures, 'seconds': round(elapsed, 3),
+            'logins_per_second': round(args.logins / elapsed, 2),
+            'loop_lag_max_ms': round(max(lags) * 1000, 1) if lags else None}
+
+
+async def main(args):
+    storage = Memory()
+    storage.create_item('usersTest', {'name': 'benchuser', 'password': hash_password(PASSWORD)})
+    set_storage(storage)
+    async with httpx.AsyncClient(app=app, base_url='http://bench', timeout=120) as client:
+        results = [await run_level(client, workers, args) for workers in args.workers]
+    print(json.dumps({'cpus': os.cpu_count(), 'concurrency': args.concurrency, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4],
+                        help='pool sizes to compare, 0 hashes inline on the event loop')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,99 @@
+"""Per-request cost of tracing, through the whole app on the memory backend.
+
+Sends --requests authenticated GET /account/{username} calls once per tracing setup: off (no-op provider),
+every span recorded, the request span only (TRACE_NESTED_SPANS=false) and 1% sampling. The tracer provider
+can only be installed once per process, so each setup runs in a child process. Spans go to an exporter that
+drops them, so the numbers are the in-process cost only, not the network. Setups take turns for --rounds
+rounds and the fastest round of each is kept, which evens out noise from other load on the machine.
+
+    cd src/gojenga && python -m bench.bench_tracing --requests 3000 --rounds 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+SETUPS = {
+    'off': {'TRACE_EXPORTER': 'none'},
+    'all_spans': {'TRACE_SAMPLE_RATIO': '1.0', 'TRACE_NESTED_SPANS': 'true'},
+    'request_span_only': {'TRACE_SAMPLE_RATIO': '1.0', 'TRACE_NESTED_SPANS': 'false'},
+    'sampled_1_percent': {'TRACE_SAMPLE_RATIO': '0.01', 'TRACE_NESTED_SPANS': 'true'},
+}
+
+
+async def measure(setup: str, requests: int) -> dict:
+    import httpx
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+    from common.Telemetry import configure_tracing
+
+    class DiscardExporter(SpanExporter):
+        def __init__(self):
+            self.spans = 0
+
+        def export(self, spans) -> SpanExportResult:
+            self.spans += len(spans)
+            return SpanExportResult.SUCCESS
+
+    exporter = None if setup == 'off' else DiscardExporter()
+    # installed before main is imported, its own configure_tracing call is then a no-op
+    configure_tracing(exporter)
+
+    from decimal import Decimal
+    from opentelemetry import trace
+    from common.Auth import create_access_token
+    from main import app
+    from storage.Backend import set_storage
+    from storage.Memory import Memory
+
+    storage = Memory()
+    storage.create_item('usersTest', {'name': 'benchuser', 'password': 'unused'})
+    storage.create_item('ledgerTest', {'name': 'benchuser', 'balance': Decimal('10.00')})
+    set_storage(storage)
+    headers = {'Is-Test': 'True', 'Authorization': f'Bearer {create_access_token({"sub": "benchuser"})}'}
+    async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+        for _ in range(200):
+            await client.get('/account/benchuser', headers=headers)
+        started = time.perf_counter()
+        for _ in range(requests):
+            resp = await client.get('/account/benchuser', headers=headers)
+            assert resp.status_code == 200, resp.text
+        elapsed = time.perf_counter() - started
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, 'force_flush'):
+        provider.force_flush()
+    return {'setup': setup, 'requests': requests, 'us_per_request': round(elapsed / requests * 1e6, 1),
+            'spans_per_request': round(exporter.spans / (requests + 200), 2) if exporter else 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--setup', choices=SETUPS, help='run one setup in this process')
+    args = parser.parse_args()
+    if args.setup:
+        print(json.dumps(asyncio.run(measure(args.setup, args.requests))))
+        return
+    best: dict[str, dict] = {}
+    for _ in range(args.rounds):
+        for setup, env in SETUPS.items():
+            out = subprocess.run([sys.executable, '-m', 'bench.bench_tracing', '--setup', setup,
+                                  '--requests', str(args.requests)],
+                                 env={**os.environ, 'RATE_LIMITS': '', **env}, capture_output=True, text=True,
+                                 check=True)
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            if setup not in best or result['us_per_request'] < best[setup]['us_per_request']:
+                best[setup] = result
+    results = list(best.values())
+    baseline = results[0]['us_per_request']
+    for result in results:
+        result['overhead_us'] = round(result['us_per_request'] - baseline, 1)
+    print(json.dumps({'cpus': os.cpu_count(), 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Transfer throughput when many clients hammer a small set of hot accounts.
+
+Each level runs --transfers AccountHandler.handle_transaction calls between --accounts accounts (2 is a single
+hot pair) on the memory backend with --latency-ms per round trip, then checks that no money was created or lost.
+
+    cd src/gojenga && python -m bench.bench_transfers --accounts 2 8 64 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from decimal import Decimal
+
+from handlers.account_handler import AccountHandler
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+OPENING_BALANCE = Decimal('100.00')
+
+
+async def run_level(accounts: int, args) -> dict:
+    storage = Memory(latency=args.latency_ms / 1000)
+    set_storage(storage)
+    names = [f'hot{i}' for i in range(accounts)]
+    for name in names:
+        storage.create_item('ledgerTest', {'name': name, 'balance': OPENING_BALANCE})
+
+    outcomes = {'ok': 0, 'insufficient': 0, 'failed': 0}
+    remaining = args.transfers
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            sender, receiver = random.sample(names, 2)
+            try:
+                await AccountHandler.handle_transaction(sender, receiver, Decimal('1.00'), True)
+                outcomes['ok'] += 1
+            except ValueError as e:
+                outcomes['insufficient' if 'insufficient' in str(e) else 'failed'] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    total = sum(storage.get_item('ledgerTest', {'name': name})['balance'] for name in names)
+    return {'accounts': accounts, 'transfers': args.transfers, **outcomes, 'seconds': round(elapsed, 3),
+            'throughput_tps': round(args.transfers / elapsed, 1),
+            'money_conserved': total == OPENING_BALANCE * accounts}
+
+
+async def main(args):
+    results = [await run_level(accounts, args) for accounts in args.accounts]
+    print(json.dumps({'latency_ms': args.latency_ms, 'concurrency': args.concurrency, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, nargs='+', default=[2, 8, 64])
+    parser.add_argument('--transfers', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
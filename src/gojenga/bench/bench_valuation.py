@@ -0,0 +1,42 @@
+"""CPU time to value many portfolios with the vectorized engine.
+
+Builds --portfolios synthetic portfolios of --coins holdings each, then times loading them into columns
+and valuing them separately, in process CPU seconds.
+
+    cd src/gojenga && python -m bench.bench_valuation --portfolios 100000 --coins 5
+"""
+import argparse
+import json
+import random
+import time
+from decimal import Decimal
+
+from common.Valuation import STAND_IN_PRICES, Holdings, PriceTable, value_holdings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--portfolios', type=int, default=100000)
+    parser.add_argument('--coins', type=int, default=5, help='holdings per portfolio')
+    args = parser.parse_args()
+
+    coin_ids = list(STAND_IN_PRICES) + ['unlisted']
+    items = [{'name': f'user{i}', 'portfolio': {coin_id: {'name': coin_id, 'id': coin_id,
+                                                          'amount': Decimal(random.randint(1, 1000))}
+                                                for coin_id in random.sample(coin_ids, min(args.coins, len(coin_ids)))}}
+             for i in range(args.portfolios)]
+    prices = PriceTable().get()
+
+    started = time.process_time()
+    holdings = Holdings.from_items(items, prices)
+    loaded = time.process_time()
+    values = value_holdings(holdings, prices)
+    valued = time.process_time()
+    print(json.dumps({'portfolios': args.portfolios, 'holdings': len(holdings.amounts),
+                      'load_cpu_seconds': round(loaded - started, 4),
+                      'value_cpu_seconds': round(valued - loaded, 4),
+                      'total_value': round(float(values.sum()), 2)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""Load test every route with a weighted request mix and report per-route latency percentiles as JSON.
+
+By default the app runs in process on the memory storage backend, seeded directly, so no AWS is needed.
+Pass --base-url to drive a running server instead; users are then seeded through the API.
+
+    cd src/gojenga && python -m bench.load_test --concurrency 32 --requests 5000 --latency-ms 5
+    python -m bench.load_test --mix get_account=10,deposit=5,transaction=5 --duration 30 --output load.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+import httpx
+
+from common.Auth import create_access_token, get_password_hash
+
+PASSWORD = 'loadtest'
+HEADERS = {'Is-Test': 'True'}
+
+# relative weight of each scenario, override with --mix
+DEFAULT_MIX = {
+    'login': 1,
+    'refresh': 2,
+    'get_user': 10,
+    'post_user': 1,
+    'put_user': 2,
+    'delete_user': 1,
+    'get_account': 20,
+    'post_account': 2,
+    'put_account': 2,
+    'delete_account': 1,
+    'deposit': 10,
+    'transaction': 10,
+    'get_portfolio': 15,
+    'post_portfolio': 2,
+    'put_portfolio': 5,
+    'delete_portfolio': 1,
+}
+
+
+class Context:
+    def __init__(self, users: list[str], tokens: dict[str, str]):
+        self.users = users
+        self.tokens = tokens
+        self.scratch = itertools.count()
+
+    def user(self) -> str:
+        return random.choice(self.users)
+
+    def auth(self, username: str) -> dict:
+        return {**HEADERS, 'Authorization': f'Bearer {self.tokens[username]}'}
+
+    def scratch_name(self) -> str:
+        # scratch names keep destructive scenarios away from the seeded users
+        return f'scratch{next(self.scratch)}'
+
+
+async def login(client: httpx.AsyncClient, ctx: Context):
+    return await client.post('/login', data={'username': ctx.user(), 'password': PASSWORD}, headers=HEADERS)
+
+
+async def refresh(client: httpx.AsyncClient, ctx: Context):
+    return await client.put('/refresh', json={'token': ctx.tokens[ctx.user()]})
+
+
+async def get_user(client: httpx.AsyncClient, ctx: Context):
+    username = ctx.user()
+    return await client.get(f'/user/{username}', headers=ctx.auth(username))
+
+
+async def post_user(client: httpx.AsyncClient, ctx: Context):
+    return await client.post('/user', json={'name': ctx.scratch_name(), 'password': PASSWORD}, headers=HEADERS)
+
+
+async def put_user(client: httpx.AsyncClient, ctx: Context):
+    name = ctx.scratch_name()
+    return await client.put(f'/user/{name}', json={'name': name, 'password': PASSWORD}, headers=ctx.auth(ctx.user()))
+
+
+async def delete_user(client: httpx.AsyncClient, ctx: Context):
+    return await client.delete(f'/user/{ctx.scratch_name()}', headers=ctx.auth(ctx.user()))
+
+
+async def get_account(client: httpx.AsyncClient, ctx: Context):
+    username = ctx.user()
+    return await client.get(f'/account/{username}', headers=ctx.auth(username))
+
+
+async def post_account(client: httpx.AsyncClient, ctx: Context):
+    return await client.post('/account/', json={'name': ctx.scratch_name(), 'balance': '0'},
+                             headers=ctx.auth(ctx.user()))
+
+
+async def put_account(client: httpx.AsyncClient, ctx: Context):
+    name = ctx.scratch_name()
+    return await client.put(f'/account/{name}', json={'name': name, 'balance': '10'}, headers=ctx.auth(ctx.user()))
+
+
+async def delete_account(client: httpx.AsyncClient, ctx: Context):
+    return await client.delete(f'/account/{ctx.scratch_name()}', headers=ctx.auth(ctx.user()))
+
+
+async def deposit(client: httpx.AsyncClient, ctx: Context):
+    username = ctx.user()
+    return await client.post(f'/account/{username}/deposit', json={'name': username, 'balance': '1.00'},
+                             headers=ctx.auth(username))
+
+
+async def transaction(client: httpx.AsyncClient, ctx: Context):
+    sender, receiver = random.sample(ctx.users, 2)
+    return await client.post(f'/account/{sender}/transaction',
+                             json={'sender': sender, 'receiver': receiver, 'amount': '0.01'},
+                             headers=ctx.auth(sender))
+
+
+async def get_portfolio(client: httpx.AsyncClient, ctx: Context):
+    username = ctx.user()
+    return await client.get(f'/portfolio/{username}', headers=ctx.auth(username))
+
+
+async def post_portfolio(client: httpx.AsyncClient, ctx: Context):
+    portfolio = [{'name': 'litecoin', 'amount': 1, 'id': 'litecoin'}]
+    return await client.post('/portfolio/', json={'username': ctx.scratch_name(), 'portfolio': portfolio},
+                             headers=ctx.auth(ctx.user()))
+
+
+async def put_portfolio(client: httpx.AsyncClient, ctx: Context):
+    username = ctx.user()
+    coin = random.choice(['bitcoin', 'ethereum', 'litecoin', 'dogecoin'])
+    portfolio = [{'name': coin, 'amount': random.randint(1, 10), 'id': coin}]
+    return await client.put(f'/portfolio/{username}', json={'username': username, 'portfolio': portfolio},
+                            headers={**ctx.auth(username), 'Update-Type': 'buy'})
+
+
+async def delete_portfolio(client: httpx.AsyncClient, ctx: Context):
+    return await client.delete(f'/portfolio/{ctx.scratch_name()}', headers=ctx.auth(ctx.user()))
+
+
+SCENARIOS = {name: globals()[name] for name in DEFAULT_MIX}
+
+
+def parse_mix(spec: str | None) -> dict[str, float]:
+    if not spec:
+        return dict(DEFAULT_MIX)
+    mix: dict[str, float] = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise SystemExit(f'unknown scenario {name}, pick from {", ".join(SCENARIOS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(ordered: list[float], pct: float) -> float:
+    # nearest rank on an already sorted list
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    count = len(ordered)
+    summary = {'requests': count, 'errors': errors, 'error_rate': round(errors / count, 4) if count else 0.0,
+               'throughput_rps': round(count / elapsed, 2)}
+    if count:
+        summary.update({'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+                        'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+                        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+                        'max_ms': round(ordered[-1] * 1000, 3)})
+    return summary
+
+
+async def seed_in_process(users: list[str], latency: float):
+    from storage.Backend import set_storage
+    from storage.Memory import Memory
+
+    storage = Memory(latency=latency)
+    hashed_password = get_password_hash(PASSWORD)
+    for username in users:
+        storage.create_item('usersTest', {'name': username, 'password': hashed_password})
+        storage.create_item('ledgerTest', {'name': username, 'balance': Decimal('1000000.00')})
+        storage.create_item('portfolioTest', {'name': username,
+                                              'portfolio': {'litecoin': {'name': 'litecoin', 'amount': 1,
+                                                                         'id': 'litecoin'}}})
+    set_storage(storage)
+
+
+async def seed_over_api(client: httpx.AsyncClient, users: list[str]):
+    for username in users:
+        await client.post('/user', json={'name': username, 'password': PASSWORD}, headers=HEADERS)
+    token = create_access_token({'sub': users[0]})
+    for username in users:
+        await client.post(f'/account/{username}/deposit', json={'name': username, 'balance': '1000000.00'},
+                          headers={**HEADERS, 'Authorization': f'Bearer {token}'})
+
+
+async def run(args) -> dict:
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    users = [f'loaduser{i}' for i in range(args.users)]
+    # tokens are minted locally, so the app under test must share SECRET_KEY
+    tokens = {username: create_access_token({'sub': username}) for username in users}
+    ctx = Context(users, tokens)
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+        await seed_over_api(client, users)
+    else:
+        # every virtual client shares one address in process, per-ip limits would only measure 429s
+        os.environ.setdefault('RATE_LIMITS', '')
+        from main import app
+        await seed_in_process(users, args.latency_ms / 1000)
+        client = httpx.AsyncClient(app=app, base_url='http://loadtest', timeout=args.timeout)
+
+    latencies: dict[str, list[float]] = {name: [] for name in names}
+    errors: dict[str, int] = {name: 0 for name in names}
+    issued = itertools.count()
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    async def worker():
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    return
+            elif next(issued) >= args.requests:
+                return
+            name = random.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                resp = await SCENARIOS[name](client, ctx)
+                failed = resp.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies[name].append(time.perf_counter() - started)
+            if failed:
+                errors[name] += 1
+
+    started = time.perf_counter()
+    async with client:
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [latency for route in latencies.values() for latency in route]
+    return {
+        'config': {'concurrency': args.concurrency, 'requests': args.requests, 'duration': args.duration,
+                   'users': args.users, 'latency_ms': args.latency_ms, 'base_url': args.base_url, 'mix': mix},
+        'elapsed_seconds': round(elapsed, 3),
+        'total': summarize(all_latencies, sum(errors.values()), elapsed),
+        'routes': {name: summarize(latencies[name], errors[name], elapsed) for name in names if latencies[name]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=16, help='simultaneous virtual clients')
+    parser.add_argument('--requests', type=int, default=2000, help='total requests, ignored with --duration')
+    parser.add_argument('--duration', type=float, default=None, help='run for this many seconds instead')
+    parser.add_argument('--users', type=int, default=50, help='seeded users the mix picks from')
+    parser.add_argument('--mix', default=None, help='scenario=weight pairs, e.g. get_account=10,deposit=2')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='simulated storage round trip (in process)')
+    parser.add_argument('--base-url', default=None, help='drive a running server instead of the in-process app')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--output', default=None, help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text)
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import json
+import os
+import unittest
+from unittest import mock
+
+from bench import load_test
+from handlers.read_cache import read_cache
+
+
+class TestLoadTest(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        read_cache.clear()
+
+    async def test_in_process_run_reports_every_route(self):
+        args = argparse.Namespace(concurrency=4, requests=40, duration=None, users=5, latency_ms=0.0,
+                                  base_url=None, timeout=30.0,
+                                  mix='get_account=2,deposit=1,transaction=1,get_portfolio=1')
+        with mock.patch.dict(os.environ):
+            report = json.loads(json.dumps(await load_test.run(args)))
+
+        assert report['config']['mix'] == {'get_account': 2, 'deposit': 1, 'transaction': 1, 'get_portfolio': 1}
+        assert report['total']['requests'] == 40
+        assert report['total']['errors'] == 0
+        assert set(report['routes']) <= set(report['config']['mix'])
+        assert sum(route['requests'] for route in report['routes'].values()) == 40
+        for summary in [report['total'], *report['routes'].values()]:
+            assert {'requests', 'errors', 'error_rate', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms',
+                    'max_ms'} <= set(summary)
+            assert summary['p50_ms'] <= summary['p95_ms'] <= summary['p99_ms'] <= summary['max_ms']
+
+    def test_mix_and_percentiles(self):
+        assert load_test.parse_mix('deposit=3,get_account') == {'deposit': 3, 'get_account': 1}
+        with self.assertRaises(SystemExit):
+            load_test.parse_mix('unknown=1')
+        ordered = [float(i) for i in range(1, 101)]
+        assert [load_test.percentile(ordered, pct) for pct in (50, 95, 99)] == [50.0, 95.0, 99.0]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+"""Export the ledger or portfolio table as NDJSON, optionally gzip compressed.
+
+Segments are scanned in parallel and written as they arrive, memory use does not grow with the table.
+
+    cd src/gojenga && python -m cli.export_table ledger --segments 8 --gzip --output ledger.ndjson.gz
+"""
+import argparse
+import sys
+
+from handlers.export_handler import ExportHandler, EXPORTABLE_TABLES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('table', choices=EXPORTABLE_TABLES)
+    parser.add_argument('--test', action='store_true', help='export the Test table')
+    parser.add_argument('--segments', type=int, default=4, help='parallel scan segments')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--output', default=None, help='write here instead of stdout')
+    args = parser.parse_args()
+
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in ExportHandler.iter_export(args.table, args.test, args.segments, args.gzip):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Bulk import users, each with a ledger row and the default portfolio, from a CSV or NDJSON file.
+
+CSV needs a header with name and password (or password_hash, an existing bcrypt hash) and may have balance;
+NDJSON rows use the same keys. Failed rows are written to stdout as NDJSON, progress goes to stderr.
+
+    cd src/gojenga && python -m cli.import_users partner.csv --test > failures.ndjson
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from common.PasswordPool import password_pool
+from handlers.import_handler import ImportHandler, iter_lines, parse_rows
+
+
+async def read_file(path: str, size: int = 64 * 1024):
+    with open(path, 'rb') as f:
+        while chunk := f.read(size):
+            yield chunk
+
+
+async def run(args) -> dict:
+    await password_pool.start()
+    try:
+        rows = parse_rows(iter_lines(read_file(args.path)), args.format)
+        summary: dict = {}
+        async for event in ImportHandler.handle_import(rows, args.test):
+            if 'failed' in event:
+                sys.stdout.write(json.dumps(event['failed']) + '\n')
+            elif 'progress' in event:
+                sys.stderr.write(json.dumps(event['progress']) + '\n')
+            else:
+                summary = event['done']
+        return summary
+    finally:
+        password_pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=('csv', 'ndjson'), default=None, help='default: from the extension')
+    parser.add_argument('--test', action='store_true', help='import into the Test tables')
+    args = parser.parse_args()
+    args.format = args.format or ('csv' if args.path.endswith('.csv') else 'ndjson')
+    sys.stderr.write(json.dumps(asyncio.run(run(args))) + '\n')
+
+
+if __name__ == '__main__':
+    main()
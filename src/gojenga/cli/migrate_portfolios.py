@@ -0,0 +1,41 @@
+"""Convert every list-shaped portfolio to a map keyed by coin id.
+
+Updates migrate the portfolios they touch on their own, this finishes the rest. Segments of the table are
+scanned in parallel; running it twice, or while the API is serving, is safe.
+
+    cd src/gojenga && python -m cli.migrate_portfolios --table portfolio --segments 8
+"""
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from storage.Backend import get_storage
+
+
+def migrate_segment(table_name: str, segment: int, total_segments: int) -> dict:
+    storage = get_storage()
+    counts = {'scanned': 0, 'migrated': 0}
+    for item in storage.scan(table_name, segment, total_segments):
+        counts['scanned'] += 1
+        if not isinstance(item.get('portfolio'), dict) and storage.migrate_portfolio(table_name, item['name']):
+            counts['migrated'] += 1
+    return counts
+
+
+def migrate(table_name: str, total_segments: int) -> dict:
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        results = list(executor.map(lambda segment: migrate_segment(table_name, segment, total_segments),
+                                    range(total_segments)))
+    return {key: sum(result[key] for result in results) for key in ('scanned', 'migrated')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--table', default='portfolio', help='portfolio or portfolioTest')
+    parser.add_argument('--segments', type=int, default=4, help='parallel scan segments')
+    args = parser.parse_args()
+    print(json.dumps(migrate(args.table, args.segments)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Rebuild every ledger balance from the transaction log, storing snapshots where the tail has grown.
+
+Accounts older than the transaction log have no entries to rebuild from. --baseline gives each of those one
+'set' entry holding its current balance; run it once while writes are paused, a deposit landing between the
+read and the baseline entry would be replaced by it on rebuild. Sharded accounts are rebuilt once, against the
+sum of their shards.
+
+    cd src/gojenga && python -m cli.snapshot_balances --segments 4 [--test] [--baseline]
+"""
+import argparse
+import asyncio
+import json
+from itertools import islice
+
+from handlers.export_handler import ExportHandler
+from handlers.ledger_log import log_entry, log_table, rebuild_balance, SET
+from handlers.sharded_balance import SHARDED_ACCOUNTS, read_shards
+from storage.AsyncDynamo import AsyncDynamo, run_in_storage_executor
+
+# accounts rebuilt at once, also the most ledger items held in memory besides the export's scan buffer
+SNAPSHOT_PAGE = 64
+
+
+async def snapshot_account(account: dict, is_test: bool, baseline: bool, counts: dict):
+    ledger_table = 'ledgerTest' if is_test else 'ledger'
+    name = account['name']
+    if '#' in name:
+        # a shard of a sharded account, counted with the account's own item
+        return
+    counts['scanned'] += 1
+    balance = account['balance']
+    if name in SHARDED_ACCOUNTS:
+        balance = sum((await read_shards(ledger_table, name)).values())
+    if baseline:
+        entries, _ = await AsyncDynamo.query_range(log_table(is_test), name, limit=1)
+        if not entries:
+            opening = log_entry(is_test, name, SET, balance=balance)
+            await AsyncDynamo.create_item(opening.table_name, opening.item, if_not_exists=True)
+            counts['baselined'] += 1
+    rebuilt = await rebuild_balance(name, is_test)
+    counts['snapshotted'] += rebuilt['snapshotted']
+    counts['mismatched'] += rebuilt['balance'] != balance
+
+
+async def snapshot(is_test: bool, baseline: bool, total_segments: int) -> dict:
+    counts = {'scanned': 0, 'baselined': 0, 'snapshotted': 0, 'mismatched': 0}
+    # the segments are scanned page by page on the export's threads, the ledger is never loaded whole
+    accounts = ExportHandler.scan_items('ledgerTest' if is_test else 'ledger', total_segments)
+    try:
+        while page := await run_in_storage_executor(lambda: list(islice(accounts, SNAPSHOT_PAGE))):
+            await asyncio.gather(*(snapshot_account(account, is_test, baseline, counts) for account in page))
+    finally:
+        accounts.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--test', action='store_true', help='use the Test tables')
+    parser.add_argument('--baseline', action='store_true', help='open a log for accounts that have none')
+    parser.add_argument('--segments', type=int, default=4, help='parallel scan segments')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(snapshot(args.test, args.baseline, args.segments))))
+
+
+if __name__ == '__main__':
+    main()
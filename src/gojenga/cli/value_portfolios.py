@@ -0,0 +1,53 @@
+"""Value every portfolio against the price table and report the aggregate, optionally per user.
+
+Each scan segment is read and valued on its own thread, so only one segment's holdings are held at a time.
+
+    cd src/gojenga && python -m cli.value_portfolios --table portfolio --segments 8 --output values.csv
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from common.Valuation import Holdings, price_table, value_holdings
+from storage.Backend import get_storage
+
+
+def value_segment(table_name: str, segment: int, total_segments: int) -> tuple[list[str], np.ndarray]:
+    prices = price_table.get()
+    holdings = Holdings.from_items(get_storage().scan(table_name, segment, total_segments), prices)
+    return holdings.names, value_holdings(holdings, prices)
+
+
+def value_table(table_name: str, total_segments: int) -> tuple[list[str], np.ndarray]:
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        results = list(executor.map(lambda segment: value_segment(table_name, segment, total_segments),
+                                    range(total_segments)))
+    names = [name for segment_names, _ in results for name in segment_names]
+    values = np.concatenate([values for _, values in results]) if results else np.zeros(0)
+    return names, values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--table', default='portfolio', help='portfolio or portfolioTest')
+    parser.add_argument('--segments', type=int, default=4, help='parallel scan segments')
+    parser.add_argument('--output', default=None, help='write name,value per portfolio to this CSV file')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    names, values = value_table(args.table, args.segments)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write('name,value\n')
+            output.writelines(f'{name},{value:.2f}\n' for name, value in zip(names, values))
+    print(json.dumps({'portfolios': len(names), 'total_value': round(float(values.sum()), 2),
+                      'mean_value': round(float(values.mean()), 2) if len(names) else 0.0,
+                      'max_value': round(float(values.max()), 2) if len(names) else 0.0,
+                      'elapsed_seconds': round(time.perf_counter() - started, 3)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,5 @@
+import os
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -5,10 +7,14 @@ import pytz
 from fastapi import Depends, FastAPI, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt, ExpiredSignatureError
-from passlib.context import CryptContext
 from pydantic import BaseModel
 
-from storage.Dynamo import Dynamo, logger
+from common.Cache import TTLCache
+from common.PasswordPool import pwd_context, password_pool
+from common.Revocation import RevocationList
+from storage.AsyncDynamo import AsyncDynamo
+from storage.Dynamo import logger
+from storage.Storage import StorageUnavailable
 
 
 class MyAuth:
@@ -23,6 +29,24 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_ACCESS_TOKEN_EXPIRE_DAYS = 7
 
+# resolved users kept per worker; writes through UserHandler invalidate locally, other workers wait out the ttl
+USER_CACHE_TTL_SECONDS = float(os.getenv('USER_CACHE_TTL_SECONDS', '30'))
+USER_CACHE_MAX_SIZE = int(os.getenv('USER_CACHE_MAX_SIZE', '10000'))
+
+user_cache = TTLCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+
+# 'lookup' reads the user on every request, 'stateless' trusts a verified token unless its user was revoked
+AUTH_MODE = os.getenv('AUTH_MODE', 'lookup')
+REVOCATION_REFRESH_SECONDS = float(os.getenv('REVOCATION_REFRESH_SECONDS', '30'))
+REVOCATION_CAPACITY = int(os.getenv('REVOCATION_CAPACITY', '100000'))
+
+# comma separated usernames allowed on admin routes such as the table export
+ADMIN_USERS = frozenset(filter(None, (name.strip().lower() for name in os.getenv('ADMIN_USERS', '').split(','))))
+
+# tokens do not say whether they are for test requests, so revocations from either table refuse them
+revocations = {table_name: RevocationList(table_name, REVOCATION_CAPACITY, REVOCATION_REFRESH_SECONDS)
+               for table_name in ('revoked', 'revokedTest')}
+
 fake_users_db = {
     "johndoe": {
         "username": "johndoe",
@@ -56,8 +80,6 @@ class UserInDB(User):
     hashed_password: str
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 app = FastAPI()
@@ -71,32 +93,47 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
-def get_user(table_name, username: str):
+async def get_user(table_name, username: str):
     query: dict = {'name': username}
     try:
-        user = Dynamo.get_item(table_name, query)
+        user = await AsyncDynamo.get_item(table_name, query)
         # user["disabled"] = False
         return user
+    except StorageUnavailable:
+        # answered with 429 or 503 and Retry-After rather than passing for an unknown user
+        raise
     except Exception as e:
         logger.error(e)
 
 
-def authenticate_user(table_name, username: str, password: str):
-    user = get_user(table_name, username)
-    if not user:
+async def get_cached_user(table_name, username: str):
+    key = (table_name, username)
+    user = user_cache.get(key)
+    if user is None:
+        user = await get_user(table_name, username)
+        # only real users are cached, a missing user is looked up again next time
+        if user and 'name' in user:
+            user_cache.set(key, user)
+    return user
+
+
+async def authenticate_user(table_name, username: str, password: str):
+    user = await get_user(table_name, username)
+    if not user or "password" not in user:
         return False
-    if not verify_password(password, user["password"]):
+    if not await password_pool.verify(password, user["password"]):
         return False
     return user
 
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
+    issued = datetime.now(pytz.utc)
     if expires_delta:
-        expire = datetime.now(pytz.utc) + expires_delta
+        expire = issued + expires_delta
     else:
-        expire = datetime.now(pytz.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+        expire = issued + timedelta(minutes=15)
+    to_encode.update({"exp": expire, "iat": issued})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -104,8 +141,9 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
 def renew_access_token(data: dict, expires_delta: int | None = None):
     to_encode = data.copy()
 
-    expire = datetime.now(pytz.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    issued = datetime.now(pytz.utc)
+    expire = issued + timedelta(minutes=15)
+    to_encode.update({"exp": expire, "iat": issued})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -115,6 +153,35 @@ def get_token_payload(token: str):
     return payload
 
 
+def get_token_subject(token: str) -> str | None:
+    try:
+        return get_token_payload(token).get("sub")
+    except JWTError:
+        return None
+
+
+async def is_token_revoked(payload: dict) -> bool:
+    # tokens minted before iat was added count as issued at the epoch
+    for revocation_list in revocations.values():
+        if await revocation_list.is_revoked(payload.get("sub"), payload.get("iat", 0)):
+            return True
+    return False
+
+
+async def revoke_user(username: str, is_test: bool):
+    # lookup mode reads the user on every request, so a deleted user or changed password already takes effect
+    if AUTH_MODE != 'stateless':
+        return
+    table_name: str = 'revoked'
+    if is_test:
+        table_name = 'revokedTest'
+    revoked_at = int(time.time())
+    # a record only has to outlive the longest token it can block, after that the table ttl drops it
+    expires = revoked_at + int(timedelta(days=REFRESH_ACCESS_TOKEN_EXPIRE_DAYS).total_seconds())
+    await AsyncDynamo.create_item(table_name, {'name': username, 'revoked_at': revoked_at, 'ttl': expires})
+    revocations[table_name].add(username, revoked_at)
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     table_name = "usersTest"
 
@@ -136,7 +203,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         print('JWTError')
         raise credentials_exception
-    user = get_user(table_name=table_name, username=token_data.username)
+    if AUTH_MODE == 'stateless':
+        if await is_token_revoked(payload):
+            raise credentials_exception
+        return {"name": token_data.username}
+    user = await get_cached_user(table_name=table_name, username=token_data.username)
     if user is None:
         print('user is None')
         raise credentials_exception
@@ -150,3 +221,13 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
     if current_user is None:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+
+async def get_current_admin_user(current_user: User = Depends(get_current_active_user)):
+    # a token whose user is gone resolves to the not found item, which has no name
+    if current_user.get("name") is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials",
+                            headers={"WWW-Authenticate": "Bearer"})
+    if current_user["name"] not in ADMIN_USERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="admin access required")
+    return current_user
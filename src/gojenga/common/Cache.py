@@ -0,0 +1,84 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def approximate_size(value) -> int:
+    """Rough bytes held by a storage item, counting nested dicts and lists."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approximate_size(key) + approximate_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(approximate_size(item) for item in value)
+    return size
+
+
+class TTLCache:
+    """Bounded least-recently-used cache whose entries expire ttl seconds after they were set.
+
+    With max_bytes set, sizeof(value) is charged per entry and the least recently used entries are evicted
+    until the total fits.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, timer=time.monotonic, max_bytes: int | None = None,
+                 sizeof=approximate_size):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.data: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, key):
+        self.bytes -= self.data.pop(key)[2]
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None or entry[0] <= self.timer():
+                if entry is not None:
+                    self._remove(key)
+                    self.expirations += 1
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.data:
+                self._remove(key)
+            self.data[key] = (self.timer() + self.ttl, value, size)
+            self.bytes += size
+            while len(self.data) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self._remove(next(iter(self.data)))
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            if key in self.data:
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'size': len(self.data), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions, 'expirations': self.expirations}
@@ -0,0 +1,217 @@
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections.abc import Callable
+from contextvars import ContextVar
+
+# request and storage latencies in seconds, from a cached read to a slow transaction
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# bcrypt runs for tenths of a second
+BCRYPT_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0)
+EXPOSITION_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.lock = threading.Lock()
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        ...
+
+    def render(self) -> str:
+        return '\n'.join([f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}',
+                          *self.samples()])
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            values = list(self.values.items())
+        return [f'{self.name}{_labels(self.labels, key)} {_number(value)}' for key, value in values]
+
+
+class Gauge(Metric):
+    """A value set by the code, or read from callback at scrape time as {label values: value}."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 callback: Callable[[], dict[tuple, float]] | None = None):
+        super().__init__(name, documentation, labels)
+        self.values: dict[tuple, float] = {}
+        self.callback = callback
+
+    def inc(self, *label_values, amount: float = 1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value: float):
+        with self.lock:
+            self.values[label_values] = value
+
+    def samples(self) -> list[str]:
+        if self.callback is not None:
+            values = list(self.callback().items())
+        else:
+            with self.lock:
+                values = list(self.values.items())
+        return [f'{self.name}{_labels(self.labels, key)} {_number(value)}' for key, value in values]
+
+
+class Histogram(Metric):
+    """Observations counted into fixed buckets. Each label set keeps plain per-bucket counts, and cumulative
+    counts are only worked out at scrape time, so recording is one bisect and three additions."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [count per bucket, sum]
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * len(self.buckets), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self.series.items()]
+        lines: list[str] = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    'gojenga_request_duration_seconds', 'Time to the end of the response by route and status.',
+    ('method', 'route', 'status')))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    'gojenga_requests_in_flight', 'Requests being served.'))
+STORAGE_DURATION = registry.register(Histogram(
+    'gojenga_storage_call_duration_seconds', 'DynamoDB calls by table and operation, retries included.',
+    ('table', 'operation')))
+STORAGE_ERRORS = registry.register(Counter(
+    'gojenga_storage_errors_total', 'DynamoDB calls that raised, by table, operation and error code.',
+    ('table', 'operation', 'code')))
+BCRYPT_DURATION = registry.register(Histogram(
+    'gojenga_bcrypt_duration_seconds', 'Time spent inside bcrypt.', ('operation',), BCRYPT_BUCKETS))
+STORAGE_RETRIES = registry.register(Counter(
+    'gojenga_storage_retries_total', 'DynamoDB calls retried after a throttling or transient error.',
+    ('table', 'operation', 'code')))
+STORAGE_CONSUMED_CAPACITY = registry.register(Counter(
+    'gojenga_storage_consumed_capacity_total', 'DynamoDB capacity units consumed by the route making the call.',
+    ('table', 'operation', 'route')))
+PASSWORD_POOL_WAIT = registry.register(Histogram(
+    'gojenga_password_pool_wait_seconds', 'Time a password hash spent queued or in transit to a pool process.'))
+PASSWORD_POOL_PENDING = registry.register(Gauge(
+    'gojenga_password_pool_pending', 'Password hashes queued or running in the pool.'))
+PASSWORD_POOL_REJECTED = registry.register(Counter(
+    'gojenga_password_pool_rejected_total', 'Password hashes refused because the pool was saturated.'))
+
+
+# scope of the request being served, storage calls made for it run with a copy of the context
+_request_scope: ContextVar[dict | None] = ContextVar('request_scope', default=None)
+
+
+def current_route() -> str:
+    """Route template of the request being served, 'background' outside of one."""
+    scope = _request_scope.get()
+    if scope is None:
+        return 'background'
+    return getattr(scope.get('route'), 'path', 'unmatched')
+
+
+class MetricsMiddleware:
+    """Records REQUEST_DURATION and REQUESTS_IN_FLIGHT for every HTTP request.
+
+    The route label is the matched route template, which FastAPI leaves in the scope, so paths carrying
+    usernames do not create a series each; requests that match no route share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        token = _request_scope.set(scope)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_DURATION.observe(time.perf_counter() - started, scope['method'], current_route(), status)
+            _request_scope.reset(token)
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+from common.Metrics import BCRYPT_DURATION, PASSWORD_POOL_PENDING, PASSWORD_POOL_REJECTED, PASSWORD_POOL_WAIT
+
+logger = logging.getLogger(__name__)
+
+# bcrypt processes per worker, 0 hashes inline on the event loop
+PASSWORD_POOL_WORKERS = int(os.getenv('PASSWORD_POOL_WORKERS', str(os.cpu_count() or 1)))
+# hashes queued or running before new ones are refused
+PASSWORD_POOL_MAX_PENDING = int(os.getenv('PASSWORD_POOL_MAX_PENDING', '64'))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class PasswordPoolSaturated(Exception):
+    """Raised instead of queueing when the pool already has max_pending hashes waiting."""
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _ready() -> bool:
+    return True
+
+
+def _timed(func, *args) -> tuple:
+    # timed where it runs, so time spent waiting for a pool process is not counted as bcrypt
+    started = time.perf_counter()
+    return func(*args), time.perf_counter() - started
+
+
+class PasswordPool:
+    """Runs bcrypt in separate processes so hashing neither blocks the event loop nor holds the GIL."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.executor: ProcessPoolExecutor | None = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # spawn, forking a process that already runs threads can deadlock the child
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return self.executor
+
+    async def start(self):
+        # start every process up front so the first logins do not pay for interpreter start up
+        if self.workers > 0:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            await asyncio.gather(*(loop.run_in_executor(executor, _ready) for _ in range(self.workers)))
+            logger.info(f'password pool started with {self.workers} processes')
+
+    async def _run(self, operation: str, func, *args):
+        if self.workers <= 0:
+            result, seconds = _timed(func, *args)
+            BCRYPT_DURATION.observe(seconds, operation)
+            return result
+        if self.pending >= self.max_pending:
+            PASSWORD_POOL_REJECTED.inc()
+            raise PasswordPoolSaturated(f'{self.pending} password hashes already pending')
+        self.pending += 1
+        PASSWORD_POOL_PENDING.inc()
+        started = time.perf_counter()
+        try:
+            result, seconds = await asyncio.get_running_loop().run_in_executor(self._get_executor(), _timed,
+                                                                               func, *args)
+            BCRYPT_DURATION.observe(seconds, operation)
+            PASSWORD_POOL_WAIT.observe(time.perf_counter() - started - seconds)
+            return result
+        finally:
+            self.pending -= 1
+            PASSWORD_POOL_PENDING.dec()
+
+    async def hash(self, password: str) -> str:
+        return await self._run('hash', hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run('verify', check_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+password_pool = PasswordPool(PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_PENDING)
@@ -0,0 +1,143 @@
+import json
+import math
+import os
+import re
+import time
+
+# 'METHOD /path/{param}=requests/seconds:user|ip' separated by ';', off unless set: behind a load balancer
+# every client shares its ip until RATE_LIMIT_TRUST_FORWARDED_FOR is on
+RATE_LIMITS = os.getenv('RATE_LIMITS', '')
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv('RATE_LIMIT_MAX_BUCKETS', '100000'))
+# only behind a proxy that sets it, otherwise clients pick their own bucket
+RATE_LIMIT_TRUST_FORWARDED_FOR = os.getenv('RATE_LIMIT_TRUST_FORWARDED_FOR', 'false').lower() == 'true'
+
+
+class RateLimitRule:
+    """capacity requests per per_seconds on one route, counted per 'user' (token subject) or per 'ip'."""
+
+    def __init__(self, method: str, path: str, capacity: int, per_seconds: float, key: str = 'ip'):
+        if key not in ('user', 'ip'):
+            raise ValueError(f'rate limit key must be user or ip, got {key}')
+        self.method = method.upper()
+        self.path = path
+        self.capacity = capacity
+        self.per_seconds = per_seconds
+        self.key = key
+        # /account/{username}/transaction -> ^/account/[^/]+/transaction$
+        parts = re.split(r'(\{[^}]+\})', path)
+        self.pattern = re.compile('^' + ''.join('[^/]+' if part.startswith('{') else re.escape(part)
+                                                for part in parts) + '$')
+
+
+def parse_rate_limits(spec: str) -> list[RateLimitRule]:
+    """Parse 'POST /login=10/60:ip;POST /account/{username}/transaction=20/1:user' into rules."""
+    rules: list[RateLimitRule] = []
+    for part in filter(None, (part.strip() for part in spec.split(';'))):
+        route, _, limit = part.rpartition('=')
+        method, _, path = route.strip().partition(' ')
+        rate, _, key = limit.partition(':')
+        capacity, _, per_seconds = rate.partition('/')
+        rules.append(RateLimitRule(method, path.strip(), int(capacity), float(per_seconds or 1), key or 'ip'))
+    return rules
+
+
+class TokenBucketLimiter:
+    """Token buckets for one rule, each stored as a two element [tokens, last_refill] list.
+
+    A bucket idle long enough to have refilled completely is identical to a new one, so sweeps drop those.
+    """
+
+    def __init__(self, capacity: int, per_seconds: float, max_buckets: int = 100000, timer=time.monotonic):
+        self.capacity = float(capacity)
+        self.rate = capacity / per_seconds
+        self.max_buckets = max_buckets
+        self.timer = timer
+        self.buckets: dict[str, list[float]] = {}
+        self.idle_after = per_seconds
+        self.next_sweep = timer() + self.idle_after
+
+    def acquire(self, key: str) -> float:
+        """Take a token, returning 0 when allowed or the seconds until one is available."""
+        now = self.timer()
+        if now >= self.next_sweep or len(self.buckets) >= self.max_buckets:
+            self.sweep(now)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = [self.capacity - 1, now]
+            return 0.0
+        tokens = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate
+
+    def sweep(self, now: float):
+        cutoff = now - self.idle_after
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[1] > cutoff}
+        # still full of active clients, forget the oldest tenth rather than grow without bound
+        while len(self.buckets) >= self.max_buckets * 0.9:
+            del self.buckets[next(iter(self.buckets))]
+        self.next_sweep = now + self.idle_after
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware that answers 429 before anything else in the stack runs.
+
+    identify_user maps a bearer token to its subject, or None when the token is not valid, in which case the
+    request is counted against its ip instead.
+    """
+
+    def __init__(self, app, rules: list[RateLimitRule], identify_user=None, max_buckets: int = 100000,
+                 trust_forwarded_for: bool = False):
+        self.app = app
+        self.identify_user = identify_user
+        self.trust_forwarded_for = trust_forwarded_for
+        self.routes: dict[str, list[tuple[RateLimitRule, TokenBucketLimiter]]] = {}
+        for rule in rules:
+            limiter = TokenBucketLimiter(rule.capacity, rule.per_seconds, max_buckets)
+            self.routes.setdefault(rule.method, []).append((rule, limiter))
+
+    def _client_ip(self, scope) -> str:
+        if self.trust_forwarded_for:
+            for name, value in scope['headers']:
+                if name == b'x-forwarded-for':
+                    return value.decode('latin-1').split(',')[0].strip()
+        client = scope.get('client')
+        return client[0] if client else 'unknown'
+
+    def _user(self, scope) -> str | None:
+        if self.identify_user is None:
+            return None
+        for name, value in scope['headers']:
+            if name == b'authorization':
+                scheme, _, token = value.decode('latin-1').partition(' ')
+                if scheme.lower() == 'bearer' and token:
+                    return self.identify_user(token)
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            rules = self.routes.get(scope['method'])
+            if rules:
+                path = scope['path']
+                for rule, limiter in rules:
+                    if not rule.pattern.match(path):
+                        continue
+                    user = self._user(scope) if rule.key == 'user' else None
+                    key = f'user:{user}' if user else f'ip:{self._client_ip(scope)}'
+                    wait = limiter.acquire(key)
+                    if wait:
+                        await self._reject(send, wait)
+                        return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(send, wait: float):
+        body = json.dumps({'detail': 'rate limit exceeded'}).encode()
+        await send({'type': 'http.response.start', 'status': 429,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode()),
+                                (b'retry-after', str(math.ceil(wait)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,92 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+
+from common.Cache import TTLCache
+from storage.AsyncDynamo import AsyncDynamo
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size set membership with no false negatives and roughly error_rate false positives at capacity."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        # double hashing, k positions out of one 128 bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """Users whose tokens issued at or before a point in time are no longer accepted.
+
+    A Bloom filter rebuilt from the revocation table every refresh_seconds answers the common case without
+    storage. A positive is confirmed against the table itself, so false positives only cost one read.
+    Revocations made by this worker are added immediately; other workers see them after their next refresh.
+    """
+
+    def __init__(self, table_name: str, capacity: int, refresh_seconds: float):
+        self.table_name = table_name
+        self.capacity = capacity
+        self.refresh_seconds = refresh_seconds
+        self.bloom = BloomFilter(capacity)
+        # exact answers for bloom positives, name -> revoked_at or None when the name is not revoked
+        self.confirmed = TTLCache(maxsize=capacity, ttl=refresh_seconds)
+        self.local: dict[str, float] = {}
+
+    def add(self, username: str, revoked_at: int):
+        self.bloom.add(username)
+        self.confirmed.set(username, revoked_at)
+        self.local[username] = time.monotonic()
+
+    async def is_revoked(self, username: str, issued_at: int) -> bool:
+        if username not in self.bloom:
+            return False
+        revoked_at = self.confirmed.get(username, default=-1)
+        if revoked_at == -1:
+            item = await AsyncDynamo.get_item(self.table_name, {'name': username})
+            revoked_at = item.get('revoked_at')
+            self.confirmed.set(username, revoked_at)
+        # revoked_at is whole seconds, tokens from the same second are refused too
+        return revoked_at is not None and revoked_at >= issued_at
+
+    async def refresh(self):
+        now = time.time()
+        items = await AsyncDynamo.scan_items(self.table_name)
+        live = [item['name'] for item in items if item.get('ttl', now + 1) > now]
+        bloom = BloomFilter(max(self.capacity, 2 * len(live)))
+        for name in live:
+            bloom.add(name)
+        # keep local revocations the scan may have raced with
+        cutoff = time.monotonic() - 2 * self.refresh_seconds
+        self.local = {name: added for name, added in self.local.items() if added > cutoff}
+        for name in self.local:
+            bloom.add(name)
+        self.bloom = bloom
+        self.confirmed.clear()
+        logger.info(f'revocation list refreshed with {len(live)} entries from {self.table_name}')
+
+    async def refresh_forever(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f'revocation refresh failed {e}')
+            await asyncio.sleep(self.refresh_seconds)
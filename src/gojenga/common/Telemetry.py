@@ -0,0 +1,143 @@
+import logging
+import os
+from contextlib import nullcontext
+from typing import Optional, Sequence
+
+from opentelemetry import trace
+from opentelemetry.context import Context
+from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+from opentelemetry.sdk.trace import SpanLimits, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter
+from opentelemetry.sdk.trace.sampling import Decision, ParentBased, Sampler, SamplingResult, TraceIdRatioBased
+from opentelemetry.trace import Link, SpanKind
+from opentelemetry.trace.span import TraceState
+from opentelemetry.util.types import Attributes
+
+logger = logging.getLogger(__name__)
+
+# jaeger (agent from OTEL_EXPORTER_JAEGER_AGENT_HOST/PORT), otlp (OTEL_EXPORTER_OTLP_ENDPOINT), console or none
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'jaeger')
+# share of new traces recorded; traces continued from a caller follow the caller's decision
+TRACE_SAMPLE_RATIO = float(os.getenv('TRACE_SAMPLE_RATIO', '1.0'))
+# per route ratios, e.g. '/hello=0;/account/{username}/transaction=1', matched on the route template
+TRACE_SAMPLE_OVERRIDES = os.getenv('TRACE_SAMPLE_OVERRIDES', '')
+# false keeps only the request span the FastAPI instrumentation opens, not the route, handler and storage
+# spans below it
+TRACE_NESTED_SPANS = os.getenv('TRACE_NESTED_SPANS', 'true').lower() == 'true'
+TRACE_MAX_ATTRIBUTES = int(os.getenv('TRACE_MAX_ATTRIBUTES', '32'))
+TRACE_MAX_ATTRIBUTE_LENGTH = int(os.getenv('TRACE_MAX_ATTRIBUTE_LENGTH', '256'))
+
+
+def parse_sample_overrides(spec: str) -> dict[str, float]:
+    """Parse '/hello=0;/login=0.1' into route -> ratio."""
+    overrides: dict[str, float] = {}
+    for part in filter(None, (part.strip() for part in spec.split(';'))):
+        route, _, ratio = part.rpartition('=')
+        overrides[route.strip()] = float(ratio)
+    return overrides
+
+
+class RouteRatioSampler(Sampler):
+    """Ratio sampling of root spans by name. The FastAPI instrumentation names the request span after the
+    route template, so overrides are keyed by routes such as '/account/{username}'."""
+
+    def __init__(self, ratio: float, overrides: dict[str, float]):
+        self.default = TraceIdRatioBased(ratio)
+        self.overrides = {route: TraceIdRatioBased(rate) for route, rate in overrides.items()}
+
+    def should_sample(self, parent_context: Optional[Context], trace_id: int, name: str,
+                      kind: Optional[SpanKind] = None, attributes: Attributes = None,
+                      links: Optional[Sequence[Link]] = None,
+                      trace_state: Optional[TraceState] = None) -> SamplingResult:
+        return self.overrides.get(name, self.default).should_sample(parent_context, trace_id, name, kind,
+                                                                    attributes, links, trace_state)
+
+    def get_description(self) -> str:
+        return f'RouteRatioSampler{{{self.default.rate},{len(self.overrides)} overrides}}'
+
+
+class LocalRootSampler(Sampler):
+    """Drops every span whose parent was started in this process, leaving one span per request."""
+
+    def __init__(self, delegate: Sampler):
+        self.delegate = delegate
+
+    def should_sample(self, parent_context: Optional[Context], trace_id: int, name: str,
+                      kind: Optional[SpanKind] = None, attributes: Attributes = None,
+                      links: Optional[Sequence[Link]] = None,
+                      trace_state: Optional[TraceState] = None) -> SamplingResult:
+        parent = trace.get_current_span(parent_context).get_span_context()
+        if parent.is_valid and not parent.is_remote:
+            return SamplingResult(Decision.DROP, None, parent.trace_state)
+        return self.delegate.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+
+    def get_description(self) -> str:
+        return f'LocalRootSampler{{{self.delegate.get_description()}}}'
+
+
+class SpanSkippingTracer:
+    """Tracer for the route, handler and storage spans. Where the sampler would only drop a span, because
+    its parent is not recorded or nested spans are off, it skips creating one and keeps the parent current."""
+
+    def __init__(self, name: str):
+        self.tracer = trace.get_tracer(name)
+
+    def start_as_current_span(self, name: str, context: Optional[Context] = None, **kwargs):
+        parent = trace.get_current_span(context)
+        parent_context = parent.get_span_context()
+        if (parent_context.is_valid and not parent_context.is_remote
+                and (not TRACE_NESTED_SPANS or not parent.is_recording())):
+            return nullcontext(parent)
+        return self.tracer.start_as_current_span(name, context=context, **kwargs)
+
+
+def get_tracer(name: str) -> SpanSkippingTracer:
+    return SpanSkippingTracer(name)
+
+
+def build_sampler(ratio: float, overrides: dict[str, float], nested_spans: bool) -> Sampler:
+    sampler: Sampler = ParentBased(RouteRatioSampler(ratio, overrides))
+    return sampler if nested_spans else LocalRootSampler(sampler)
+
+
+def span_exporter(kind: str) -> SpanExporter | None:
+    if kind == 'jaeger':
+        from opentelemetry.exporter.jaeger.thrift import JaegerExporter
+        return JaegerExporter()
+    if kind == 'otlp':
+        # optional, install opentelemetry-exporter-otlp-proto-http to use it
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if kind == 'console':
+        return ConsoleSpanExporter()
+    if kind == 'none':
+        return None
+    raise ValueError(f'unknown TRACE_EXPORTER {kind}, use jaeger, otlp, console or none')
+
+
+_configured = False
+
+
+def configure_tracing(exporter: SpanExporter | None = None) -> None:
+    """Install the tracer provider described by the TRACE_* settings, once per process.
+
+    With no exporter (TRACE_EXPORTER=none) the API's no-op provider stays in place and spans cost next to
+    nothing. exporter replaces the configured one, e.g. for benchmarks.
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    exporter = exporter or span_exporter(TRACE_EXPORTER)
+    if exporter is None:
+        logger.info('tracing disabled')
+        return
+    provider = TracerProvider(
+        resource=Resource.create({SERVICE_NAME: "gojenga"}),
+        sampler=build_sampler(TRACE_SAMPLE_RATIO, parse_sample_overrides(TRACE_SAMPLE_OVERRIDES),
+                              TRACE_NESTED_SPANS),
+        span_limits=SpanLimits(max_span_attributes=TRACE_MAX_ATTRIBUTES,
+                               max_span_attribute_length=TRACE_MAX_ATTRIBUTE_LENGTH))
+    # queue size, batch size and delay come from the OTEL_BSP_* variables
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from storage.Storage import portfolio_as_map
+
+logger = logging.getLogger(__name__)
+
+# JSON object of coin id -> price, empty uses the built in stand-in prices
+PRICE_TABLE_PATH = os.getenv('PRICE_TABLE_PATH', '')
+PRICE_TABLE_TTL_SECONDS = float(os.getenv('PRICE_TABLE_TTL_SECONDS', '60'))
+
+# local stand-in for a price feed, used when no price file is configured
+STAND_IN_PRICES = {
+    'bitcoin': 27000.0,
+    'ethereum': 1800.0,
+    'litecoin': 90.0,
+    'dogecoin': 0.07,
+    'cardano': 0.35,
+    'solana': 21.0,
+    'ripple': 0.5,
+    'polkadot': 5.3,
+}
+
+
+class Prices:
+    """One loaded price table: coin ids mapped to positions in a float64 price vector.
+
+    The vector has one extra trailing 0 that unknown coins point at, so lookups never need a branch.
+    """
+
+    def __init__(self, prices: dict[str, float], loaded_at: float):
+        self.ids: dict[str, int] = {coin_id: i for i, coin_id in enumerate(prices)}
+        self.vector = np.zeros(len(prices) + 1, dtype=np.float64)
+        self.vector[:len(prices)] = np.fromiter(prices.values(), dtype=np.float64, count=len(prices))
+        self.unknown = len(prices)
+        self.loaded_at = loaded_at
+
+    def index(self, coin_ids) -> np.ndarray:
+        ids, unknown = self.ids, self.unknown
+        return np.fromiter((ids.get(coin_id, unknown) for coin_id in coin_ids), dtype=np.intp)
+
+
+class PriceTable:
+    """Prices loaded from path (or the stand-in feed) and reloaded once they are ttl seconds old."""
+
+    def __init__(self, path: str = '', ttl: float = 60.0, timer=time.monotonic):
+        self.path = path
+        self.ttl = ttl
+        self.timer = timer
+        self.lock = threading.Lock()
+        self.current: Prices | None = None
+
+    def _load(self) -> dict[str, float]:
+        if not self.path:
+            return dict(STAND_IN_PRICES)
+        with open(self.path) as f:
+            return {coin_id: float(price) for coin_id, price in json.load(f).items()}
+
+    def get(self) -> Prices:
+        current = self.current
+        if current is not None and self.timer() - current.loaded_at < self.ttl:
+            return current
+        with self.lock:
+            if self.current is None or self.timer() - self.current.loaded_at >= self.ttl:
+                try:
+                    self.current = Prices(self._load(), self.timer())
+                except (OSError, ValueError) as e:
+                    # keep serving the last good table rather than failing every valuation
+                    if self.current is None:
+                        raise
+                    logger.error(f'error reloading prices from {self.path} {e}')
+                    self.current.loaded_at = self.timer()
+            return self.current
+
+
+class Holdings:
+    """Holdings of many portfolios as flat columns: owner index, price index and amount per holding.
+
+    Price indexes point into the Prices the holdings were built with, value them against that same table.
+    """
+
+    def __init__(self, names: list[str], owners: np.ndarray, coins: np.ndarray, amounts: np.ndarray):
+        self.names = names
+        self.owners = owners
+        self.coins = coins
+        self.amounts = amounts
+
+    @staticmethod
+    def from_items(items, prices: Prices) -> 'Holdings':
+        names: list[str] = []
+        counts: list[int] = []
+        coin_ids: list[str] = []
+        amounts: list = []
+        for item in items:
+            holdings = portfolio_as_map(item.get('portfolio'))
+            names.append(item['name'])
+            counts.append(len(holdings))
+            coin_ids.extend(holdings)
+            amounts.extend(holding['amount'] for holding in holdings.values())
+        owners = np.repeat(np.arange(len(names), dtype=np.intp), counts)
+        return Holdings(names, owners, prices.index(coin_ids),
+                        np.fromiter(amounts, dtype=np.float64, count=len(amounts)))
+
+
+def value_holdings(holdings: Holdings, prices: Prices) -> np.ndarray:
+    """Value of every portfolio in holdings.names order. Coins without a price count as 0."""
+    return np.bincount(holdings.owners, weights=holdings.amounts * prices.vector[holdings.coins],
+                       minlength=len(holdings.names))
+
+
+price_table = PriceTable(PRICE_TABLE_PATH, PRICE_TABLE_TTL_SECONDS)
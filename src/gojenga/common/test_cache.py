@@ -0,0 +1,92 @@
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+
+from common import Auth
+from common.Cache import TTLCache
+from handlers.read_cache import read_cache
+from handlers.user_handler import UserHandler
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_expiry(self):
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=5, timer=clock)
+        cache.set('kovax', 1)
+        clock.now = 4.9
+        assert cache.get('kovax') == 1
+        clock.now = 5.0
+        assert cache.get('kovax') is None
+        assert cache.stats() == {'size': 0, 'bytes': 0, 'hits': 1, 'misses': 1, 'hit_ratio': 0.5,
+                                 'evictions': 0, 'expirations': 1}
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1 and cache.get('c') == 3
+
+    def test_evicts_to_fit_max_bytes(self):
+        cache = TTLCache(maxsize=10, ttl=60, max_bytes=10, sizeof=len)
+        cache.set('a', 'xxxx')
+        cache.set('b', 'xxxx')
+        cache.set('c', 'xxxx')
+        assert cache.get('a') is None
+        assert cache.get('b') == 'xxxx' and cache.get('c') == 'xxxx'
+        cache.set('d', 'x' * 11)
+        assert cache.get('d') is None
+        assert cache.stats()['bytes'] == 8 and cache.stats()['evictions'] == 1
+
+    def test_invalidate(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.invalidate('a')
+        cache.invalidate('missing')
+        assert cache.get('a') is None
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = Memory()
+        set_storage(self.storage)
+        Auth.user_cache.clear()
+        read_cache.clear()
+        self.storage.create_item('usersTest', {'name': 'kovax', 'password': '5182'})
+
+    async def test_lookups_are_cached_until_user_changes(self):
+        assert (await Auth.get_cached_user('usersTest', 'kovax'))['password'] == '5182'
+        self.storage.update_user_password('usersTest', {'name': 'kovax', 'password': 'stale'})
+        assert (await Auth.get_cached_user('usersTest', 'kovax'))['password'] == '5182'
+
+        await UserHandler.handle_update_user('kovax', '0000', True)
+        assert (await Auth.get_cached_user('usersTest', 'kovax'))['password'] == '0000'
+
+        await UserHandler.handle_delete_user('kovax', True)
+        assert await Auth.get_cached_user('usersTest', 'kovax') == {'message': 'item not found'}
+
+    async def test_admin_check_refuses_a_user_that_is_gone(self):
+        with mock.patch.object(Auth, 'ADMIN_USERS', frozenset({'kovax'})):
+            user = await Auth.get_current_user(Auth.create_access_token({'sub': 'kovax'}))
+            assert await Auth.get_current_admin_user(user) == user
+            ghost = await Auth.get_current_user(Auth.create_access_token({'sub': 'ghost'}))
+            with self.assertRaises(HTTPException) as refused:
+                await Auth.get_current_admin_user(ghost)
+            assert refused.exception.status_code == 401
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+from botocore.exceptions import ClientError
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from common.Metrics import Counter, Gauge, Histogram, MetricsMiddleware, Registry, REQUEST_DURATION, \
+    REQUESTS_IN_FLIGHT
+from storage.Dynamo import error_code
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(value, '/account/{username}')
+        lines = histogram.samples()
+        assert 'latency_seconds_bucket{route="/account/{username}",le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{route="/account/{username}",le="1.0"} 3' in lines
+        assert 'latency_seconds_bucket{route="/account/{username}",le="+Inf"} 4' in lines
+        assert 'latency_seconds_sum{route="/account/{username}"} 4.05' in lines
+        assert 'latency_seconds_count{route="/account/{username}"} 4' in lines
+
+    def test_render(self):
+        registry = Registry()
+        errors = registry.register(Counter('errors_total', 'Errors.', ('table', 'code')))
+        errors.inc('ledger', 'Throttling"Exception')
+        errors.inc('ledger', 'Throttling"Exception')
+        registry.register(Gauge('hit_ratio', 'Hit ratio.', ('cache',), callback=lambda: {('users',): 0.75}))
+        assert registry.render() == ('# HELP errors_total Errors.\n# TYPE errors_total counter\n'
+                                     'errors_total{table="ledger",code="Throttling\\"Exception"} 2\n'
+                                     '# HELP hit_ratio Hit ratio.\n# TYPE hit_ratio gauge\n'
+                                     'hit_ratio{cache="users"} 0.75\n')
+
+    def test_error_code_follows_the_raising_chain(self):
+        throttled = ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': ''}},
+                                'GetItem')
+        try:
+            try:
+                raise throttled
+            except ClientError:
+                raise Exception('dynamo error')
+        except Exception as e:
+            assert error_code(e) == 'ProvisionedThroughputExceededException'
+        assert error_code(ValueError('bad')) == 'ValueError'
+
+
+class TestMetricsMiddleware(unittest.TestCase):
+    def setUp(self):
+        app = FastAPI()
+
+        @app.get('/account/{username}')
+        async def account(username: str):
+            if username == 'missing':
+                raise HTTPException(status_code=404)
+            return {'response': username}
+
+        app.add_middleware(MetricsMiddleware)
+        self.client = TestClient(app)
+
+    def count(self, method: str, route: str, status: int) -> int:
+        series = REQUEST_DURATION.series.get((method, route, status))
+        return sum(series[0]) if series else 0
+
+    def test_labels_by_route_template_and_status(self):
+        before = (self.count('GET', '/account/{username}', 200), self.count('GET', '/account/{username}', 404),
+                  self.count('GET', 'unmatched', 404))
+        self.client.get('/account/kovax')
+        self.client.get('/account/david')
+        self.client.get('/account/missing')
+        self.client.get('/nowhere')
+        assert self.count('GET', '/account/{username}', 200) == before[0] + 2
+        assert self.count('GET', '/account/{username}', 404) == before[1] + 1
+        assert self.count('GET', 'unmatched', 404) == before[2] + 1
+        assert REQUESTS_IN_FLIGHT.values[()] == 0
+
+
+if __name__ == '__main__':
+    unittest.main()
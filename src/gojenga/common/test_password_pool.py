@@ -0,0 +1,31 @@
+import asyncio
+import unittest
+
+from common.PasswordPool import PasswordPool, PasswordPoolSaturated
+
+
+class TestPasswordPool(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.pool = PasswordPool(workers=1, max_pending=2)
+        await self.pool.start()
+
+    async def asyncTearDown(self):
+        self.pool.shutdown()
+
+    async def test_hash_and_verify(self):
+        hashed = await self.pool.hash('5182')
+        assert await self.pool.verify('5182', hashed)
+        assert not await self.pool.verify('0000', hashed)
+
+    async def test_refuses_beyond_max_pending(self):
+        results = await asyncio.gather(*(self.pool.hash('5182') for _ in range(3)), return_exceptions=True)
+        assert sum(isinstance(result, PasswordPoolSaturated) for result in results) == 1
+        assert self.pool.pending == 0
+
+    async def test_inline_when_no_workers(self):
+        inline = PasswordPool(workers=0, max_pending=0)
+        assert await inline.verify('5182', await inline.hash('5182'))
+
+
+if __name__ == '__main__':
+    unittest.main()
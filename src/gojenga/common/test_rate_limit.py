@@ -0,0 +1,77 @@
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from common.RateLimit import RateLimitMiddleware, TokenBucketLimiter, parse_rate_limits
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucketLimiter(unittest.TestCase):
+    def test_burst_then_refill(self):
+        clock = FakeClock()
+        limiter = TokenBucketLimiter(capacity=2, per_seconds=1, timer=clock)
+        assert limiter.acquire('kovax') == 0
+        assert limiter.acquire('kovax') == 0
+        assert limiter.acquire('kovax') == 0.5
+        assert limiter.acquire('david') == 0
+        clock.now = 0.5
+        assert limiter.acquire('kovax') == 0
+
+    def test_idle_buckets_are_evicted(self):
+        clock = FakeClock()
+        limiter = TokenBucketLimiter(capacity=5, per_seconds=10, timer=clock)
+        limiter.acquire('kovax')
+        clock.now = 6
+        limiter.acquire('david')
+        clock.now = 11
+        limiter.acquire('david')
+        assert list(limiter.buckets) == ['david']
+
+    def test_bucket_count_is_bounded(self):
+        limiter = TokenBucketLimiter(capacity=5, per_seconds=10, max_buckets=10)
+        for i in range(100):
+            limiter.acquire(f'client{i}')
+        assert len(limiter.buckets) <= 10
+
+
+class TestRateLimitMiddleware(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+        app = FastAPI()
+
+        @app.post('/account/{username}/transaction')
+        async def transaction(username: str):
+            self.calls += 1
+            return {'response': 'update item success'}
+
+        rules = parse_rate_limits('POST /account/{username}/transaction=2/60:user')
+        app.add_middleware(RateLimitMiddleware, rules=rules, identify_user=lambda token: token.removeprefix('valid-'))
+        self.client = TestClient(app)
+
+    def test_rejects_before_the_route_runs(self):
+        headers = {'Authorization': 'Bearer valid-kovax'}
+        assert self.client.post('/account/kovax/transaction', headers=headers).status_code == 200
+        assert self.client.post('/account/kovax/transaction', headers=headers).status_code == 200
+        rejected = self.client.post('/account/kovax/transaction', headers=headers)
+        assert rejected.status_code == 429
+        assert rejected.headers['retry-after'] == '30'
+        assert self.calls == 2
+
+        other = self.client.post('/account/david/transaction', headers={'Authorization': 'Bearer valid-david'})
+        assert other.status_code == 200
+
+    def test_other_routes_are_not_limited(self):
+        for _ in range(5):
+            assert self.client.get('/account/kovax/transaction').status_code == 405
+
+
+if __name__ == '__main__':
+    unittest.main()
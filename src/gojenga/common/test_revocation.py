@@ -0,0 +1,84 @@
+import time
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+
+from common import Auth
+from common.Revocation import BloomFilter, RevocationList
+from handlers.user_handler import UserHandler
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000)
+        names = [f'user{i}' for i in range(1000)]
+        for name in names:
+            bloom.add(name)
+        assert all(name in bloom for name in names)
+        false_positives = sum(f'other{i}' in bloom for i in range(10000))
+        assert false_positives < 300, false_positives
+
+
+class TestStatelessAuth(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = Memory()
+        set_storage(self.storage)
+        self.revocations = RevocationList('revokedTest', capacity=100, refresh_seconds=30)
+        self.live_revocations = RevocationList('revoked', capacity=100, refresh_seconds=30)
+        patches = [mock.patch.object(Auth, 'AUTH_MODE', 'stateless'),
+                   mock.patch.object(Auth, 'revocations', {'revoked': self.live_revocations,
+                                                           'revokedTest': self.revocations})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_verified_token_needs_no_user_read(self):
+        token = Auth.create_access_token({'sub': 'kovax'})
+        assert await Auth.get_current_user(token) == {'name': 'kovax'}
+        assert self.storage.tables == {}
+
+    async def test_deleted_user_token_is_refused(self):
+        token = Auth.create_access_token({'sub': 'zala'})
+        await UserHandler.handle_delete_user('zala', True)
+        with self.assertRaises(HTTPException) as refused:
+            await Auth.get_current_user(token)
+        assert refused.exception.status_code == 401
+
+    async def test_non_test_revocation_is_honoured(self):
+        token = Auth.create_access_token({'sub': 'zala'})
+        await UserHandler.handle_delete_user('zala', False)
+        assert 'zala' in self.storage.tables['revoked']
+        with self.assertRaises(HTTPException):
+            await Auth.get_current_user(token)
+
+        # another worker only learns of it from the revoked table
+        other = RevocationList('revoked', capacity=100, refresh_seconds=30)
+        with mock.patch.dict(Auth.revocations, {'revoked': other}):
+            assert await Auth.get_current_user(token) == {'name': 'zala'}
+            await other.refresh()
+            with self.assertRaises(HTTPException):
+                await Auth.get_current_user(token)
+
+    async def test_refresh_picks_up_other_workers_revocations(self):
+        now = int(time.time())
+        self.storage.create_item('revokedTest', {'name': 'david', 'revoked_at': now, 'ttl': now + 60})
+        self.storage.create_item('revokedTest', {'name': 'allie', 'revoked_at': now - 120, 'ttl': now - 60})
+        token = Auth.create_access_token({'sub': 'david'})
+        assert await Auth.get_current_user(token) == {'name': 'david'}
+
+        await self.revocations.refresh()
+        with self.assertRaises(HTTPException):
+            await Auth.get_current_user(token)
+        assert 'allie' not in self.revocations.bloom
+
+    async def test_tokens_issued_after_revocation_are_accepted(self):
+        self.revocations.add('kovax', int(time.time()) - 5)
+        token = Auth.create_access_token({'sub': 'kovax'})
+        assert await Auth.get_current_user(token) == {'name': 'kovax'}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import unittest.mock
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace import SpanLimits, TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags
+
+from common import Telemetry
+from common.Telemetry import build_sampler, parse_sample_overrides, SpanSkippingTracer
+
+
+def recorder(sampler, span_limits=None):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider(sampler=sampler, span_limits=span_limits)
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    return provider.get_tracer(__name__), exporter
+
+
+class TestTelemetry(unittest.TestCase):
+    def test_parse_sample_overrides(self):
+        assert parse_sample_overrides('/hello=0; /account/{username}/transaction=1;;') == {
+            '/hello': 0.0, '/account/{username}/transaction': 1.0}
+
+    def test_route_overrides(self):
+        tracer, exporter = recorder(build_sampler(1.0, {'/hello': 0.0}, nested_spans=True))
+        for name in ('/hello', '/account/{username}'):
+            with tracer.start_as_current_span(name):
+                with tracer.start_as_current_span('handle_get_account'):
+                    pass
+        assert [span.name for span in exporter.get_finished_spans()] == ['handle_get_account', '/account/{username}']
+
+    def test_nested_spans_off_keeps_the_request_span(self):
+        tracer, exporter = recorder(build_sampler(1.0, {}, nested_spans=False))
+        with tracer.start_as_current_span('/account/{username}'):
+            with tracer.start_as_current_span('get_account'):
+                with tracer.start_as_current_span('get_item'):
+                    pass
+        assert [span.name for span in exporter.get_finished_spans()] == ['/account/{username}']
+
+    def test_remote_parent_decides(self):
+        tracer, exporter = recorder(build_sampler(0.0, {}, nested_spans=False))
+        for flags in (TraceFlags.SAMPLED, TraceFlags.DEFAULT):
+            parent = SpanContext(trace_id=1, span_id=2, is_remote=True, trace_flags=TraceFlags(flags))
+            context = trace.set_span_in_context(NonRecordingSpan(parent))
+            with tracer.start_as_current_span(f'/hello {flags}', context=context):
+                pass
+        assert [span.name for span in exporter.get_finished_spans()] == [f'/hello {TraceFlags.SAMPLED}']
+
+    def test_attributes_are_bounded(self):
+        tracer, exporter = recorder(build_sampler(1.0, {}, nested_spans=True),
+                                    SpanLimits(max_span_attributes=2, max_span_attribute_length=4))
+        with tracer.start_as_current_span('/hello', attributes={'a': 'abcdefgh'}):
+            pass
+        with tracer.start_as_current_span('/hello', attributes={'a': 0, 'b': 1, 'c': 2}):
+            pass
+        first, second = exporter.get_finished_spans()
+        assert dict(first.attributes) == {'a': 'abcd'}
+        assert len(second.attributes) == 2
+
+    def test_skipping_tracer(self):
+        tracer, exporter = recorder(build_sampler(0.0, {}, nested_spans=True))
+        skipping = SpanSkippingTracer(__name__)
+        skipping.tracer = tracer
+        with tracer.start_as_current_span('/hello') as request_span:
+            # the request was not sampled, nested spans are not even created
+            with skipping.start_as_current_span('handle_hello') as span:
+                assert span is request_span
+        with skipping.start_as_current_span('refresh') as span:
+            assert span is not request_span
+        assert exporter.get_finished_spans() == ()
+
+    def test_skipping_tracer_nested_spans_off(self):
+        tracer, exporter = recorder(build_sampler(1.0, {}, nested_spans=True))
+        skipping = SpanSkippingTracer(__name__)
+        skipping.tracer = tracer
+        with unittest.mock.patch.object(Telemetry, 'TRACE_NESTED_SPANS', False):
+            with tracer.start_as_current_span('/hello'):
+                with skipping.start_as_current_span('handle_hello'):
+                    pass
+        assert [span.name for span in exporter.get_finished_spans()] == ['/hello']
+
+
+if __name__ == '__main__':
+    unittest.main()
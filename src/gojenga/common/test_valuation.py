@@ -0,0 +1,69 @@
+import json
+import tempfile
+import unittest
+from decimal import Decimal
+
+from common.Valuation import Holdings, PriceTable, value_holdings
+from handlers.portfolio_handler import PortfolioHandler
+from handlers.read_cache import read_cache
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestValuation(unittest.TestCase):
+    def setUp(self):
+        self.file = tempfile.NamedTemporaryFile('w', suffix='.json')
+        self.write_prices({'bitcoin': 100, 'litecoin': 2.5})
+
+    def tearDown(self):
+        self.file.close()
+
+    def write_prices(self, prices: dict):
+        self.file.seek(0)
+        self.file.truncate()
+        json.dump(prices, self.file)
+        self.file.flush()
+
+    def test_values_every_portfolio(self):
+        prices = PriceTable(self.file.name).get()
+        items = [{'name': 'kovax', 'portfolio': {'bitcoin': {'id': 'bitcoin', 'amount': Decimal('1.5')},
+                                                 'unlisted': {'id': 'unlisted', 'amount': Decimal('9')}}},
+                 {'name': 'david', 'portfolio': []},
+                 {'name': 'zala', 'portfolio': [{'id': 'litecoin', 'amount': 4}, {'id': 'bitcoin', 'amount': 1}]}]
+        holdings = Holdings.from_items(items, prices)
+        assert holdings.names == ['kovax', 'david', 'zala']
+        assert value_holdings(holdings, prices).tolist() == [150.0, 0.0, 110.0]
+
+    def test_prices_reload_after_ttl(self):
+        clock = FakeClock()
+        table = PriceTable(self.file.name, ttl=60, timer=clock)
+        assert table.get().vector[0] == 100
+        self.write_prices({'bitcoin': 200})
+        clock.now = 59
+        assert table.get().vector[0] == 100
+        clock.now = 60
+        assert table.get().vector[0] == 200
+
+
+class TestPortfolioValue(unittest.IsolatedAsyncioTestCase):
+    async def test_value_endpoint_handler(self):
+        storage = Memory()
+        set_storage(storage)
+        read_cache.clear()
+        storage.create_item('portfolioTest', {'name': 'kovax', 'portfolio': {
+            'litecoin': {'name': 'litecoin', 'amount': Decimal('2'), 'id': 'litecoin'}}})
+        value = await PortfolioHandler.handle_get_portfolio_value('kovax', True)
+        assert value['name'] == 'kovax' and value['holdings'][0]['id'] == 'litecoin'
+        assert value['value'] == value['holdings'][0]['value'] == 2 * value['holdings'][0]['price']
+
+
+if __name__ == '__main__':
+    unittest.main()
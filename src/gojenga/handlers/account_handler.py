@@ -1,16 +1,36 @@
+import asyncio
 import logging
-from decimal import *
+import os
+from collections import defaultdict
+from contextlib import AsyncExitStack
+from decimal import Decimal
 from opentelemetry import trace
 
-from storage.Dynamo import Dynamo
+from common.Telemetry import get_tracer
+from handlers.idempotency import IdempotentRequest
+from handlers.ledger_log import log_entry, log_table, rebuild_balance, DEPOSIT, TRANSFER, SET
+from handlers.read_cache import read_cache
+from handlers.sharded_balance import SHARDED_ACCOUNTS, SHARD_WRITE_ATTEMPTS, shard_names, merge_shards, \
+    read_shards, ensure_shards, balance_increments
+from models.Transaction import Transaction
+from storage.AsyncDynamo import AsyncDynamo
+from storage.Storage import Put, TransactionCancelled, NOT_FOUND, BELOW_MINIMUM, ALREADY_EXISTS, \
+    MAX_TRANSACT_ITEMS
 
 logger = logging.getLogger(__name__)
-tracer = trace.get_tracer(__name__)
+tracer = get_tracer(__name__)
+
+# largest list accepted by the batch transaction endpoint
+MAX_BATCH_TRANSACTIONS = int(os.getenv('MAX_BATCH_TRANSACTIONS', '10000'))
+# transactional groups of one batch written at the same time
+BATCH_TRANSACTION_CONCURRENCY = int(os.getenv('BATCH_TRANSACTION_CONCURRENCY', '8'))
+# largest page of the history endpoint
+MAX_HISTORY_PAGE = int(os.getenv('MAX_HISTORY_PAGE', '1000'))
 
 
 class AccountHandler:
     @staticmethod
-    def handle_get_account(username: str, is_test: bool) -> dict:
+    async def handle_get_account(username: str, is_test: bool) -> dict:
         with tracer.start_as_current_span(
                 "handle_get_account",
                 attributes={'attr.username': username, 'attr.is_test': is_test},
@@ -20,14 +40,77 @@ class AccountHandler:
             if is_test:
                 table_name = 'ledgerTest'
             try:
-                user = Dynamo.get_item(table_name, {'name': username})
+                if username in SHARDED_ACCOUNTS:
+                    return merge_shards(username, await read_cache.get_items(table_name, shard_names(username)))
+                user = await read_cache.get_item(table_name, username)
                 return user
             except Exception as e:
                 logger.info(f'error {e}')
                 raise ValueError(e)
 
     @staticmethod
-    def handle_create_account(username: str, balance: Decimal, is_test: bool) -> str:
+    async def handle_get_accounts(usernames: list[str], is_test: bool) -> dict:
+        with tracer.start_as_current_span(
+                "handle_get_accounts",
+                attributes={'attr.usernames': len(usernames), 'attr.is_test': is_test},
+                kind=trace.SpanKind.SERVER
+        ):
+            table_name: str = 'ledger'
+            if is_test:
+                table_name = 'ledgerTest'
+            try:
+                # sharded accounts are read as all their shards and summed
+                items = await read_cache.get_items(table_name, [shard for name in usernames
+                                                                for shard in shard_names(name)])
+                accounts = {name: merge_shards(name, items) for name in usernames}
+                return accounts
+            except Exception as e:
+                logger.info(f'error {e}')
+                raise ValueError(e)
+
+    @staticmethod
+    def _set_balance(table_name: str, username: str, balance: Decimal, is_test: bool) -> list[Put]:
+        # the whole balance goes on the account's own item, its other shards start from zero
+        return [Put(table_name, {'name': shard, 'balance': balance if shard == username else Decimal('0')})
+                for shard in shard_names(username)] + [log_entry(is_test, username, SET, balance=balance)]
+
+    @staticmethod
+    async def _transact_balances(table_name: str, moves: list[tuple[str, Decimal, Decimal | None]],
+                                 extra: list[Put], credits: dict[str, Decimal] | None = None) -> None:
+        """Move each (name, amount, minimum) and write extra, all in one transaction. credits are added to
+        the moves of their names after the minimum is checked.
+
+        Debits of sharded accounts are planned from their shard balances and planned again from fresh reads
+        when a shard had moved or was missing. A cancellation carries one reason per move, then those of extra.
+        """
+        credits = credits or {}
+        attempts = SHARD_WRITE_ATTEMPTS if any(name in SHARDED_ACCOUNTS for name, _, _ in moves) else 1
+        for attempt in range(attempts):
+            plans = [await balance_increments(table_name, name, amount, minimum, credits.get(name, Decimal('0')))
+                     for name, amount, minimum in moves]
+            try:
+                await AsyncDynamo.transact_write([increment for plan in plans for increment in plan] + extra)
+                return
+            except TransactionCancelled as e:
+                reasons: list[str | None] = []
+                position = 0
+                for plan in plans:
+                    reasons.append(next(filter(None, e.reasons[position:position + len(plan)]), None))
+                    position += len(plan)
+                reasons += e.reasons[position:]
+            retry = False
+            if attempt + 1 < attempts and not any(reasons[len(moves):]):
+                for (name, _, _), reason in zip(moves, reasons):
+                    if name in SHARDED_ACCOUNTS and reason == BELOW_MINIMUM:
+                        retry = True
+                    elif name in SHARDED_ACCOUNTS and reason == NOT_FOUND:
+                        # shards are created on first use after an account is made sharded
+                        retry = await ensure_shards(table_name, name) or retry
+            if not retry:
+                raise TransactionCancelled(reasons)
+
+    @staticmethod
+    async def handle_create_account(username: str, balance: Decimal, is_test: bool) -> str:
         with tracer.start_as_current_span(
                 "handle_create_user",
                 attributes={'username': username, 'attr.is_test': is_test}
@@ -36,15 +119,15 @@ class AccountHandler:
             if is_test:
                 table_name = 'ledgerTest'
             try:
-                resp = Dynamo.create_item(table_name, {'name': username,
-                                                       'balance': balance})
-                return resp
+                await AsyncDynamo.transact_write(AccountHandler._set_balance(table_name, username, balance, is_test))
+                read_cache.invalidate(table_name, *shard_names(username))
+                return 'insert item succeeded'
             except Exception as e:
                 logger.info(f'error {e}')
                 raise ValueError(e)
 
     @staticmethod
-    def handle_update_account(username: str, balance: Decimal, is_test: bool) -> str:
+    async def handle_update_account(username: str, balance: Decimal, is_test: bool) -> str:
         with tracer.start_as_current_span(
                 "handle_update_user",
                 attributes={'attr.username': username, 'is_test': is_test}):
@@ -52,15 +135,16 @@ class AccountHandler:
             if is_test:
                 table_name = 'ledgerTest'
             try:
-                resp = Dynamo.update_account_balance(table_name, {'name': username,
-                                                                  'balance': balance})
-                return resp
+                await AsyncDynamo.transact_write(AccountHandler._set_balance(table_name, username, balance, is_test))
+                read_cache.invalidate(table_name, *shard_names(username))
+                return 'update item success'
             except Exception as e:
                 logger.info(f'error {e}')
                 raise ValueError(e)
 
     @staticmethod
-    def handle_modify_account(username: str, balance: Decimal, is_test: bool) -> str:
+    async def handle_modify_account(username: str, balance: Decimal, is_test: bool,
+                                    idempotent: IdempotentRequest | None = None) -> str:
         with tracer.start_as_current_span(
                 "handle_modify_user",
                 attributes={'attr.username': username, 'is_test': is_test}):
@@ -68,18 +152,30 @@ class AccountHandler:
             if is_test:
                 table_name = 'ledgerTest'
             try:
-                current_balance = Dynamo.get_item(table_name, {'name': username})
-                new_balance: float = current_balance["balance"] + balance
-
-                resp = Dynamo.update_account_balance(table_name, {'name': username,
-                                                                  'balance': new_balance})
-                return resp
+                # atomic ADD on the server, concurrent deposits cannot overwrite each other, and the
+                # log entry and idempotency record are written in the same transaction
+                extra = [log_entry(is_test, username, DEPOSIT, amount=balance)]
+                if idempotent:
+                    extra.append(idempotent.record('update item success'))
+                await AccountHandler._transact_balances(table_name, [(username, balance, None)], extra)
+                read_cache.invalidate(table_name, *shard_names(username))
+                if idempotent:
+                    idempotent.remember('update item success')
+                return 'update item success'
+            except TransactionCancelled as e:
+                if idempotent and e.reasons[-1] == ALREADY_EXISTS:
+                    # a retry of a deposit that was already applied
+                    return await idempotent.stored()
+                message = f'{username} not found in {table_name}' if e.reasons[0] == NOT_FOUND \
+                    else f'deposit failed {e.reasons}'
+                logger.info(f'error {message}')
+                raise ValueError(message)
             except Exception as e:
                 logger.info(f'error {e}')
                 raise ValueError(e)
 
     @staticmethod
-    def handle_delete_account(username: str, is_test: bool) -> str:
+    async def handle_delete_account(username: str, is_test: bool) -> str:
         with tracer.start_as_current_span(
                 "handle_delete_account",
                 attributes={'username': username, 'is_test': is_test}):
@@ -87,34 +183,188 @@ class AccountHandler:
             if is_test:
                 table_name = 'ledgerTest'
             try:
-                resp = Dynamo.delete_item(table_name, {'name': username})
+                for shard in reversed(shard_names(username)):
+                    resp = await AsyncDynamo.delete_item(table_name, {'name': shard})
+                read_cache.invalidate(table_name, *shard_names(username))
                 return resp
             except Exception as e:
                 logger.info(f'error {e}')
                 raise ValueError(e)
 
     @staticmethod
-    def handle_transaction(sender: str, receiver: str, amount: Decimal, is_test: bool) -> str:
+    async def handle_transaction(sender: str, receiver: str, amount: Decimal, is_test: bool,
+                                 idempotent: IdempotentRequest | None = None) -> str:
         with tracer.start_as_current_span(
                 "handle_transaction",
                 attributes={'attr.sender': sender, 'attr.receiver': receiver, 'is_test': is_test}):
             table_name: str = 'ledger'
             if is_test:
                 table_name = 'ledgerTest'
+            if sender == receiver:
+                raise ValueError('sender and receiver must be different accounts')
+            if amount <= 0:
+                raise ValueError('transaction amount must be positive')
             try:
-                sender_resp = AccountHandler.handle_modify_account(sender, amount * -1, is_test)
-                if sender_resp == 'update item success':
-                    receiver_resp = AccountHandler.handle_modify_account(receiver, amount, is_test)
-                    if receiver_resp != 'update item success':
-                        return 'transaction failed'
+                # one transactional write: both balances, both log entries and the idempotency record
+                # land together or not at all
+                extra = [log_entry(is_test, sender, TRANSFER, amount=-amount, counterparty=receiver),
+                         log_entry(is_test, receiver, TRANSFER, amount=amount, counterparty=sender)]
+                if idempotent:
+                    extra.append(idempotent.record('update item success'))
+                await AccountHandler._transact_balances(
+                    table_name, [(sender, -amount, Decimal('0')), (receiver, amount, None)], extra)
+                read_cache.invalidate(table_name, *shard_names(sender), *shard_names(receiver))
+                if idempotent:
+                    idempotent.remember('update item success')
+                return 'update item success'
+            except TransactionCancelled as e:
+                if idempotent and e.reasons[-1] == ALREADY_EXISTS:
+                    return await idempotent.stored()
+                sender_reason, receiver_reason = e.reasons[:2]
+                if sender_reason == NOT_FOUND:
+                    message = f'sender {sender} not found'
+                elif sender_reason == BELOW_MINIMUM:
+                    message = f'insufficient funds for {sender}'
+                elif receiver_reason == NOT_FOUND:
+                    message = f'receiver {receiver} not found'
                 else:
-                    return 'transaction failed'
+                    message = f'transaction failed {e.reasons}'
+                logger.info(f'error {message}')
+                raise ValueError(message)
+            except Exception as e:
+                logger.info(f'error {e}')
+                raise ValueError(e)
+
+    @staticmethod
+    def _group_transactions(transactions: list[Transaction], results: list,
+                            items_per_transfer: int = 2) -> list[list[int]]:
+        # pack transfers into groups of at most MAX_TRANSACT_ITEMS items, one transaction each: an update
+        # per account, or per shard of a sharded account, plus two log entries per transfer and its
+        # idempotency record, if any. Transfers that already have a result are left out
+        groups: list[list[int]] = []
+        group: list[int] = []
+        accounts: set[str] = set()
+        updates = 0
+        for index, transaction in enumerate(transactions):
+            if results[index] is not None:
+                continue
+            if transaction.sender == transaction.receiver:
+                results[index] = {'error': 'sender and receiver must be different accounts'}
+                continue
+            if transaction.amount <= 0:
+                results[index] = {'error': 'transaction amount must be positive'}
+                continue
+            new_accounts = {transaction.sender, transaction.receiver} - accounts
+            new_updates = sum(len(shard_names(name)) for name in new_accounts)
+            if updates + new_updates + items_per_transfer * (len(group) + 1) > MAX_TRANSACT_ITEMS:
+                groups.append(group)
+                group, accounts, updates = [], set(), 0
+                new_updates = sum(len(shard_names(name)) for name in (transaction.sender, transaction.receiver))
+            group.append(index)
+            accounts.update((transaction.sender, transaction.receiver))
+            updates += new_updates
+        if group:
+            groups.append(group)
+        return groups
 
-                return sender_resp
+    @staticmethod
+    async def handle_batch_transaction(transactions: list[Transaction], is_test: bool,
+                                       idempotent: IdempotentRequest | None = None) -> list[dict]:
+        with tracer.start_as_current_span(
+                "handle_batch_transaction",
+                attributes={'attr.transactions': len(transactions), 'is_test': is_test}):
+            table_name: str = 'ledger'
+            if is_test:
+                table_name = 'ledgerTest'
+            results: list[dict | None] = [None] * len(transactions)
+            # each transfer of a keyed batch gets its own record, so a retry only applies the ones still missing
+            parts = [idempotent.part(index) for index in range(len(transactions))] if idempotent else None
+            if parts:
+                for index, part in enumerate(parts):
+                    cached = part.cached()
+                    if cached is not None:
+                        results[index] = {'response': cached}
+            groups = AccountHandler._group_transactions(transactions, results, 3 if parts else 2)
+            # groups sharing an account take turns instead of conflicting inside the store
+            account_locks: dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+            semaphore = asyncio.Semaphore(BATCH_TRANSACTION_CONCURRENCY)
+
+            async def settle(group: list[int]):
+                debits: dict[str, Decimal] = defaultdict(Decimal)
+                credits: dict[str, Decimal] = defaultdict(Decimal)
+                for index in group:
+                    debits[transactions[index].sender] += transactions[index].amount
+                    credits[transactions[index].receiver] += transactions[index].amount
+                names = sorted(debits.keys() | credits.keys())
+                async with semaphore, AsyncExitStack() as stack:
+                    for name in names:
+                        await stack.enter_async_context(account_locks[name])
+                    try:
+                        # each sender has to cover everything it sends in the group out of its balance, credits
+                        # from the group do not count; a group this refuses is settled one by one below
+                        await AccountHandler._transact_balances(table_name, [
+                            (name, -debits[name], Decimal('0')) if debits[name] else (name, Decimal('0'), None)
+                            for name in names], [
+                            entry for index in group for entry in (
+                                log_entry(is_test, transactions[index].sender, TRANSFER,
+                                          amount=-transactions[index].amount,
+                                          counterparty=transactions[index].receiver),
+                                log_entry(is_test, transactions[index].receiver, TRANSFER,
+                                          amount=transactions[index].amount,
+                                          counterparty=transactions[index].sender))] + [
+                            parts[index].record('update item success') for index in group if parts], credits)
+                        read_cache.invalidate(table_name, *(shard for name in names for shard in shard_names(name)))
+                        for index in group:
+                            results[index] = {'response': 'update item success'}
+                            if parts:
+                                parts[index].remember('update item success')
+                        return
+                    except TransactionCancelled as e:
+                        logger.info(f'batch group of {len(group)} cancelled {e.reasons}, settling one by one')
+                    # settle the group in order so each transfer gets its own outcome
+                    for index in group:
+                        transaction = transactions[index]
+                        try:
+                            resp = await AccountHandler.handle_transaction(transaction.sender, transaction.receiver,
+                                                                           transaction.amount, is_test,
+                                                                           parts[index] if parts else None)
+                            results[index] = {'response': resp}
+                        except ValueError as e:
+                            results[index] = {'error': str(e)}
+
+            await asyncio.gather(*(settle(group) for group in groups))
+            return [{'index': index, **result} for index, result in enumerate(results)]
+
+    @staticmethod
+    async def handle_get_history(username: str, is_test: bool, start: str | None = None, end: str | None = None,
+                                 limit: int = 100, cursor: str | None = None, ascending: bool = False) -> dict:
+        with tracer.start_as_current_span(
+                "handle_get_history",
+                attributes={'attr.username': username, 'attr.is_test': is_test, 'attr.limit': limit}):
+            if not 1 <= limit <= MAX_HISTORY_PAGE:
+                raise ValueError(f'limit must be between 1 and {MAX_HISTORY_PAGE}')
+            try:
+                # a key range query on name and ts, never a scan
+                items, next_cursor = await AsyncDynamo.query_range(log_table(is_test), username, start, end,
+                                                                   limit, ascending, cursor)
+                return {'items': items, 'next': next_cursor}
+            except Exception as e:
+                logger.info(f'error {e}')
+                raise ValueError(e)
+
+    @staticmethod
+    async def handle_audit_balance(username: str, is_test: bool) -> dict:
+        with tracer.start_as_current_span(
+                "handle_audit_balance",
+                attributes={'attr.username': username, 'attr.is_test': is_test}):
+            table_name: str = 'ledger'
+            if is_test:
+                table_name = 'ledgerTest'
+            try:
+                shards = await read_shards(table_name, username)
+                rebuilt = await rebuild_balance(username, is_test)
+                stored = sum(shards.values()) if username in shards else None
+                return {**rebuilt, 'stored': stored, 'matches': stored == rebuilt['balance']}
             except Exception as e:
-                if sender_resp == 'update item success':
-                    rollback_resp = AccountHandler.handle_modify_account(sender, amount, is_test)
-                    if rollback_resp != 'update item success':
-                        logger.info(f'failed to rollback transaction')
                 logger.info(f'error {e}')
-                raise ValueError(e)
\ No newline at end of file
+                raise ValueError(e)
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import queue
+import threading
+import zlib
+from collections.abc import Iterator
+from decimal import Decimal
+
+from storage.Backend import get_storage
+
+logger = logging.getLogger(__name__)
+
+# tables the export may read, without their Test suffix
+EXPORTABLE_TABLES = ('ledger', 'portfolio')
+EXPORT_MAX_SEGMENTS = int(os.getenv('EXPORT_MAX_SEGMENTS', '32'))
+# items buffered between the scanning threads and the response, bounds memory whatever the table size
+EXPORT_BUFFER_ITEMS = int(os.getenv('EXPORT_BUFFER_ITEMS', '1000'))
+# bytes collected before a chunk is handed to the response
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+_DONE = object()
+
+
+def _encode(value):
+    # the same numbers the JSON routes return for Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class ExportHandler:
+    @staticmethod
+    def scan_items(table_name: str, segments: int) -> Iterator[dict]:
+        """Items of every segment, scanned on one thread per segment, in whatever order they arrive."""
+        buffer: queue.Queue = queue.Queue(maxsize=EXPORT_BUFFER_ITEMS)
+        stopped = threading.Event()
+        errors: list[Exception] = []
+
+        def scan(segment: int):
+            try:
+                for item in get_storage().scan(table_name, segment, segments):
+                    # a reader that went away must not leave scanners blocked on a full buffer
+                    while not stopped.is_set():
+                        try:
+                            buffer.put(item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+                    if stopped.is_set():
+                        return
+            except Exception as e:
+                errors.append(e)
+            finally:
+                buffer.put(_DONE)
+
+        threads = [threading.Thread(target=scan, args=(segment,), name=f'export-{segment}', daemon=True)
+                   for segment in range(segments)]
+        for thread in threads:
+            thread.start()
+        try:
+            remaining = segments
+            while remaining:
+                item = buffer.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                yield item
+            if errors:
+                raise errors[0]
+        finally:
+            stopped.set()
+            # unblock scanners still waiting to report they are done
+            while any(thread.is_alive() for thread in threads):
+                try:
+                    buffer.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    @staticmethod
+    def iter_export(table: str, is_test: bool, segments: int = 4, compress: bool = False) -> Iterator[bytes]:
+        """NDJSON lines of a whole table in chunks of about EXPORT_CHUNK_BYTES, gzip compressed if asked.
+
+        Arguments are checked here, before the response starts; the scan only begins once it is iterated.
+        """
+        if table not in EXPORTABLE_TABLES:
+            raise ValueError(f'table must be one of {", ".join(EXPORTABLE_TABLES)}')
+        if not 1 <= segments <= EXPORT_MAX_SEGMENTS:
+            raise ValueError(f'segments must be between 1 and {EXPORT_MAX_SEGMENTS}')
+        table_name: str = table
+        if is_test:
+            table_name = f'{table}Test'
+        return ExportHandler._ndjson_chunks(table_name, segments, compress)
+
+    @staticmethod
+    def _ndjson_chunks(table_name: str, segments: int, compress: bool) -> Iterator[bytes]:
+        # wbits 31 writes the gzip header and trailer around the deflate stream
+        compressor = zlib.compressobj(wbits=31) if compress else None
+        chunk = bytearray()
+        exported = 0
+        for item in ExportHandler.scan_items(table_name, segments):
+            line = json.dumps(item, default=_encode, separators=(',', ':')).encode() + b'\n'
+            chunk += compressor.compress(line) if compressor else line
+            exported += 1
+            if len(chunk) >= EXPORT_CHUNK_BYTES:
+                yield bytes(chunk)
+                chunk.clear()
+        if compressor:
+            chunk += compressor.flush()
+        if chunk:
+            yield bytes(chunk)
+        logger.info(f'exported {exported} items from {table_name}')
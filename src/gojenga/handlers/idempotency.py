@@ -0,0 +1,68 @@
+import copy
+import hashlib
+import json
+import os
+import time
+
+from common.Cache import TTLCache
+from storage.AsyncDynamo import AsyncDynamo
+from storage.Storage import Put
+
+# how long a key is remembered; the table's TTL deletes records once their expires time has passed
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', str(24 * 60 * 60)))
+# responses kept per worker so retries are answered without a storage round trip
+IDEMPOTENCY_CACHE_ENTRIES = int(os.getenv('IDEMPOTENCY_CACHE_ENTRIES', '10000'))
+IDEMPOTENCY_CACHE_TTL_SECONDS = float(os.getenv('IDEMPOTENCY_CACHE_TTL_SECONDS', '600'))
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+# (table_name, record name) -> (fingerprint, response)
+idempotency_cache = TTLCache(IDEMPOTENCY_CACHE_ENTRIES, IDEMPOTENCY_CACHE_TTL_SECONDS)
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a different request."""
+
+
+class IdempotentRequest:
+    """A write carrying an Idempotency-Key. Keys are scoped to the caller, and the fingerprint of route and
+    body tells a retry apart from a different request that reuses the key."""
+
+    def __init__(self, key: str, caller: str, route: str, body: dict, is_test: bool):
+        if not 0 < len(key) <= MAX_IDEMPOTENCY_KEY_LENGTH or not key.isascii() or not key.isprintable():
+            raise ValueError(f'Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} printable ascii characters')
+        self.table_name = 'idempotencyTest' if is_test else 'idempotency'
+        self.name = f'{caller}#{key}'
+        self.fingerprint = hashlib.sha256(json.dumps([route, body], sort_keys=True, default=str).encode()).hexdigest()
+
+    def part(self, index: int) -> 'IdempotentRequest':
+        """Record for one item of a batch request. Items share the batch's fingerprint, so a retry of the batch
+        skips the items that were already applied."""
+        part = copy.copy(self)
+        part.name = f'{self.name}#{index}'
+        return part
+
+    def _checked(self, fingerprint: str, response: str) -> str:
+        if fingerprint != self.fingerprint:
+            raise IdempotencyKeyReused('Idempotency-Key was already used for a different request')
+        return response
+
+    def cached(self) -> str | None:
+        entry = idempotency_cache.get((self.table_name, self.name))
+        return self._checked(*entry) if entry is not None else None
+
+    def record(self, response: str) -> Put:
+        # written in the same transaction as the change it stands for, the condition rejects a second one
+        return Put(self.table_name, {'name': self.name, 'fingerprint': self.fingerprint, 'response': response,
+                                     'expires': int(time.time()) + IDEMPOTENCY_TTL_SECONDS}, if_not_exists=True)
+
+    def remember(self, response: str):
+        idempotency_cache.set((self.table_name, self.name), (self.fingerprint, response))
+
+    async def stored(self) -> str:
+        """Response of the request that already used this key, after its record cancelled this one."""
+        item = await AsyncDynamo.get_item(self.table_name, {'name': self.name})
+        if 'response' not in item:
+            raise ValueError('a request with this Idempotency-Key is still being processed, retry')
+        response = self._checked(item['fingerprint'], item['response'])
+        self.remember(response)
+        return response
@@ -0,0 +1,202 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+from collections.abc import AsyncIterator
+from decimal import Decimal, InvalidOperation
+
+from common.Lib import Lib
+from common.PasswordPool import password_pool, PasswordPoolSaturated
+from handlers.ledger_log import log_entry, SET
+from handlers.portfolio_handler import DEFAULT_PORTFOLIO
+from storage.AsyncDynamo import AsyncDynamo
+from storage.Storage import MAX_BATCH_WRITE_ITEMS
+
+logger = logging.getLogger(__name__)
+
+# rows checked, hashed and written together
+IMPORT_CHUNK_ROWS = int(os.getenv('IMPORT_CHUNK_ROWS', '200'))
+# chunks in flight at once, hashing of one overlaps the writes of another
+IMPORT_CONCURRENCY = int(os.getenv('IMPORT_CONCURRENCY', '4'))
+# each user is a users, ledger, transaction log and portfolio item; a batch write carries whole users only
+USERS_PER_BATCH_WRITE = MAX_BATCH_WRITE_ITEMS // 4
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    pending = b''
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield line.decode('utf-8-sig').rstrip('\r')
+    if pending:
+        yield pending.decode('utf-8-sig').rstrip('\r')
+
+
+async def parse_rows(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[dict | str]:
+    """Rows as dicts from 'csv' (with a header line) or 'ndjson' lines. Lines that do not parse come through
+    as an error string so they are reported against their row number."""
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError('format must be csv or ndjson')
+    header: list[str] | None = None
+    async for line in lines:
+        if not line.strip():
+            continue
+        if fmt == 'ndjson':
+            try:
+                row = json.loads(line)
+                yield row if isinstance(row, dict) else 'row is not a JSON object'
+            except ValueError:
+                yield 'row is not valid JSON'
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [value.strip().lower() for value in values]
+        else:
+            yield dict(zip(header, values))
+
+
+class ImportHandler:
+    @staticmethod
+    def _validate(row: dict | str, seen: set[str]) -> tuple[dict | None, str | None]:
+        if isinstance(row, str):
+            return None, row
+        name = str(row.get('name') or '').strip().lower()
+        if not name or Lib.detect_special_characters(name):
+            return None, 'please send legal username'
+        if name in seen:
+            return None, 'duplicate username in import'
+        password_hash = str(row.get('password_hash') or '')
+        password = str(row.get('password') or '')
+        if not password_hash.startswith('$2') and not password:
+            return None, 'missing password'
+        try:
+            balance = Decimal(str(row.get('balance') or '0.00'))
+        except InvalidOperation:
+            return None, 'invalid balance'
+        if not balance.is_finite() or balance < 0:
+            return None, 'invalid balance'
+        seen.add(name)
+        return {'name': name, 'password': password, 'password_hash': password_hash, 'balance': balance}, None
+
+    @staticmethod
+    async def _password_hash(user: dict, slots: asyncio.Semaphore) -> str:
+        # rows may carry a bcrypt hash already, e.g. when moving users from another system
+        if user['password_hash'].startswith('$2'):
+            return user['password_hash']
+        async with slots:
+            while True:
+                try:
+                    return await password_pool.hash(user['password'])
+                except PasswordPoolSaturated:
+                    # logins share the pool, back off instead of failing the row
+                    await asyncio.sleep(0.05)
+
+    @staticmethod
+    async def _import_chunk(chunk: list[tuple[int, dict]], tables: tuple[str, str, str], is_test: bool,
+                            slots: asyncio.Semaphore) -> tuple[int, list[dict]]:
+        users_table, ledger_table, portfolio_table = tables
+        failures: list[dict] = []
+        # BatchWriteItem has no conditions, so names with a user, ledger row or portfolio already are filtered
+        # out up front. A signup or POST /account landing between this read and the write below is still
+        # overwritten, import names nobody else is creating at the same time
+        names = [user['name'] for _, user in chunk]
+        taken = await asyncio.gather(*(AsyncDynamo.batch_get_items(table_name, names)
+                                       for table_name in (users_table, ledger_table, portfolio_table)))
+        existing = {name for items in taken for name in items}
+        accepted: list[tuple[int, dict]] = []
+        for index, user in chunk:
+            if user['name'] in existing:
+                failures.append({'row': index, 'name': user['name'], 'error': 'username already exists'})
+            else:
+                accepted.append((index, user))
+
+        hashes = await asyncio.gather(*(ImportHandler._password_hash(user, slots) for _, user in accepted))
+
+        groups = [list(zip(accepted, hashes))[i:i + USERS_PER_BATCH_WRITE]
+                  for i in range(0, len(accepted), USERS_PER_BATCH_WRITE)]
+
+        def items(user: dict, hashed: str) -> list[tuple[str, dict]]:
+            opening = log_entry(is_test, user['name'], SET, balance=user['balance'])
+            return [(users_table, {'name': user['name'], 'password': hashed}),
+                    (ledger_table, {'name': user['name'], 'balance': user['balance']}),
+                    (opening.table_name, opening.item),
+                    (portfolio_table, {'name': user['name'], 'portfolio': DEFAULT_PORTFOLIO})]
+
+        results = await asyncio.gather(*(AsyncDynamo.batch_write_items([
+            item for (_, user), hashed in group for item in items(user, hashed)])
+            for group in groups), return_exceptions=True)
+        imported = 0
+        for group, result in zip(groups, results):
+            if isinstance(result, Exception):
+                logger.info(f'error {result}')
+                failures.extend({'row': index, 'name': user['name'], 'error': str(result)}
+                                for (index, user), _ in group)
+            else:
+                imported += len(group)
+        return imported, failures
+
+    @staticmethod
+    async def handle_import(rows: AsyncIterator[dict | str], is_test: bool) -> AsyncIterator[dict]:
+        """Import users with their ledger and default portfolio, yielding one event per failed row, a
+        progress event per chunk and a final summary. Rows are numbered from 1."""
+        tables = ('usersTest', 'ledgerTest', 'portfolioTest') if is_test else ('users', 'ledger', 'portfolio')
+        # leave half the password pool to logins
+        slots = asyncio.Semaphore(max(1, password_pool.max_pending // 2))
+        seen: set[str] = set()
+        totals = {'rows': 0, 'imported': 0, 'failed': 0}
+        started = time.perf_counter()
+        pending: set[asyncio.Task] = set()
+
+        def progress(imported: int, failures: list[dict]) -> list[dict]:
+            totals['imported'] += imported
+            totals['failed'] += len(failures)
+            elapsed = time.perf_counter() - started
+            return [{'failed': failure} for failure in failures] + [{'progress': {
+                **totals, 'users_per_minute': round(totals['imported'] / elapsed * 60, 1) if elapsed else 0.0}}]
+
+        async def finished(wait_for_all: bool) -> list[dict]:
+            if not pending:
+                return []
+            done, _ = await asyncio.wait(pending, return_when=asyncio.ALL_COMPLETED if wait_for_all
+                                         else asyncio.FIRST_COMPLETED)
+            events: list[dict] = []
+            for task in done:
+                pending.discard(task)
+                events += progress(*task.result())
+            return events
+
+        chunk: list[tuple[int, dict]] = []
+        rejected: list[dict] = []
+        try:
+            async for row in rows:
+                totals['rows'] += 1
+                user, error = ImportHandler._validate(row, seen)
+                if error:
+                    name = row.get('name') if isinstance(row, dict) else None
+                    rejected.append({'row': totals['rows'], 'name': name, 'error': error})
+                else:
+                    chunk.append((totals['rows'], user))
+                if len(chunk) + len(rejected) >= IMPORT_CHUNK_ROWS:
+                    for event in progress(0, rejected):
+                        yield event
+                    rejected = []
+                    if chunk:
+                        pending.add(asyncio.create_task(
+                            ImportHandler._import_chunk(chunk, tables, is_test, slots)))
+                        chunk = []
+                    while len(pending) >= IMPORT_CONCURRENCY:
+                        for event in await finished(wait_for_all=False):
+                            yield event
+            if chunk:
+                pending.add(asyncio.create_task(ImportHandler._import_chunk(chunk, tables, is_test, slots)))
+            for event in progress(0, rejected) + await finished(wait_for_all=True):
+                yield event
+        finally:
+            # the caller stopped reading, e.g. the client disconnected
+            for task in pending:
+                task.cancel()
+        logger.info(f'import finished {totals}')
+        yield {'done': {**totals, 'elapsed_seconds': round(time.perf_counter() - started, 3)}}
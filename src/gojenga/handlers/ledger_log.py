@@ -0,0 +1,76 @@
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from storage.AsyncDynamo import AsyncDynamo
+from storage.Storage import Put, SORT_KEY
+
+# a balance rebuild that replays at least this many settled entries stores a snapshot for the next one
+LEDGER_SNAPSHOT_EVERY = int(os.getenv('LEDGER_SNAPSHOT_EVERY', '100'))
+# entries younger than this may still be committing with an earlier ts, snapshots stop short of them
+LEDGER_SNAPSHOT_SETTLE_SECONDS = float(os.getenv('LEDGER_SNAPSHOT_SETTLE_SECONDS', '5'))
+# page size when replaying the log
+LEDGER_REPLAY_PAGE = 500
+
+# entry types: deposit and transfer carry a signed amount, set carries the balance the account was set to
+DEPOSIT = 'deposit'
+TRANSFER = 'transfer'
+SET = 'set'
+
+
+def log_table(is_test: bool) -> str:
+    return 'transactionsTest' if is_test else 'transactions'
+
+
+def snapshot_table(is_test: bool) -> str:
+    return 'snapshotsTest' if is_test else 'snapshots'
+
+
+def format_ts(moment: datetime) -> str:
+    # fixed width UTC so sort key order is time order
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def new_ts() -> str:
+    # the random suffix keeps two entries of one account in the same microsecond apart, and the whole key
+    # stays safe to pass back unescaped as a history cursor
+    return f'{format_ts(datetime.now(timezone.utc))}-{secrets.token_hex(3)}'
+
+
+def log_entry(is_test: bool, name: str, entry_type: str, **fields) -> Put:
+    return Put(log_table(is_test), {'name': name, SORT_KEY: new_ts(), 'type': entry_type, **fields})
+
+
+def apply_entry(balance: Decimal, entry: dict) -> Decimal:
+    if entry['type'] == SET:
+        return entry['balance']
+    return balance + entry['amount']
+
+
+async def rebuild_balance(name: str, is_test: bool) -> dict:
+    """Balance from the latest snapshot plus the log entries after it, storing a new snapshot when the
+    settled part of that tail has grown to LEDGER_SNAPSHOT_EVERY entries."""
+    snapshots, _ = await AsyncDynamo.query_range(snapshot_table(is_test), name, limit=1, ascending=False)
+    snapshot = snapshots[0] if snapshots else None
+    balance = snapshot['balance'] if snapshot else Decimal('0')
+    cursor = snapshot[SORT_KEY] if snapshot else None
+    settle_before = format_ts(datetime.now(timezone.utc) - timedelta(seconds=LEDGER_SNAPSHOT_SETTLE_SECONDS))
+    settled_balance, settled_ts, settled, replayed = balance, None, 0, 0
+    while True:
+        entries, cursor = await AsyncDynamo.query_range(log_table(is_test), name, limit=LEDGER_REPLAY_PAGE,
+                                                        after=cursor)
+        for entry in entries:
+            balance = apply_entry(balance, entry)
+            replayed += 1
+            if entry[SORT_KEY] < settle_before:
+                settled_balance, settled_ts = balance, entry[SORT_KEY]
+                settled += 1
+        if cursor is None:
+            break
+    snapshotted = settled >= LEDGER_SNAPSHOT_EVERY
+    if snapshotted:
+        await AsyncDynamo.create_item(snapshot_table(is_test), {'name': name, SORT_KEY: settled_ts,
+                                                                'balance': settled_balance})
+    return {'name': name, 'balance': balance, 'replayed': replayed,
+            'snapshot': snapshot[SORT_KEY] if snapshot else None, 'snapshotted': snapshotted}
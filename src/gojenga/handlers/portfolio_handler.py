@@ -4,16 +4,30 @@ from decimal import *
 
 from opentelemetry import trace
 
+from common.Telemetry import get_tracer
+from common.Valuation import Holdings, price_table, value_holdings
+from handlers.read_cache import read_cache
 from models.Portfolio import Portfolio
-from storage.Dynamo import Dynamo
+from storage.AsyncDynamo import AsyncDynamo
+from storage.Storage import portfolio_as_map
 
 logger = logging.getLogger(__name__)
-tracer = trace.get_tracer(__name__)
+tracer = get_tracer(__name__)
+
+# holdings every new user starts with
+DEFAULT_PORTFOLIO = {"litecoin": {"name": "litecoin", "amount": 1, "id": "litecoin"}}
 
 
 class PortfolioHandler:
     @staticmethod
-    def handle_get_portfolio(username: str, is_test: bool) -> dict:
+    def _as_list(item: dict) -> dict:
+        # holdings are stored keyed by coin id, clients still get the list they always did
+        if isinstance(item.get('portfolio'), dict):
+            return {**item, 'portfolio': list(item['portfolio'].values())}
+        return item
+
+    @staticmethod
+    async def handle_get_portfolio(username: str, is_test: bool) -> dict:
         with tracer.start_as_current_span(
                 "handle_get_portfolio",
                 attributes={'attr.username': username, 'attr.is_test': is_test},
@@ -23,14 +37,60 @@ class PortfolioHandler:
             if is_test:
                 table_name = 'portfolioTest'
             try:
-                user = Dynamo.get_item(table_name, {'name': username})
-                return user
+                user = await read_cache.get_item(table_name, username)
+                return PortfolioHandler._as_list(user)
             except Exception as e:
                 logger.info(f'error {e}')
                 raise ValueError(e)
 
     @staticmethod
-    def handle_create_portfolio(username: str, portfolio: Portfolio, is_test: bool) -> str:
+    async def handle_get_portfolios(usernames: list[str], is_test: bool) -> dict:
+        with tracer.start_as_current_span(
+                "handle_get_portfolios",
+                attributes={'attr.usernames': len(usernames), 'attr.is_test': is_test},
+                kind=trace.SpanKind.SERVER
+        ):
+            table_name: str = 'portfolio'
+            if is_test:
+                table_name = 'portfolioTest'
+            try:
+                portfolios = await read_cache.get_items(table_name, usernames)
+                return {name: PortfolioHandler._as_list(item) for name, item in portfolios.items()}
+            except Exception as e:
+                logger.info(f'error {e}')
+                raise ValueError(e)
+
+    @staticmethod
+    async def handle_get_portfolio_value(username: str, is_test: bool) -> dict:
+        with tracer.start_as_current_span(
+                "handle_get_portfolio_value",
+                attributes={'attr.username': username, 'attr.is_test': is_test},
+                kind=trace.SpanKind.SERVER
+        ):
+            table_name: str = 'portfolio'
+            if is_test:
+                table_name = 'portfolioTest'
+            try:
+                item = await read_cache.get_item(table_name, username)
+                if 'name' not in item:
+                    return item
+                prices = price_table.get()
+                holdings = Holdings.from_items([item], prices)
+                coin_prices = prices.vector[holdings.coins]
+                coins = portfolio_as_map(item.get('portfolio'))
+                return {
+                    'name': username,
+                    'value': round(float(value_holdings(holdings, prices)[0]), 2),
+                    'holdings': [{'id': coin_id, 'amount': coin['amount'],
+                                  'price': None if index == prices.unknown else float(price),
+                                  'value': round(float(price) * float(coin['amount']), 2)}
+                                 for (coin_id, coin), index, price in zip(coins.items(), holdings.coins, coin_prices)]}
+            except Exception as e:
+                logger.info(f'error {e}')
+                raise ValueError(e)
+
+    @staticmethod
+    async def handle_create_portfolio(username: str, portfolio: Portfolio, is_test: bool) -> str:
         with tracer.start_as_current_span(
                 "handle_create_portfolio",
                 attributes={'username': username, 'attr.is_test': is_test}
@@ -39,14 +99,16 @@ class PortfolioHandler:
             if is_test:
                 table_name = 'portfolioTest'
             try:
-                resp = Dynamo.create_item(table_name, {'name': portfolio.username, 'portfolio': portfolio.portfolio})
+                resp = await AsyncDynamo.create_item(table_name, {'name': portfolio.username,
+                                                                  'portfolio': portfolio_as_map(portfolio.portfolio)})
+                read_cache.invalidate(table_name, portfolio.username)
                 return resp
             except Exception as e:
                 logger.info(f'error {e}')
                 raise ValueError(e)
 
     @staticmethod
-    def handle_update_portfolio(username: str, portfolio: Portfolio, is_test: bool, update_type: str) -> str:
+    async def handle_update_portfolio(username: str, portfolio: Portfolio, is_test: bool, update_type: str) -> str:
         with tracer.start_as_current_span(
                 "handle_create_portfolio",
                 attributes={'username': username, 'attr.is_test': is_test}
@@ -55,40 +117,26 @@ class PortfolioHandler:
             if is_test:
                 table_name = 'portfolioTest'
             try:
-                original_portfolio = PortfolioHandler.handle_get_portfolio(username, is_test)
-                new_portfolio: list = original_portfolio['portfolio']
-                coin_portfolio: list[object] = portfolio.portfolio
-
+                coins: list[dict] = [dict(coin) for coin in portfolio.portfolio]
+                upserts: dict[str, dict] = {}
+                removals: list[str] = []
                 if update_type == 'buy':
-
-                    for coin in coin_portfolio:
-                        coin["amount"] = Decimal(coin["amount"])
-                        print(f'coin is: {coin}')
-                        print(f'coin id is: {coin["id"]}')
-                        coin_id = coin["id"]
-                        found_coins = [item for item in new_portfolio if item.get('id') == coin_id]
-                        # this section modifies existing quantity of coin already in portfolio
-
-                        if len(found_coins) > 0:
-                            coin_index = new_portfolio.index(found_coins[0])
-                            # overwrite existing coin with updated quantity
-                            new_portfolio[coin_index] = coin
-                        else:
-                            new_portfolio.append(coin)
-
+                    for coin in coins:
+                        # overwrite the holding with the new quantity, other holdings are not touched
+                        coin["amount"] = Decimal(str(coin["amount"]))
+                        upserts[coin["id"]] = coin
                 elif update_type == 'sell':
-                    coin_id = coin_portfolio[0]["id"]
-
-                    new_portfolio = [coin for coin in new_portfolio if coin["id"] != coin_id]
+                    removals = list(dict.fromkeys(coin["id"] for coin in coins))
 
-                resp = Dynamo.create_item(table_name, {'name': portfolio.username, 'portfolio': new_portfolio})
+                resp = await AsyncDynamo.update_portfolio_holdings(table_name, portfolio.username, upserts, removals)
+                read_cache.invalidate(table_name, portfolio.username)
                 return resp
             except Exception as e:
                 logger.info(f'error {e}')
                 raise ValueError(e)
 
     @staticmethod
-    def handle_delete_portfolio(username: str, is_test: bool) -> str:
+    async def handle_delete_portfolio(username: str, is_test: bool) -> str:
         with tracer.start_as_current_span(
                 "handle_delete_portfolio",
                 attributes={'username': username, 'is_test': is_test}):
@@ -96,7 +144,8 @@ class PortfolioHandler:
             if is_test:
                 table_name = 'portfolioTest'
             try:
-                resp = Dynamo.delete_item(table_name, {'name': username})
+                resp = await AsyncDynamo.delete_item(table_name, {'name': username})
+                read_cache.invalidate(table_name, username)
                 return resp
             except Exception as e:
                 logger.info(f'error {e}')
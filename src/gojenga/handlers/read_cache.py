@@ -0,0 +1,80 @@
+import os
+
+from common.Cache import TTLCache
+from storage.AsyncDynamo import AsyncDynamo
+
+# items served to GET routes without a storage read; handlers invalidate what they write,
+# writes made by other workers show up once the ttl runs out
+READ_CACHE_TTL_SECONDS = float(os.getenv('READ_CACHE_TTL_SECONDS', '5'))
+READ_CACHE_MAX_ENTRIES = int(os.getenv('READ_CACHE_MAX_ENTRIES', '50000'))
+READ_CACHE_MAX_BYTES = int(os.getenv('READ_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# most names accepted by one batch read endpoint
+MAX_BATCH_READ_NAMES = int(os.getenv('MAX_BATCH_READ_NAMES', '1000'))
+
+
+class ReadCache:
+    """Read-through cache of items keyed by (table_name, name).
+
+    A read that started before an invalidation of its key must not put the old item back, so every
+    invalidation bumps a version stripe and reads only fill the cache when their stripe did not move.
+    """
+
+    def __init__(self, cache: TTLCache, stripes: int = 4096):
+        self.cache = cache
+        self.versions = [0] * stripes
+
+    def _stripe(self, key) -> int:
+        return hash(key) % len(self.versions)
+
+    async def get_item(self, table_name: str, name: str) -> dict:
+        key = (table_name, name)
+        item = self.cache.get(key)
+        if item is not None:
+            return item
+        stripe = self._stripe(key)
+        version = self.versions[stripe]
+        item = await AsyncDynamo.get_item(table_name, {'name': name})
+        # missing items are not cached, they are usually about to be created
+        if 'name' in item and self.versions[stripe] == version:
+            self.cache.set(key, item)
+        return item
+
+    async def get_items(self, table_name: str, names: list[str]) -> dict[str, dict]:
+        """Cached items first, the rest in batch reads. Missing names map to the get_item not found message."""
+        items: dict[str, dict] = {}
+        misses: dict[str, int] = {}
+        for name in dict.fromkeys(names):
+            key = (table_name, name)
+            item = self.cache.get(key)
+            if item is not None:
+                items[name] = item
+            else:
+                misses[name] = self.versions[self._stripe(key)]
+        if misses:
+            found = await AsyncDynamo.batch_get_items(table_name, list(misses))
+            for name, version in misses.items():
+                item = found.get(name)
+                if item is None:
+                    items[name] = {'message': 'item not found'}
+                    continue
+                key = (table_name, name)
+                if self.versions[self._stripe(key)] == version:
+                    self.cache.set(key, item)
+                items[name] = item
+        return {name: items[name] for name in dict.fromkeys(names)}
+
+    def invalidate(self, table_name: str, *names: str):
+        for name in names:
+            key = (table_name, name)
+            self.versions[self._stripe(key)] += 1
+            self.cache.invalidate(key)
+
+    def clear(self):
+        self.versions = [version + 1 for version in self.versions]
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+read_cache = ReadCache(TTLCache(READ_CACHE_MAX_ENTRIES, READ_CACHE_TTL_SECONDS, max_bytes=READ_CACHE_MAX_BYTES))
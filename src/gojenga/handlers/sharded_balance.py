@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import random
+from decimal import Decimal, ROUND_DOWN
+
+from storage.AsyncDynamo import AsyncDynamo
+from storage.Storage import ConditionalCheckFailed, Increment, TransactionCancelled
+
+logger = logging.getLogger(__name__)
+
+
+def parse_sharded_accounts(spec: str, default_shards: int) -> dict[str, int]:
+    """Parse 'treasury:16,house' into account -> shard count, default_shards where no count is given."""
+    accounts: dict[str, int] = {}
+    for part in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, count = part.partition(':')
+        accounts[name.strip().lower()] = max(1, int(count or default_shards))
+    return accounts
+
+
+# shards of a sharded account that does not name its own count
+LEDGER_SHARDS = int(os.getenv('LEDGER_SHARDS', '8'))
+# accounts whose balance is spread over several ledger items, e.g. 'treasury:16,house'
+SHARDED_ACCOUNTS = parse_sharded_accounts(os.getenv('SHARDED_ACCOUNTS', ''), LEDGER_SHARDS)
+SHARD_REBALANCE_SECONDS = float(os.getenv('SHARD_REBALANCE_SECONDS', '60'))
+# plans of a sharded write re-made from fresh reads before its failure is reported
+SHARD_WRITE_ATTEMPTS = 3
+
+
+def shard_names(name: str) -> list[str]:
+    # shard 0 is the account's own item, so an unsharded account is a sharded one with a single shard;
+    # '#' never appears in usernames, so shard items cannot collide with accounts
+    return [name] + [f'{name}#{i}' for i in range(1, SHARDED_ACCOUNTS.get(name, 1))]
+
+
+def account_of(shard: str) -> str:
+    return shard.partition('#')[0]
+
+
+def merge_shards(name: str, items: dict[str, dict]) -> dict:
+    """The account item of name with its balance summed over the shard items in items."""
+    account = items.get(name) or {'message': 'item not found'}
+    if 'balance' not in account:
+        return account
+    shards = (items.get(shard) or {} for shard in shard_names(name)[1:])
+    return {**account, 'balance': account['balance'] + sum(shard.get('balance', 0) for shard in shards)}
+
+
+async def read_shards(table_name: str, name: str) -> dict[str, Decimal]:
+    """Balance of every shard of name that exists, read from storage rather than the read cache."""
+    items = await AsyncDynamo.batch_get_items(table_name, shard_names(name))
+    return {shard: items[shard]['balance'] for shard in shard_names(name) if shard in items}
+
+
+async def ensure_shards(table_name: str, name: str) -> bool:
+    """Create the missing shards of an existing account with a zero balance. False if the account is gone."""
+    balances = await read_shards(table_name, name)
+    if name not in balances:
+        return False
+    for shard in shard_names(name):
+        if shard not in balances:
+            try:
+                await AsyncDynamo.create_item(table_name, {'name': shard, 'balance': Decimal('0')},
+                                              if_not_exists=True)
+            except ConditionalCheckFailed:
+                pass
+    return True
+
+
+def plan_debit(table_name: str, name: str, balances: dict[str, Decimal], amount: Decimal) -> list[Increment]:
+    """Increments taking amount out of the shards, each conditioned on its own shard staying at or above 0,
+    so the account as a whole can never be overdrawn."""
+    covering = [shard for shard, balance in balances.items() if balance >= amount]
+    if covering:
+        return [Increment(table_name, {'name': random.choice(covering)}, -amount, minimum=Decimal('0'))]
+    if sum(balances.values()) < amount:
+        # insufficient funds or no account: the write is bound to fail and report which
+        return [Increment(table_name, {'name': name}, -amount, minimum=Decimal('0'))]
+    increments: list[Increment] = []
+    remaining = amount
+    for shard, balance in sorted(balances.items(), key=lambda entry: entry[1], reverse=True):
+        take = min(balance, remaining)
+        increments.append(Increment(table_name, {'name': shard}, -take, minimum=Decimal('0')))
+        remaining -= take
+        if remaining <= 0:
+            break
+    return increments
+
+
+async def balance_increments(table_name: str, name: str, amount: Decimal, minimum: Decimal | None,
+                             credit: Decimal = Decimal('0')) -> list[Increment]:
+    """Increments moving the balance of name by amount: one for an unsharded account or a credit, the
+    debit of a sharded account planned over its shards from their current balances.
+
+    credit is added in the same increments but after the minimum is checked, so it cannot pay for amount.
+    """
+    if minimum is not None:
+        minimum += credit
+    if name not in SHARDED_ACCOUNTS:
+        return [Increment(table_name, {'name': name}, amount + credit, minimum=minimum)]
+    if amount >= 0 or minimum is None:
+        # credits land on a random shard, that is what spreads the writes
+        return [Increment(table_name, {'name': random.choice(shard_names(name))}, amount + credit,
+                          minimum=minimum)]
+    increments = plan_debit(table_name, name, await read_shards(table_name, name), -amount)
+    increments[0].amount += credit
+    increments[0].minimum += credit
+    return increments
+
+
+async def rebalance(table_name: str, name: str) -> bool:
+    """Even out the shard balances of name in one transaction, keeping the total. False if nothing moved."""
+    if not await ensure_shards(table_name, name):
+        return False
+    balances = await read_shards(table_name, name)
+    shards = shard_names(name)
+    total = sum(balances.values())
+    even = (total / len(shards)).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+    targets = {shard: even for shard in shards}
+    targets[name] += total - even * len(shards)
+    moves = {shard: targets[shard] - balances.get(shard, Decimal('0')) for shard in shards}
+    moves = {shard: move for shard, move in moves.items() if move}
+    if not moves:
+        return False
+    try:
+        # the moves sum to zero, so debits and credits landing meanwhile are kept whatever the order
+        await AsyncDynamo.transact_write([
+            Increment(table_name, {'name': shard}, move, minimum=Decimal('0') if move < 0 else None)
+            for shard, move in moves.items()])
+        return True
+    except TransactionCancelled as e:
+        logger.info(f'rebalance of {name} skipped, a shard moved {e.reasons}')
+        return False
+
+
+async def rebalance_forever(table_names: tuple[str, ...] = ('ledger', 'ledgerTest')):
+    while True:
+        for table_name in table_names:
+            for name in SHARDED_ACCOUNTS:
+                try:
+                    await rebalance(table_name, name)
+                except Exception as e:
+                    logger.error(f'rebalance of {name} in {table_name} failed {e}')
+        await asyncio.sleep(SHARD_REBALANCE_SECONDS)
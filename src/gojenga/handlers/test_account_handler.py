@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+from decimal import Decimal
+
+from handlers.account_handler import AccountHandler
+from handlers.read_cache import read_cache
+from models.Transaction import Transaction
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+
+class TestAccountHandler(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = Memory(latency=0.001)
+        set_storage(self.storage)
+        read_cache.clear()
+        self.storage.create_item('ledgerTest', {'name': 'kovax', 'balance': Decimal('10.00')})
+
+    async def test_concurrent_deposits_are_not_lost(self):
+        await asyncio.gather(*(AccountHandler.handle_modify_account('kovax', Decimal('1.25'), True)
+                               for _ in range(40)))
+        account = await AccountHandler.handle_get_account('kovax', True)
+        assert account['balance'] == Decimal('60.00'), account
+
+    async def test_deposit_to_missing_account(self):
+        with self.assertRaises(ValueError):
+            await AccountHandler.handle_modify_account('nobody', Decimal('1.00'), True)
+        assert self.storage.get_item('ledgerTest', {'name': 'nobody'}) == {'message': 'item not found'}
+
+    async def test_transaction(self):
+        self.storage.create_item('ledgerTest', {'name': 'david', 'balance': Decimal('0.00')})
+        resp = await AccountHandler.handle_transaction('kovax', 'david', Decimal('2.50'), True)
+        assert resp == 'update item success'
+        assert self.storage.get_item('ledgerTest', {'name': 'kovax'})['balance'] == Decimal('7.50')
+        assert self.storage.get_item('ledgerTest', {'name': 'david'})['balance'] == Decimal('2.50')
+
+    async def test_transaction_insufficient_funds_moves_nothing(self):
+        self.storage.create_item('ledgerTest', {'name': 'david', 'balance': Decimal('0.00')})
+        with self.assertRaisesRegex(ValueError, 'insufficient funds'):
+            await AccountHandler.handle_transaction('kovax', 'david', Decimal('10.01'), True)
+        assert self.storage.get_item('ledgerTest', {'name': 'kovax'})['balance'] == Decimal('10.00')
+        assert self.storage.get_item('ledgerTest', {'name': 'david'})['balance'] == Decimal('0.00')
+
+    async def test_transaction_missing_receiver_moves_nothing(self):
+        with self.assertRaisesRegex(ValueError, 'receiver kovax2 not found'):
+            await AccountHandler.handle_transaction('kovax', 'kovax2', Decimal('1.29'), True)
+        assert self.storage.get_item('ledgerTest', {'name': 'kovax'})['balance'] == Decimal('10.00')
+        assert self.storage.get_item('ledgerTest', {'name': 'kovax2'}) == {'message': 'item not found'}
+
+    async def test_concurrent_transactions_never_overdraw(self):
+        self.storage.create_item('ledgerTest', {'name': 'david', 'balance': Decimal('0.00')})
+        results = await asyncio.gather(*(AccountHandler.handle_transaction('kovax', 'david', Decimal('1.00'), True)
+                                         for _ in range(15)), return_exceptions=True)
+        assert sum(result == 'update item success' for result in results) == 10
+        assert self.storage.get_item('ledgerTest', {'name': 'kovax'})['balance'] == Decimal('0.00')
+        assert self.storage.get_item('ledgerTest', {'name': 'david'})['balance'] == Decimal('10.00')
+
+    async def test_batch_transaction_payout(self):
+        self.storage.create_item('ledgerTest', {'name': 'treasury', 'balance': Decimal('250.00')})
+        for i in range(300):
+            self.storage.create_item('ledgerTest', {'name': f'payee{i}', 'balance': Decimal('0.00')})
+        payouts = [Transaction(sender='treasury', receiver=f'payee{i}', amount=Decimal('1.00')) for i in range(300)]
+        payouts.append(Transaction(sender='treasury', receiver='treasury', amount=Decimal('1.00')))
+        results = await AccountHandler.handle_batch_transaction(payouts, True)
+
+        assert [result['index'] for result in results] == list(range(301))
+        assert sum('response' in result for result in results) == 250
+        assert results[-1] == {'index': 300, 'error': 'sender and receiver must be different accounts'}
+        assert all('insufficient funds' in result['error'] for result in results[250:300])
+        assert self.storage.get_item('ledgerTest', {'name': 'treasury'})['balance'] == Decimal('0.00')
+        assert self.storage.get_item('ledgerTest', {'name': 'payee249'})['balance'] == Decimal('1.00')
+        assert self.storage.get_item('ledgerTest', {'name': 'payee250'})['balance'] == Decimal('0.00')
+
+    async def test_batch_credit_does_not_pay_an_earlier_debit(self):
+        for name in ('alice', 'bob', 'carol'):
+            self.storage.create_item('ledgerTest', {'name': name, 'balance': Decimal('0.00')})
+        self.storage.update_account_balance('ledgerTest', {'name': 'bob', 'balance': Decimal('100.00')})
+        results = await AccountHandler.handle_batch_transaction([
+            Transaction(sender='alice', receiver='carol', amount=Decimal('100.00')),
+            Transaction(sender='bob', receiver='alice', amount=Decimal('100.00'))], True)
+
+        assert results == [{'index': 0, 'error': 'insufficient funds for alice'},
+                           {'index': 1, 'response': 'update item success'}]
+        assert self.storage.get_item('ledgerTest', {'name': 'alice'})['balance'] == Decimal('100.00')
+        assert self.storage.get_item('ledgerTest', {'name': 'carol'})['balance'] == Decimal('0.00')
+
+        # paid first, the same money can be sent on within the group
+        results = await AccountHandler.handle_batch_transaction([
+            Transaction(sender='alice', receiver='bob', amount=Decimal('100.00')),
+            Transaction(sender='bob', receiver='carol', amount=Decimal('100.00'))], True)
+        assert all('response' in result for result in results)
+        assert self.storage.get_item('ledgerTest', {'name': 'carol'})['balance'] == Decimal('100.00')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import gzip
+import json
+import threading
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from handlers import export_handler
+from handlers.export_handler import ExportHandler
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+
+class TestExportHandler(unittest.TestCase):
+    def setUp(self):
+        self.storage = Memory()
+        set_storage(self.storage)
+        for i in range(500):
+            self.storage.create_item('ledgerTest', {'name': f'user{i}', 'balance': Decimal(i) / 4})
+
+    def read(self, chunks) -> list[dict]:
+        return [json.loads(line) for line in b''.join(chunks).splitlines()]
+
+    def test_exports_every_item_once(self):
+        items = self.read(ExportHandler.iter_export('ledger', True, segments=7))
+        assert sorted(item['name'] for item in items) == sorted(f'user{i}' for i in range(500))
+        assert {'name': 'user3', 'balance': 0.75} in items and {'name': 'user4', 'balance': 1} in items
+
+    def test_gzip(self):
+        compressed = b''.join(ExportHandler.iter_export('ledger', True, segments=3, compress=True))
+        assert len(gzip.decompress(compressed).splitlines()) == 500
+
+    def test_rejects_other_tables_before_scanning(self):
+        with self.assertRaises(ValueError):
+            ExportHandler.iter_export('usersTest', True)
+        with self.assertRaises(ValueError):
+            ExportHandler.iter_export('ledger', True, segments=0)
+
+    def test_abandoned_export_stops_scanners(self):
+        with mock.patch.object(export_handler, 'EXPORT_BUFFER_ITEMS', 1), \
+                mock.patch.object(export_handler, 'EXPORT_CHUNK_BYTES', 1):
+            chunks = ExportHandler.iter_export('ledger', True, segments=4)
+            next(chunks)
+            chunks.close()
+        assert not any(thread.name.startswith('export-') for thread in threading.enumerate())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import asyncio
+import unittest
+from decimal import Decimal
+
+from handlers.account_handler import AccountHandler
+from handlers.idempotency import IdempotentRequest, IdempotencyKeyReused, idempotency_cache
+from handlers.read_cache import read_cache
+from models.Transaction import Transaction
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+
+def deposit(key: str, amount: str) -> IdempotentRequest:
+    return IdempotentRequest(key, 'kovax', 'deposit', {'name': 'kovax', 'balance': Decimal(amount)}, True)
+
+
+class TestIdempotency(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = Memory(latency=0.001)
+        set_storage(self.storage)
+        read_cache.clear()
+        idempotency_cache.clear()
+        self.storage.create_item('ledgerTest', {'name': 'kovax', 'balance': Decimal('10.00')})
+        self.storage.create_item('ledgerTest', {'name': 'david', 'balance': Decimal('0.00')})
+
+    def balance(self, name: str) -> Decimal:
+        return self.storage.get_item('ledgerTest', {'name': name})['balance']
+
+    async def test_retry_is_applied_once(self):
+        for _ in range(3):
+            resp = await AccountHandler.handle_modify_account('kovax', Decimal('5.00'), True, deposit('k1', '5.00'))
+            assert resp == 'update item success'
+        assert self.balance('kovax') == Decimal('15.00')
+        assert deposit('k1', '5.00').cached() == 'update item success'
+
+    async def test_retry_on_another_worker_reads_the_record(self):
+        await AccountHandler.handle_modify_account('kovax', Decimal('5.00'), True, deposit('k1', '5.00'))
+        idempotency_cache.clear()
+        assert deposit('k1', '5.00').cached() is None
+        resp = await AccountHandler.handle_modify_account('kovax', Decimal('5.00'), True, deposit('k1', '5.00'))
+        assert resp == 'update item success'
+        assert self.balance('kovax') == Decimal('15.00')
+
+    async def test_concurrent_retries(self):
+        await asyncio.gather(*(AccountHandler.handle_modify_account('kovax', Decimal('1.00'), True,
+                                                                    deposit('k1', '1.00')) for _ in range(10)))
+        assert self.balance('kovax') == Decimal('11.00')
+
+    async def test_key_reused_for_another_request(self):
+        await AccountHandler.handle_modify_account('kovax', Decimal('5.00'), True, deposit('k1', '5.00'))
+        with self.assertRaises(IdempotencyKeyReused):
+            deposit('k1', '6.00').cached()
+        idempotency_cache.clear()
+        with self.assertRaises(IdempotencyKeyReused):
+            await AccountHandler.handle_modify_account('kovax', Decimal('6.00'), True, deposit('k1', '6.00'))
+        assert self.balance('kovax') == Decimal('15.00')
+
+    async def test_failed_transaction_keeps_key_unused(self):
+        def transfer() -> IdempotentRequest:
+            return IdempotentRequest('t1', 'kovax', 'transaction',
+                                     {'sender': 'kovax', 'receiver': 'david', 'amount': Decimal('12.00')}, True)
+
+        with self.assertRaisesRegex(ValueError, 'insufficient funds'):
+            await AccountHandler.handle_transaction('kovax', 'david', Decimal('12.00'), True, transfer())
+        await AccountHandler.handle_modify_account('kovax', Decimal('2.00'), True)
+        for _ in range(2):
+            await AccountHandler.handle_transaction('kovax', 'david', Decimal('12.00'), True, transfer())
+        assert self.balance('kovax') == Decimal('0.00')
+        assert self.balance('david') == Decimal('12.00')
+
+    async def test_batch_retry_only_applies_missing_transfers(self):
+        payouts = [Transaction(sender='kovax', receiver='david', amount=Decimal('4.00')) for _ in range(3)]
+
+        def batch() -> IdempotentRequest:
+            return IdempotentRequest('b1', 'admin', 'batch_transaction',
+                                     {'transactions': [[t.sender, t.receiver, t.amount] for t in payouts]}, True)
+
+        results = await AccountHandler.handle_batch_transaction(payouts, True, batch())
+        assert results[2] == {'index': 2, 'error': 'insufficient funds for kovax'}
+        await AccountHandler.handle_modify_account('kovax', Decimal('2.00'), True)
+        for clear in (False, True):
+            if clear:
+                idempotency_cache.clear()
+            results = await AccountHandler.handle_batch_transaction(payouts, True, batch())
+            assert all(result['response'] == 'update item success' for result in results)
+        assert self.balance('kovax') == Decimal('0.00')
+        assert self.balance('david') == Decimal('12.00')
+        with self.assertRaises(IdempotencyKeyReused):
+            await AccountHandler.handle_batch_transaction(payouts[:2], True, IdempotentRequest(
+                'b1', 'admin', 'batch_transaction', {'transactions': []}, True))
+
+    def test_keys_are_scoped_and_checked(self):
+        other = IdempotentRequest('k1', 'david', 'deposit', {'name': 'kovax', 'balance': Decimal('5.00')}, True)
+        assert other.name != deposit('k1', '5.00').name
+        for key in ('', 'x' * 256, 'café', 'a\nb'):
+            with self.assertRaises(ValueError):
+                deposit(key, '5.00')
+
+
+if __name__ == '__main__':
+    unittest.main()
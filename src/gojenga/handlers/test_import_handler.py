@@ -0,0 +1,63 @@
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from common.PasswordPool import hash_password
+from handlers import import_handler
+from handlers.import_handler import ImportHandler, iter_lines, parse_rows
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+
+async def body(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+class TestImportHandler(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = Memory()
+        set_storage(self.storage)
+        self.storage.create_item('usersTest', {'name': 'kovax', 'password': 'hashed'})
+
+    async def run_import(self, fmt: str, *chunks: bytes) -> list[dict]:
+        rows = parse_rows(iter_lines(body(*chunks)), fmt)
+        return [event async for event in ImportHandler.handle_import(rows, True)]
+
+    async def test_csv_import_reports_failed_rows(self):
+        existing_hash = hash_password('5821')
+        with mock.patch.object(import_handler, 'IMPORT_CHUNK_ROWS', 2):
+            events = await self.run_import('csv', b'name,password,password_hash,balance\r\nZala,,',
+                                           existing_hash.encode() + b',12.50\r\ndavid,0000,,\nkovax,1,,\n',
+                                           b'bad name,1,,\ndavid,2,,\nallie,,,\nmilo,3,,-1\n')
+        failed = {event['failed']['row']: event['failed']['error'] for event in events if 'failed' in event}
+        assert failed == {3: 'username already exists', 4: 'please send legal username',
+                          5: 'duplicate username in import', 6: 'missing password', 7: 'invalid balance'}
+        assert events[-1]['done']['rows'] == 7 and events[-1]['done']['imported'] == 2
+        assert self.storage.get_item('usersTest', {'name': 'zala'})['password'] == existing_hash
+        assert self.storage.get_item('ledgerTest', {'name': 'zala'})['balance'] == Decimal('12.50')
+        assert self.storage.get_item('usersTest', {'name': 'david'})['password'].startswith('$2')
+        assert 'litecoin' in self.storage.get_item('portfolioTest', {'name': 'david'})['portfolio']
+        assert self.storage.get_item('usersTest', {'name': 'kovax'})['password'] == 'hashed'
+
+    async def test_existing_ledger_or_portfolio_is_not_overwritten(self):
+        # e.g. left by POST /account or a portfolio created before the user
+        self.storage.create_item('ledgerTest', {'name': 'zala', 'balance': Decimal('40.00')})
+        self.storage.create_item('portfolioTest', {'name': 'milo', 'portfolio': {}})
+        events = await self.run_import('ndjson', b'{"name": "zala", "password": "1", "balance": "5"}\n',
+                                       b'{"name": "milo", "password": "1"}\n{"name": "allie", "password": "1"}\n')
+        assert [event['failed']['name'] for event in events if 'failed' in event] == ['zala', 'milo']
+        assert events[-1]['done']['imported'] == 1
+        assert self.storage.get_item('ledgerTest', {'name': 'zala'})['balance'] == Decimal('40.00')
+        assert self.storage.get_item('portfolioTest', {'name': 'milo'})['portfolio'] == {}
+        assert 'message' in self.storage.get_item('usersTest', {'name': 'zala'})
+
+    async def test_ndjson_import(self):
+        events = await self.run_import('ndjson', b'{"name": "zala", "password": "1"}\nnot json\n[1]\n')
+        assert [event['failed']['error'] for event in events if 'failed' in event] == \
+               ['row is not valid JSON', 'row is not a JSON object']
+        assert events[-1]['done']['imported'] == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
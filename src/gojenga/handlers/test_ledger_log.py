@@ -0,0 +1,92 @@
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from handlers import ledger_log
+from handlers.account_handler import AccountHandler
+from handlers.ledger_log import rebuild_balance
+from handlers.read_cache import read_cache
+from models.Transaction import Transaction
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+
+class TestLedgerLog(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = Memory()
+        set_storage(self.storage)
+        read_cache.clear()
+
+    async def _accounts(self):
+        await AccountHandler.handle_create_account('kovax', Decimal('10.00'), True)
+        await AccountHandler.handle_create_account('david', Decimal('0.00'), True)
+
+    async def test_every_change_is_logged(self):
+        await self._accounts()
+        await AccountHandler.handle_modify_account('kovax', Decimal('5.00'), True)
+        await AccountHandler.handle_transaction('kovax', 'david', Decimal('2.50'), True)
+
+        history = await AccountHandler.handle_get_history('kovax', True, ascending=True)
+        assert [(item['type'], item.get('amount', item.get('balance'))) for item in history['items']] == [
+            ('set', Decimal('10.00')), ('deposit', Decimal('5.00')), ('transfer', Decimal('-2.50'))]
+        assert history['items'][-1]['counterparty'] == 'david'
+        assert history['next'] is None
+
+    async def test_failed_transfer_logs_nothing(self):
+        await self._accounts()
+        with self.assertRaisesRegex(ValueError, 'insufficient funds'):
+            await AccountHandler.handle_transaction('kovax', 'david', Decimal('10.01'), True)
+        with self.assertRaisesRegex(ValueError, 'nobody not found'):
+            await AccountHandler.handle_modify_account('nobody', Decimal('1.00'), True)
+        assert len((await AccountHandler.handle_get_history('kovax', True))['items']) == 1
+        assert (await AccountHandler.handle_get_history('nobody', True))['items'] == []
+
+    async def test_history_pages_newest_first(self):
+        await self._accounts()
+        for _ in range(7):
+            await AccountHandler.handle_modify_account('kovax', Decimal('1.00'), True)
+        pages, cursor = [], None
+        while True:
+            page = await AccountHandler.handle_get_history('kovax', True, limit=3, cursor=cursor)
+            pages.append(page['items'])
+            cursor = page['next']
+            if cursor is None:
+                break
+        assert [len(page) for page in pages] == [3, 3, 2]
+        stamps = [item['ts'] for page in pages for item in page]
+        assert stamps == sorted(stamps, reverse=True)
+
+        middle = stamps[2:6]
+        ranged = await AccountHandler.handle_get_history('kovax', True, start=middle[-1], end=middle[0])
+        assert [item['ts'] for item in ranged['items']] == middle
+
+    async def test_batch_transactions_are_logged(self):
+        await self._accounts()
+        payouts = [Transaction(sender='kovax', receiver='david', amount=Decimal('1.00')) for _ in range(4)]
+        await AccountHandler.handle_batch_transaction(payouts, True)
+        history = await AccountHandler.handle_get_history('david', True)
+        assert sum(item['type'] == 'transfer' for item in history['items']) == 4
+
+    def test_batch_groups_fit_one_transaction(self):
+        payouts = [Transaction(sender='treasury', receiver=f'payee{i}', amount=Decimal('1.00')) for i in range(100)]
+        groups = AccountHandler._group_transactions(payouts, [None] * 100)
+        # one treasury update, 33 payee updates and 66 log entries
+        assert [len(group) for group in groups] == [33, 33, 33, 1]
+
+    async def test_rebuild_uses_latest_snapshot(self):
+        await self._accounts()
+        with mock.patch.object(ledger_log, 'LEDGER_SNAPSHOT_EVERY', 5), \
+                mock.patch.object(ledger_log, 'LEDGER_SNAPSHOT_SETTLE_SECONDS', 0):
+            for _ in range(6):
+                await AccountHandler.handle_modify_account('kovax', Decimal('1.00'), True)
+            first = await rebuild_balance('kovax', True)
+            assert first['balance'] == Decimal('16.00') and first['replayed'] == 7 and first['snapshotted']
+
+            await AccountHandler.handle_transaction('kovax', 'david', Decimal('6.00'), True)
+            audit = await AccountHandler.handle_audit_balance('kovax', True)
+        assert audit['matches'] and audit['balance'] == Decimal('10.00')
+        assert audit['replayed'] == 1 and audit['snapshot'] is not None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from decimal import Decimal
+
+from cli.migrate_portfolios import migrate
+from handlers.portfolio_handler import PortfolioHandler
+from handlers.read_cache import read_cache
+from models.Portfolio import Portfolio
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+LEGACY = [{'name': 'litecoin', 'amount': 1, 'id': 'litecoin'}, {'name': 'bitcoin', 'amount': 2, 'id': 'bitcoin'}]
+
+
+class TestPortfolioHandler(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = Memory()
+        set_storage(self.storage)
+        read_cache.clear()
+
+    async def test_buy_and_sell_touch_only_their_holdings(self):
+        self.storage.create_item('portfolioTest', {'name': 'kovax', 'portfolio': {}})
+        buy = Portfolio(username='kovax', portfolio=[{'name': 'bitcoin', 'amount': 1.5, 'id': 'bitcoin'},
+                                                     {'name': 'ethereum', 'amount': 3, 'id': 'ethereum'}])
+        await PortfolioHandler.handle_update_portfolio('kovax', buy, True, 'buy')
+        sell = Portfolio(username='kovax', portfolio=[{'name': 'ethereum', 'amount': 3, 'id': 'ethereum'}])
+        await PortfolioHandler.handle_update_portfolio('kovax', sell, True, 'sell')
+        stored = self.storage.get_item('portfolioTest', {'name': 'kovax'})['portfolio']
+        assert stored == {'bitcoin': {'name': 'bitcoin', 'amount': Decimal('1.5'), 'id': 'bitcoin'}}
+
+    async def test_legacy_list_is_migrated_on_update(self):
+        self.storage.create_item('portfolioTest', {'name': 'kovax', 'portfolio': LEGACY})
+        sell = Portfolio(username='kovax', portfolio=[{'name': 'bitcoin', 'amount': 2, 'id': 'bitcoin'}])
+        await PortfolioHandler.handle_update_portfolio('kovax', sell, True, 'sell')
+        assert list(self.storage.get_item('portfolioTest', {'name': 'kovax'})['portfolio']) == ['litecoin']
+
+    async def test_reads_return_a_list(self):
+        self.storage.create_item('portfolioTest', {'name': 'kovax', 'portfolio': {'litecoin': LEGACY[0]}})
+        self.storage.create_item('portfolioTest', {'name': 'david', 'portfolio': LEGACY})
+        assert (await PortfolioHandler.handle_get_portfolio('kovax', True))['portfolio'] == [LEGACY[0]]
+        assert (await PortfolioHandler.handle_get_portfolio('david', True))['portfolio'] == LEGACY
+
+    def test_migration_script(self):
+        self.storage.create_item('portfolioTest', {'name': 'kovax', 'portfolio': LEGACY})
+        self.storage.create_item('portfolioTest', {'name': 'david', 'portfolio': {}})
+        assert migrate('portfolioTest', 3) == {'scanned': 2, 'migrated': 1}
+        assert set(self.storage.get_item('portfolioTest', {'name': 'kovax'})['portfolio']) == {'litecoin', 'bitcoin'}
+
+
+if __name__ == '__main__':
+    unittest.main()
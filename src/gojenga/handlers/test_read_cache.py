@@ -0,0 +1,68 @@
+import asyncio
+import unittest
+from decimal import Decimal
+
+from common.Cache import TTLCache
+from handlers.account_handler import AccountHandler
+from handlers.portfolio_handler import PortfolioHandler
+from handlers.read_cache import ReadCache, read_cache
+from models.Portfolio import Portfolio
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+
+class TestReadCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = Memory()
+        set_storage(self.storage)
+        read_cache.clear()
+        self.storage.create_item('ledgerTest', {'name': 'kovax', 'balance': Decimal('10.00')})
+        self.storage.create_item('ledgerTest', {'name': 'david', 'balance': Decimal('0.00')})
+
+    async def test_reads_are_cached_until_a_write(self):
+        assert (await AccountHandler.handle_get_account('kovax', True))['balance'] == Decimal('10.00')
+        self.storage.update_account_balance('ledgerTest', {'name': 'kovax', 'balance': Decimal('99.00')})
+        assert (await AccountHandler.handle_get_account('kovax', True))['balance'] == Decimal('10.00')
+
+        await AccountHandler.handle_modify_account('kovax', Decimal('1.00'), True)
+        assert (await AccountHandler.handle_get_account('kovax', True))['balance'] == Decimal('100.00')
+
+    async def test_transaction_invalidates_both_accounts(self):
+        await AccountHandler.handle_get_account('kovax', True)
+        await AccountHandler.handle_get_account('david', True)
+        await AccountHandler.handle_transaction('kovax', 'david', Decimal('2.50'), True)
+        assert (await AccountHandler.handle_get_account('kovax', True))['balance'] == Decimal('7.50')
+        assert (await AccountHandler.handle_get_account('david', True))['balance'] == Decimal('2.50')
+
+    async def test_batch_reads_chunk_and_fill_the_cache(self):
+        names = [f'payee{i}' for i in range(250)]
+        for name in names:
+            self.storage.create_item('ledgerTest', {'name': name, 'balance': Decimal('1.00')})
+        await AccountHandler.handle_get_account('payee7', True)
+        accounts = await AccountHandler.handle_get_accounts(names + ['nobody'], True)
+        assert list(accounts) == names + ['nobody']
+        assert accounts['nobody'] == {'message': 'item not found'}
+        assert accounts['payee249']['balance'] == Decimal('1.00')
+        assert read_cache.cache.get(('ledgerTest', 'payee249')) is not None
+
+    async def test_missing_items_are_not_cached(self):
+        assert 'message' in await PortfolioHandler.handle_get_portfolio('kovax', True)
+        portfolio = Portfolio(username='kovax', portfolio=[{'name': 'litecoin', 'amount': 1, 'id': 'litecoin'}])
+        self.storage.create_item('portfolioTest', {'name': 'kovax', 'portfolio': portfolio.portfolio})
+        assert (await PortfolioHandler.handle_get_portfolio('kovax', True))['name'] == 'kovax'
+
+        await PortfolioHandler.handle_delete_portfolio('kovax', True)
+        assert 'message' in await PortfolioHandler.handle_get_portfolio('kovax', True)
+
+    async def test_read_racing_an_invalidation_does_not_fill(self):
+        cache = ReadCache(TTLCache(maxsize=10, ttl=60))
+        self.storage.latency = 0.01
+        read = asyncio.create_task(cache.get_item('ledgerTest', 'kovax'))
+        await asyncio.sleep(0)
+        cache.invalidate('ledgerTest', 'kovax')
+        await read
+        assert cache.cache.get(('ledgerTest', 'kovax')) is None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from handlers import sharded_balance
+from handlers.account_handler import AccountHandler
+from handlers.read_cache import read_cache
+from handlers.sharded_balance import parse_sharded_accounts, rebalance, shard_names
+from models.Transaction import Transaction
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+
+class TestShardedBalance(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = Memory(latency=0.001)
+        set_storage(self.storage)
+        read_cache.clear()
+        patcher = mock.patch.dict(sharded_balance.SHARDED_ACCOUNTS, {'treasury': 4}, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def shards(self) -> list[Decimal]:
+        return [self.storage.get_item('ledgerTest', {'name': shard})['balance'] for shard in shard_names('treasury')]
+
+    async def test_parse(self):
+        assert parse_sharded_accounts('Treasury:16, house,,', 8) == {'treasury': 16, 'house': 8}
+        assert shard_names('treasury') == ['treasury', 'treasury#1', 'treasury#2', 'treasury#3']
+        assert shard_names('kovax') == ['kovax']
+
+    async def test_deposits_spread_and_reads_sum(self):
+        await AccountHandler.handle_create_account('treasury', Decimal('100.00'), True)
+        assert self.shards() == [Decimal('100.00'), 0, 0, 0]
+        await asyncio.gather(*(AccountHandler.handle_modify_account('treasury', Decimal('1.00'), True)
+                               for _ in range(40)))
+        assert sum(balance > 0 for balance in self.shards()[1:]) >= 2
+        account = await AccountHandler.handle_get_account('treasury', True)
+        assert account == {'name': 'treasury', 'balance': Decimal('140.00')}
+        accounts = await AccountHandler.handle_get_accounts(['treasury', 'nobody'], True)
+        assert accounts['treasury']['balance'] == Decimal('140.00')
+        assert accounts['nobody'] == {'message': 'item not found'}
+
+    async def test_debit_across_shards(self):
+        await AccountHandler.handle_create_account('treasury', Decimal('10.00'), True)
+        await AccountHandler.handle_create_account('kovax', Decimal('0.00'), True)
+        await rebalance('ledgerTest', 'treasury')
+        assert self.shards() == [Decimal('2.50')] * 4
+        await AccountHandler.handle_transaction('treasury', 'kovax', Decimal('9.00'), True)
+        assert sum(self.shards()) == Decimal('1.00') and min(self.shards()) >= 0
+        with self.assertRaisesRegex(ValueError, 'insufficient funds for treasury'):
+            await AccountHandler.handle_transaction('treasury', 'kovax', Decimal('1.01'), True)
+
+    async def test_concurrent_payouts_never_overdraw(self):
+        await AccountHandler.handle_create_account('treasury', Decimal('100.00'), True)
+        for i in range(30):
+            await AccountHandler.handle_create_account(f'payee{i}', Decimal('0.00'), True)
+        await rebalance('ledgerTest', 'treasury')
+        results = await asyncio.gather(*(
+            AccountHandler.handle_transaction('treasury', f'payee{i}', Decimal('5.00'), True) for i in range(30)),
+            return_exceptions=True)
+        paid = sum(result == 'update item success' for result in results)
+        assert min(self.shards()) >= 0
+        assert sum(self.shards()) == Decimal('100.00') - 5 * paid
+        assert sum(self.storage.get_item('ledgerTest', {'name': f'payee{i}'})['balance'] for i in range(30)) == 5 * paid
+        assert paid >= 15
+
+    async def test_account_made_sharded_later(self):
+        self.storage.create_item('ledgerTest', {'name': 'treasury', 'balance': Decimal('8.00')})
+        for _ in range(8):
+            await AccountHandler.handle_modify_account('treasury', Decimal('1.00'), True)
+        assert sum(self.shards()) == Decimal('16.00')
+        with self.assertRaisesRegex(ValueError, 'nobody not found'):
+            await AccountHandler.handle_modify_account('nobody', Decimal('1.00'), True)
+
+    async def test_rebalance_keeps_the_total(self):
+        await AccountHandler.handle_create_account('treasury', Decimal('10.01'), True)
+        assert await rebalance('ledgerTest', 'treasury')
+        assert self.shards() == [Decimal('2.51'), Decimal('2.50'), Decimal('2.50'), Decimal('2.50')]
+        assert not await rebalance('ledgerTest', 'treasury')
+        assert not await rebalance('ledgerTest', 'nobody')
+
+    async def test_batch_payout_and_audit(self):
+        await AccountHandler.handle_create_account('treasury', Decimal('50.00'), True)
+        for i in range(60):
+            await AccountHandler.handle_create_account(f'payee{i}', Decimal('0.00'), True)
+        payouts = [Transaction(sender='treasury', receiver=f'payee{i}', amount=Decimal('1.00')) for i in range(60)]
+        results = await AccountHandler.handle_batch_transaction(payouts, True)
+        assert sum('response' in result for result in results) == 50
+        assert sum(self.shards()) == 0
+        audit = await AccountHandler.handle_audit_balance('treasury', True)
+        assert audit['matches'] and audit['stored'] == 0
+
+    async def test_batch_credit_does_not_pay_an_earlier_sharded_debit(self):
+        await AccountHandler.handle_create_account('treasury', Decimal('10.00'), True)
+        for name in ('kovax', 'david'):
+            await AccountHandler.handle_create_account(name, Decimal('0.00'), True)
+        await AccountHandler.handle_modify_account('kovax', Decimal('50.00'), True)
+        results = await AccountHandler.handle_batch_transaction([
+            Transaction(sender='treasury', receiver='david', amount=Decimal('50.00')),
+            Transaction(sender='kovax', receiver='treasury', amount=Decimal('50.00'))], True)
+        assert results[0] == {'index': 0, 'error': 'insufficient funds for treasury'}
+        assert sum(self.shards()) == Decimal('60.00')
+        assert min(self.shards()) >= 0
+
+    async def test_delete_removes_shards(self):
+        await AccountHandler.handle_create_account('treasury', Decimal('1.00'), True)
+        await AccountHandler.handle_delete_account('treasury', True)
+        assert all(self.storage.get_item('ledgerTest', {'name': shard}) == {'message': 'item not found'}
+                   for shard in shard_names('treasury'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import time
+import unittest
+from decimal import Decimal
+
+from handlers.read_cache import read_cache
+from handlers.user_handler import UserHandler
+from storage.Backend import set_storage
+from storage.Memory import Memory
+
+
+class TestUserHandler(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = Memory(latency=0.05)
+        set_storage(self.storage)
+        read_cache.clear()
+        self.storage.create_item('usersTest', {'name': 'kovax', 'password': 'hashed'})
+        self.storage.create_item('ledgerTest', {'name': 'kovax', 'balance': Decimal('10.00')})
+        self.storage.create_item('portfolioTest', {'name': 'kovax', 'portfolio': []})
+
+    async def test_summary_reads_run_concurrently(self):
+        started = time.perf_counter()
+        summary = await UserHandler.handle_get_summary('kovax', True)
+        elapsed = time.perf_counter() - started
+        assert summary == {'user': {'name': 'kovax'},
+                           'account': {'name': 'kovax', 'balance': Decimal('10.00')},
+                           'portfolio': {'name': 'kovax', 'portfolio': []}}
+        assert elapsed < 0.1, elapsed
+
+    async def test_signup_writes_user_ledger_and_portfolio(self):
+        resp = await UserHandler.handle_create_user('zala', '5821', True)
+        assert resp['user'] == 'zala'
+        assert self.storage.get_item('usersTest', {'name': 'zala'})['password'] != '5821'
+        assert self.storage.get_item('ledgerTest', {'name': 'zala'})['balance'] == Decimal('0.00')
+        assert self.storage.get_item('portfolioTest', {'name': 'zala'})['portfolio']['litecoin']['amount'] == 1
+
+    async def test_signup_with_taken_name_writes_nothing(self):
+        resp = await UserHandler.handle_create_user('kovax', '5821', True)
+        assert resp == {'message': 'username already exists'}
+        assert self.storage.get_item('usersTest', {'name': 'kovax'})['password'] == 'hashed'
+        assert self.storage.get_item('ledgerTest', {'name': 'kovax'})['balance'] == Decimal('10.00')
+
+    async def test_signup_keeps_rows_left_by_a_deleted_user(self):
+        await UserHandler.handle_delete_user('kovax', True)
+        resp = await UserHandler.handle_create_user('kovax', '5821', True)
+        assert resp == {'message': 'a ledger row for kovax already exists'}
+        assert self.storage.get_item('usersTest', {'name': 'kovax'}) == {'message': 'item not found'}
+        assert self.storage.get_item('ledgerTest', {'name': 'kovax'})['balance'] == Decimal('10.00')
+
+        self.storage.delete_item('ledgerTest', {'name': 'kovax'})
+        resp = await UserHandler.handle_create_user('kovax', '5821', True)
+        assert resp == {'message': 'a portfolio for kovax already exists'}
+
+    async def test_lookup_mode_writes_no_revocations(self):
+        await UserHandler.handle_update_user('kovax', 'rehashed', True)
+        await UserHandler.handle_delete_user('kovax', True)
+        assert self.storage.get_item('usersTest', {'name': 'kovax'}) == {'message': 'item not found'}
+        assert 'revokedTest' not in self.storage.tables
+
+    async def test_concurrent_signups_create_one_user(self):
+        results = await asyncio.gather(*(UserHandler.handle_create_user('zala', str(i), True) for i in range(5)))
+        assert sum('user' in result for result in results) == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
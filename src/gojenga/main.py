@@ -1,60 +1,62 @@
+import asyncio
 import logging.config
+import math
 from typing import Optional, Annotated
-from opentelemetry.metrics import get_meter
 from fastapi import Request, Header
+from fastapi.exception_handlers import http_exception_handler
 from opentelemetry import trace
-from opentelemetry.exporter.jaeger.thrift import JaegerExporter
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.propagate import extract
-from opentelemetry.sdk.resources import SERVICE_NAME, Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
 from common import Auth
 from common.Auth import MyAuth, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_ACCESS_TOKEN_EXPIRE_DAYS, create_access_token, \
-    get_current_active_user, \
+    get_current_active_user, get_current_admin_user, \
     authenticate_user, Token
 from common.Lib import Lib
-from handlers.account_handler import AccountHandler
+from common.Metrics import registry, Gauge, MetricsMiddleware, EXPOSITION_CONTENT_TYPE
+from common.PasswordPool import password_pool, PasswordPoolSaturated
+from common.Telemetry import configure_tracing, get_tracer
+from common.RateLimit import RateLimitMiddleware, parse_rate_limits, RATE_LIMITS, RATE_LIMIT_MAX_BUCKETS, \
+    RATE_LIMIT_TRUST_FORWARDED_FOR
+from handlers.account_handler import AccountHandler, MAX_BATCH_TRANSACTIONS, MAX_HISTORY_PAGE
+from handlers.export_handler import ExportHandler
+from handlers.idempotency import IdempotentRequest, IdempotencyKeyReused
+from handlers.import_handler import ImportHandler, iter_lines, parse_rows
 from handlers.portfolio_handler import PortfolioHandler
+from handlers.read_cache import read_cache, MAX_BATCH_READ_NAMES
+from handlers.sharded_balance import SHARDED_ACCOUNTS, rebalance_forever
 from models.Account import Account
 from models.JWT import JWT
+from models.Names import Names
 from models.Portfolio import Portfolio
 from models.Transaction import Transaction
 from models.User import User
 from handlers.user_handler import UserHandler
+from storage.AsyncDynamo import AsyncDynamo
+from storage.Storage import StorageThrottled, StorageUnavailable, TABLES, unavailable_cause
 
 from datetime import timedelta
 
 from fastapi import Depends, FastAPI, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 
-trace.set_tracer_provider(
-    TracerProvider(
-        resource=Resource.create({SERVICE_NAME: "gojenga"})
-    )
-)
-tracer = trace.get_tracer(__name__)
-
-meter = get_meter(__name__)
-
-# create a JaegerExporter
-jaeger_exporter = JaegerExporter(
-    # configure agent
-    agent_host_name='localhost',
-    agent_port=6831,
-    # optional: configure also collector
-    # collector_endpoint='http://localhost:14268/api/traces?format=jaeger.thrift',
-    # username=xxxx, # optional
-    # password=xxxx, # optional
-    # max_tag_value_length=None # optional
-)
-# Create a BatchSpanProcessor and add the exporter to it
-span_processor = BatchSpanProcessor(jaeger_exporter)
+# exporter, sampling and span limits come from the TRACE_* settings
+configure_tracing()
+tracer = get_tracer(__name__)
+
+
+def observe_cache(stat: str):
+    def callback():
+        return {('users',): Auth.user_cache.stats()[stat], ('reads',): read_cache.stats()[stat]}
+    return callback
+
+
+# read from the caches at scrape time, nothing is recorded on the lookup path
+for stat in ('size', 'bytes', 'hits', 'misses', 'hit_ratio', 'evictions', 'expirations'):
+    registry.register(Gauge(f'gojenga_cache_{stat}', f'Cache {stat.replace("_", " ")}.', ('cache',),
+                            callback=observe_cache(stat)))
 
-# add to the tracer
-trace.get_tracer_provider().add_span_processor(span_processor)
 
 logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
 
@@ -76,6 +78,64 @@ app.add_middleware(
 my_auth: MyAuth = MyAuth()
 
 
+def storage_unavailable_response(e: StorageUnavailable) -> JSONResponse:
+    code = status.HTTP_429_TOO_MANY_REQUESTS if isinstance(e, StorageThrottled) else \
+        status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse({'detail': str(e)}, status_code=code,
+                        headers={'Retry-After': str(max(1, math.ceil(e.retry_after)))})
+
+
+@app.exception_handler(HTTPException)
+async def storage_aware_http_exception_handler(request: Request, exc: HTTPException):
+    # routes turn every error into a 500 and handlers re-wrap storage errors on the way, so a throttled call
+    # is found by following the exceptions the 500 was raised from
+    unavailable = unavailable_cause(exc) if exc.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR else None
+    if unavailable is not None:
+        return storage_unavailable_response(unavailable)
+    return await http_exception_handler(request, exc)
+
+
+@app.exception_handler(StorageUnavailable)
+async def storage_unavailable_handler(request: Request, exc: StorageUnavailable):
+    return storage_unavailable_response(exc)
+
+background_tasks: set = set()
+
+
+@app.on_event("startup")
+async def start_revocation_refresh():
+    if Auth.AUTH_MODE == 'stateless':
+        for revocation_list in Auth.revocations.values():
+            task = asyncio.create_task(revocation_list.refresh_forever())
+            background_tasks.add(task)
+
+
+@app.on_event("startup")
+async def start_shard_rebalancing():
+    if SHARDED_ACCOUNTS:
+        task = asyncio.create_task(rebalance_forever())
+        background_tasks.add(task)
+
+
+@app.on_event("startup")
+async def start_password_pool():
+    await password_pool.start()
+
+
+@app.on_event("startup")
+async def warm_up_storage():
+    # connections and credentials are set up before the first request rather than during it
+    try:
+        await AsyncDynamo.warm_up([*TABLES, *(f'{table}Test' for table in TABLES)])
+    except Exception as e:
+        logger.error(f'storage warm up failed {e}')
+
+
+@app.on_event("shutdown")
+async def stop_password_pool():
+    password_pool.shutdown()
+
+
 @app.get("/", tags=["Root"])
 async def root():
     return {"message": "You have reached Gojenga"}
@@ -86,20 +146,76 @@ async def hello():
     return {"message": 'hiya'}
 
 
+@app.get("/debug/cache", tags=["Debug"])
+async def cache_stats():
+    return {"users": Auth.user_cache.stats(), "reads": read_cache.stats()}
+
+
+@app.get("/metrics", tags=["Debug"], response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type=EXPOSITION_CONTENT_TYPE)
+
+
+@app.get("/admin/export/{table}", tags=["Admin"])
+async def export_table(request: Request, table: str, segments: int = 4, gzip: bool = False,
+                       is_test: Optional[bool] | None = Header(default=False),
+                       current_user: User = Depends(get_current_admin_user)):
+    with tracer.start_as_current_span(
+            "export_table",
+            attributes={'attr.table': table, 'attr.segments': segments, 'attr.is_test': is_test},
+            kind=trace.SpanKind.SERVER
+    ):
+        try:
+            chunks = ExportHandler.iter_export(table, is_test, segments, gzip)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        headers = {"Content-Disposition": f'attachment; filename="{table}.ndjson{".gz" if gzip else ""}"'}
+        if gzip:
+            headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(chunks, media_type="application/x-ndjson", headers=headers)
+
+
+@app.post("/admin/import", tags=["Admin"])
+async def import_users(request: Request, format: str = 'ndjson', is_test: Optional[bool] | None = Header(default=False),
+                       current_user: User = Depends(get_current_admin_user)):
+    with tracer.start_as_current_span(
+            "import_users",
+            attributes={'attr.format': format, 'attr.is_test': is_test},
+            kind=trace.SpanKind.SERVER
+    ):
+        if format not in ('csv', 'ndjson'):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='format must be csv or ndjson')
+        try:
+            # the body is parsed as it arrives; only failures and the totals are kept
+            rows = parse_rows(iter_lines(request.stream()), format)
+            failed: list[dict] = []
+            summary: dict = {}
+            async for event in ImportHandler.handle_import(rows, is_test):
+                if 'failed' in event:
+                    failed.append(event['failed'])
+                elif 'progress' in event:
+                    logger.info(f'import progress {event["progress"]}')
+                else:
+                    summary = event['done']
+            return {"response": {**summary, "failures": failed}}
+        except Exception as e:
+            logger.error(e)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
 @app.post("/login", response_model=Token, tags=["Auth"])
 async def login_for_access_token(request: Request, is_test: Optional[bool] | None = Header(default=False),
                                  form_data: OAuth2PasswordRequestForm = Depends()):
     with tracer.start_as_current_span(
             "login",
-            context=extract(request.headers),
-            attributes={'form_data': form_data, 'is_test': is_test},
+            attributes={'attr.username': form_data.username.lower(), 'is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
         try:
             table_name: str = 'users'
             if is_test:
                 table_name = 'usersTest'
-            user = authenticate_user(table_name, form_data.username.lower(), form_data.password)
+            user = await authenticate_user(table_name, form_data.username.lower(), form_data.password)
             if not user:
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
@@ -113,6 +229,12 @@ async def login_for_access_token(request: Request, is_test: Optional[bool] | Non
             refresh_token_expires = timedelta(days=REFRESH_ACCESS_TOKEN_EXPIRE_DAYS)
             refresh_token = create_access_token(data={"sub": user["name"]}, expires_delta=refresh_token_expires)
             return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+        except HTTPException:
+            raise
+        except PasswordPoolSaturated as e:
+            logger.error(e)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="server busy, retry shortly",
+                                headers={"Retry-After": "1"})
         except Exception as e:
             logger.error(e)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -122,13 +244,16 @@ async def login_for_access_token(request: Request, is_test: Optional[bool] | Non
 async def renew_jwt(request: Request, jwt_token: JWT):
     with tracer.start_as_current_span(
             "refreshToken",
-            context=extract(request.headers),
             kind=trace.SpanKind.SERVER
     ):
         try:
             token_data = Auth.get_token_payload(jwt_token.token)
+            if Auth.AUTH_MODE == 'stateless' and await Auth.is_token_revoked(token_data):
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="token has been revoked")
             renewed_token = Auth.renew_access_token({"sub": token_data.get("sub")}, ACCESS_TOKEN_EXPIRE_MINUTES)
             return {"token": renewed_token}
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(e)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -139,7 +264,6 @@ async def get_user(request: Request, username: str, is_test: Optional[bool] | No
                    current_user: User = Depends(get_current_active_user)):
     with tracer.start_as_current_span(
             "get_user",
-            context=extract(request.headers),
             attributes={'attr.username': username.lower(), 'attr.is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
@@ -147,18 +271,56 @@ async def get_user(request: Request, username: str, is_test: Optional[bool] | No
             raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
         try:
             print(f'--> the oauth user {current_user}')
-            user = UserHandler.handle_get_user(username.lower(), is_test)
+            user = await UserHandler.handle_get_user(username.lower(), is_test)
             return {"response": user}
         except Exception as e:
             logger.error(e)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@app.get("/user/{username}/summary", tags=["User"])
+async def get_user_summary(request: Request, username: str, is_test: Optional[bool] | None = Header(default=False),
+                           current_user: User = Depends(get_current_active_user)):
+    with tracer.start_as_current_span(
+            "get_user_summary",
+            attributes={'attr.username': username.lower(), 'attr.is_test': is_test},
+            kind=trace.SpanKind.SERVER
+    ):
+        if Lib.detect_special_characters(username):
+            raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
+        try:
+            summary = await UserHandler.handle_get_summary(username.lower(), is_test)
+            return {"response": summary}
+        except Exception as e:
+            logger.error(e)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@app.post("/user/batch", tags=["User"])
+async def get_users(request: Request, data: Names, is_test: Optional[bool] | None = Header(default=False),
+                    current_user: User = Depends(get_current_active_user)):
+    with tracer.start_as_current_span(
+            "get_users",
+            attributes={'attr.usernames': len(data.names), 'attr.is_test': is_test},
+            kind=trace.SpanKind.SERVER
+    ):
+        if len(data.names) > MAX_BATCH_READ_NAMES:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f'send at most {MAX_BATCH_READ_NAMES} names per batch')
+        if any(Lib.detect_special_characters(name) for name in data.names):
+            raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal usernames')
+        try:
+            users = await UserHandler.handle_get_users([name.lower() for name in data.names], is_test)
+            return {"response": users}
+        except Exception as e:
+            logger.error(e)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
 @app.post("/user", tags=["User"])
 async def post_user(request: Request, data: User, is_test: Optional[bool] | None = Header(default=False)):
     with tracer.start_as_current_span(
             "post_user",
-            context=extract(request.headers),
             attributes={'attr.username': data.name, 'attr.is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
@@ -166,8 +328,12 @@ async def post_user(request: Request, data: User, is_test: Optional[bool] | None
             if Lib.detect_special_characters(data.name):
                 raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
 
-            resp = UserHandler.handle_create_user(data.name, data.password, is_test)
+            resp = await UserHandler.handle_create_user(data.name, data.password, is_test)
             return {"response": resp}
+        except PasswordPoolSaturated as e:
+            logger.error(e)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="server busy, retry shortly",
+                                headers={"Retry-After": "1"})
         except Exception as e:
             logger.error(e)
             # todo how to return original error message
@@ -179,14 +345,13 @@ async def put_user(request: Request, username: str, data: User, is_test: Optiona
                    current_user: User = Depends(get_current_active_user)):
     with tracer.start_as_current_span(
             "put_user",
-            context=extract(request.headers),
             attributes={'username': username.lower(), 'attr.is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
         if Lib.detect_special_characters(username):
             raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
         try:
-            resp = UserHandler.handle_update_user(username.lower(), data.password, is_test)
+            resp = await UserHandler.handle_update_user(username.lower(), data.password, is_test)
             return {"response": resp}
         except Exception as e:
             logger.error(e)
@@ -198,14 +363,13 @@ async def delete_user(request: Request, username: str, is_test: Optional[bool] |
                       current_user: User = Depends(get_current_active_user)):
     with tracer.start_as_current_span(
             "delete_user",
-            context=extract(request.headers),
             attributes={'username': username.lower(), 'is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
         if Lib.detect_special_characters(username):
             raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
         try:
-            resp = UserHandler.handle_delete_user(username.lower(), is_test)
+            resp = await UserHandler.handle_delete_user(username.lower(), is_test)
             return {"response": resp}
         except Exception as e:
             logger.error(e)
@@ -217,26 +381,45 @@ async def get_user(request: Request, username: str, is_test: Optional[bool] | No
                    current_user: User = Depends(get_current_active_user)):
     with tracer.start_as_current_span(
             "get_account",
-            context=extract(request.headers),
             attributes={'attr.username': username.lower(), 'attr.is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
         if Lib.detect_special_characters(username):
             raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
         try:
-            account = AccountHandler.handle_get_account(username.lower(), is_test)
+            account = await AccountHandler.handle_get_account(username.lower(), is_test)
             return {"response": account}
         except Exception as e:
             logger.error(e)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@app.post("/account/batch", tags=["Account"])
+async def get_accounts(request: Request, data: Names, is_test: Optional[bool] | None = Header(default=False),
+                       current_user: User = Depends(get_current_active_user)):
+    with tracer.start_as_current_span(
+            "get_accounts",
+            attributes={'attr.usernames': len(data.names), 'attr.is_test': is_test},
+            kind=trace.SpanKind.SERVER
+    ):
+        if len(data.names) > MAX_BATCH_READ_NAMES:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f'send at most {MAX_BATCH_READ_NAMES} names per batch')
+        if any(Lib.detect_special_characters(name) for name in data.names):
+            raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal usernames')
+        try:
+            accounts = await AccountHandler.handle_get_accounts([name.lower() for name in data.names], is_test)
+            return {"response": accounts}
+        except Exception as e:
+            logger.error(e)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
 @app.post("/account/", tags=["Account"])
 async def post_account(request: Request, data: Account, is_test: Optional[bool] | None = Header(default=False),
                        current_user: User = Depends(get_current_active_user)):
     with tracer.start_as_current_span(
             "post_account",
-            context=extract(request.headers),
             attributes={'attr.username': data.name, 'attr.is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
@@ -244,7 +427,7 @@ async def post_account(request: Request, data: Account, is_test: Optional[bool]
             if Lib.detect_special_characters(data.name):
                 raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
 
-            resp = AccountHandler.handle_create_account(data.name, data.balance, is_test)
+            resp = await AccountHandler.handle_create_account(data.name, data.balance, is_test)
             return {"response": resp}
         except Exception as e:
             logger.error(e)
@@ -257,14 +440,13 @@ async def put_user(request: Request, username: str, data: Account,
                    current_user: User = Depends(get_current_active_user)):
     with tracer.start_as_current_span(
             "put_user",
-            context=extract(request.headers),
             attributes={'username': username.lower(), 'attr.is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
         if Lib.detect_special_characters(username):
             raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
         try:
-            resp = AccountHandler.handle_update_account(username.lower(), data.balance, is_test)
+            resp = await AccountHandler.handle_update_account(username.lower(), data.balance, is_test)
             return {"response": resp}
         except Exception as e:
             logger.error(e)
@@ -276,36 +458,58 @@ async def delete_user(request: Request, username: str, is_test: Optional[bool] |
                       current_user: User = Depends(get_current_active_user)):
     with tracer.start_as_current_span(
             "delete_account",
-            context=extract(request.headers),
             attributes={'username': username.lower(), 'is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
         if Lib.detect_special_characters(username):
             raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
         try:
-            resp = AccountHandler.handle_delete_account(username.lower(), is_test)
+            resp = await AccountHandler.handle_delete_account(username.lower(), is_test)
             return {"response": resp}
         except Exception as e:
             logger.error(e)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+def idempotent_request(key: str | None, current_user: User, route: str, body: dict,
+                       is_test: bool) -> IdempotentRequest | None:
+    if key is None:
+        return None
+    # keys are scoped to the caller, a token whose user is gone has none to scope them to
+    if current_user.get("name") is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials",
+                            headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return IdempotentRequest(key, current_user["name"], route, body, is_test)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
 @app.post("/account/{username}/deposit", tags=["Deposit"])
 async def post_deposit(request: Request, username: str, data: Account,
                        is_test: Optional[bool] | None = Header(default=False),
+                       idempotency_key: str | None = Header(default=None),
                        current_user: User = Depends(get_current_active_user)):
     with tracer.start_as_current_span(
             "post_deposit",
-            context=extract(request.headers),
             attributes={'username': username.lower(), 'is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
         try:
             if Lib.detect_special_characters(username):
                 raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
-            print(username)
-            resp = AccountHandler.handle_modify_account(username.lower(), data.balance, is_test)
+            idempotent = idempotent_request(idempotency_key, current_user, 'deposit',
+                                            {'name': username.lower(), 'balance': data.balance}, is_test)
+            # a retry seen by this worker is answered before the handler or storage are involved
+            cached = idempotent.cached() if idempotent else None
+            if cached is not None:
+                return {"response": cached}
+            resp = await AccountHandler.handle_modify_account(username.lower(), data.balance, is_test, idempotent)
             return {"response": resp}
+        except IdempotencyKeyReused as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(e)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -314,10 +518,10 @@ async def post_deposit(request: Request, username: str, data: Account,
 @app.post("/account/{username}/transaction", tags=["Transaction"])
 async def post_transaction(request: Request, username: str, data: Transaction,
                            is_test: Optional[bool] | None = Header(default=False),
+                           idempotency_key: str | None = Header(default=None),
                            current_user: User = Depends(get_current_active_user)):
     with tracer.start_as_current_span(
             "post_transaction",
-            context=extract(request.headers),
             attributes={'username': username.lower(), 'is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
@@ -326,8 +530,94 @@ async def post_transaction(request: Request, username: str, data: Transaction,
                 raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT,
                                     detail='please send legal sender and receiver')
 
-            resp = AccountHandler.handle_transaction(data.sender, data.receiver, data.amount, is_test)
+            idempotent = idempotent_request(idempotency_key, current_user, 'transaction',
+                                            {'sender': data.sender, 'receiver': data.receiver,
+                                             'amount': data.amount}, is_test)
+            cached = idempotent.cached() if idempotent else None
+            if cached is not None:
+                return {"response": cached}
+            resp = await AccountHandler.handle_transaction(data.sender, data.receiver, data.amount, is_test,
+                                                           idempotent)
             return {"response": resp}
+        except IdempotencyKeyReused as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(e)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@app.post("/account/transaction/batch", tags=["Transaction"])
+async def post_batch_transaction(request: Request, data: list[Transaction],
+                                 is_test: Optional[bool] | None = Header(default=False),
+                                 idempotency_key: str | None = Header(default=None),
+                                 current_user: User = Depends(get_current_admin_user)):
+    with tracer.start_as_current_span(
+            "post_batch_transaction",
+            attributes={'attr.transactions': len(data), 'is_test': is_test},
+            kind=trace.SpanKind.SERVER
+    ):
+        if len(data) > MAX_BATCH_TRANSACTIONS:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f'send at most {MAX_BATCH_TRANSACTIONS} transactions per batch')
+        if any(Lib.detect_special_characters(t.sender) or Lib.detect_special_characters(t.receiver) for t in data):
+            raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT,
+                                detail='please send legal sender and receiver')
+        try:
+            idempotent = idempotent_request(idempotency_key, current_user, 'batch_transaction',
+                                            {'transactions': [[t.sender, t.receiver, t.amount] for t in data]},
+                                            is_test)
+            resp = await AccountHandler.handle_batch_transaction(data, is_test, idempotent)
+            return {"response": resp}
+        except IdempotencyKeyReused as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(e)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@app.get("/account/{username}/history", tags=["Account"])
+async def get_history(request: Request, username: str, start: str | None = None, end: str | None = None,
+                      limit: int = 100, cursor: str | None = None, order: str = 'desc',
+                      is_test: Optional[bool] | None = Header(default=False),
+                      current_user: User = Depends(get_current_active_user)):
+    with tracer.start_as_current_span(
+            "get_history",
+            attributes={'attr.username': username.lower(), 'attr.limit': limit, 'attr.is_test': is_test},
+            kind=trace.SpanKind.SERVER
+    ):
+        if Lib.detect_special_characters(username):
+            raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
+        if order not in ('asc', 'desc'):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='order must be asc or desc')
+        if not 1 <= limit <= MAX_HISTORY_PAGE:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f'limit must be between 1 and {MAX_HISTORY_PAGE}')
+        try:
+            history = await AccountHandler.handle_get_history(username.lower(), is_test, start, end, limit, cursor,
+                                                              ascending=order == 'asc')
+            return {"response": history}
+        except Exception as e:
+            logger.error(e)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@app.get("/account/{username}/audit", tags=["Admin"])
+async def get_audit(request: Request, username: str, is_test: Optional[bool] | None = Header(default=False),
+                    current_user: User = Depends(get_current_admin_user)):
+    with tracer.start_as_current_span(
+            "get_audit",
+            attributes={'attr.username': username.lower(), 'attr.is_test': is_test},
+            kind=trace.SpanKind.SERVER
+    ):
+        if Lib.detect_special_characters(username):
+            raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
+        try:
+            audit = await AccountHandler.handle_audit_balance(username.lower(), is_test)
+            return {"response": audit}
         except Exception as e:
             logger.error(e)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -338,26 +628,63 @@ async def get_portfolio(request: Request, username: str, is_test: Optional[bool]
                         current_user: User = Depends(get_current_active_user)):
     with tracer.start_as_current_span(
             "get_portfolio",
-            context=extract(request.headers),
             attributes={'attr.username': username.lower(), 'attr.is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
         if Lib.detect_special_characters(username):
             raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
         try:
-            account = PortfolioHandler.handle_get_portfolio(username.lower(), is_test)
+            account = await PortfolioHandler.handle_get_portfolio(username.lower(), is_test)
             return {"response": account}
         except Exception as e:
             logger.error(e)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@app.get("/portfolio/{username}/value", tags=["Portfolio"])
+async def get_portfolio_value(request: Request, username: str, is_test: Optional[bool] | None = Header(default=False),
+                              current_user: User = Depends(get_current_active_user)):
+    with tracer.start_as_current_span(
+            "get_portfolio_value",
+            attributes={'attr.username': username.lower(), 'attr.is_test': is_test},
+            kind=trace.SpanKind.SERVER
+    ):
+        if Lib.detect_special_characters(username):
+            raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
+        try:
+            value = await PortfolioHandler.handle_get_portfolio_value(username.lower(), is_test)
+            return {"response": value}
+        except Exception as e:
+            logger.error(e)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@app.post("/portfolio/batch", tags=["Portfolio"])
+async def get_portfolios(request: Request, data: Names, is_test: Optional[bool] | None = Header(default=False),
+                         current_user: User = Depends(get_current_active_user)):
+    with tracer.start_as_current_span(
+            "get_portfolios",
+            attributes={'attr.usernames': len(data.names), 'attr.is_test': is_test},
+            kind=trace.SpanKind.SERVER
+    ):
+        if len(data.names) > MAX_BATCH_READ_NAMES:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f'send at most {MAX_BATCH_READ_NAMES} names per batch')
+        if any(Lib.detect_special_characters(name) for name in data.names):
+            raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal usernames')
+        try:
+            portfolios = await PortfolioHandler.handle_get_portfolios([name.lower() for name in data.names], is_test)
+            return {"response": portfolios}
+        except Exception as e:
+            logger.error(e)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
 @app.post("/portfolio/", tags=["Portfolio"])
 async def post_account(request: Request, data: Portfolio, is_test: Optional[bool] | None = Header(default=False),
                        current_user: User = Depends(get_current_active_user)):
     with tracer.start_as_current_span(
             "post_account",
-            context=extract(request.headers),
             attributes={'attr.username': data.username, 'attr.is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
@@ -365,7 +692,7 @@ async def post_account(request: Request, data: Portfolio, is_test: Optional[bool
             if Lib.detect_special_characters(data.username):
                 raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
 
-            resp = PortfolioHandler.handle_create_portfolio(data.username, data, is_test)
+            resp = await PortfolioHandler.handle_create_portfolio(data.username, data, is_test)
             return {"response": resp}
         except Exception as e:
             logger.error(e)
@@ -379,7 +706,6 @@ async def put_user(request: Request, username: str, data: Portfolio,
                    current_user: User = Depends(get_current_active_user)):
     with tracer.start_as_current_span(
             "post_account",
-            context=extract(request.headers),
             attributes={'attr.username': data.username, 'attr.is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
@@ -387,7 +713,7 @@ async def put_user(request: Request, username: str, data: Portfolio,
             if Lib.detect_special_characters(data.username):
                 raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
 
-            resp = PortfolioHandler.handle_update_portfolio(data.username, data, is_test, update_type)
+            resp = await PortfolioHandler.handle_update_portfolio(data.username, data, is_test, update_type)
             return {"response": resp}
         except Exception as e:
             logger.error(e)
@@ -399,14 +725,13 @@ async def delete_user(request: Request, username: str, is_test: Optional[bool] |
                       current_user: User = Depends(get_current_active_user)):
     with tracer.start_as_current_span(
             "delete_portfolio",
-            context=extract(request.headers),
             attributes={'username': username.lower(), 'is_test': is_test},
             kind=trace.SpanKind.SERVER
     ):
         if Lib.detect_special_characters(username):
             raise HTTPException(status_code=status.HTTP_206_PARTIAL_CONTENT, detail='please send legal username')
         try:
-            resp = PortfolioHandler.handle_delete_portfolio(username.lower(), is_test)
+            resp = await PortfolioHandler.handle_delete_portfolio(username.lower(), is_test)
             return {"response": resp}
         except Exception as e:
             logger.error(e)
@@ -414,3 +739,9 @@ async def delete_user(request: Request, username: str, is_test: Optional[bool] |
 
 
 FastAPIInstrumentor.instrument_app(app)
+
+# added last so it wraps everything above, abusive requests are turned away before tracing or auth
+app.add_middleware(RateLimitMiddleware, rules=parse_rate_limits(RATE_LIMITS), identify_user=Auth.get_token_subject,
+                   max_buckets=RATE_LIMIT_MAX_BUCKETS, trust_forwarded_for=RATE_LIMIT_TRUST_FORWARDED_FOR)
+# outermost, so rate limited requests are counted and the latency covers every other middleware
+app.add_middleware(MetricsMiddleware)
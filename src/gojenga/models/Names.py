@@ -0,0 +1,5 @@
+from pydantic import BaseModel
+
+
+class Names(BaseModel):
+    names: list[str]
@@ -0,0 +1,93 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from models.Portfolio import Portfolio
+from storage.Backend import get_storage
+from storage.Storage import Increment, Put, MAX_BATCH_GET_ITEMS, MAX_BATCH_WRITE_ITEMS
+
+# upper bound on concurrent storage round trips per worker process
+STORAGE_MAX_WORKERS = int(os.getenv('STORAGE_MAX_WORKERS', '32'))
+
+_executor = ThreadPoolExecutor(max_workers=STORAGE_MAX_WORKERS, thread_name_prefix='storage')
+
+
+async def run_in_storage_executor(func, *args, **kwargs):
+    # copy the context so spans opened inside the worker thread keep their parent
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(context.run, func, *args, **kwargs))
+
+
+class AsyncDynamo:
+    """Awaitable mirror of the Dynamo API backed by the configured storage.
+
+    Each call runs on a bounded thread pool so the event loop keeps serving.
+    """
+
+    @staticmethod
+    async def get_item(table_name: str, query: dict):
+        return await run_in_storage_executor(get_storage().get_item, table_name, query)
+
+    @staticmethod
+    async def batch_get_items(table_name: str, names: list[str]) -> dict[str, dict]:
+        # one BatchGetItem per chunk, all chunks in flight at once
+        names = list(dict.fromkeys(names))
+        chunks = [names[i:i + MAX_BATCH_GET_ITEMS] for i in range(0, len(names), MAX_BATCH_GET_ITEMS)]
+        results = await asyncio.gather(*(run_in_storage_executor(get_storage().batch_get_items, table_name, chunk)
+                                         for chunk in chunks))
+        return {name: item for result in results for name, item in result.items()}
+
+    @staticmethod
+    async def batch_write_items(items: list[tuple[str, dict]]) -> None:
+        # one BatchWriteItem per chunk, all chunks in flight at once
+        chunks = [items[i:i + MAX_BATCH_WRITE_ITEMS] for i in range(0, len(items), MAX_BATCH_WRITE_ITEMS)]
+        await asyncio.gather(*(run_in_storage_executor(get_storage().batch_write_items, chunk) for chunk in chunks))
+
+    @staticmethod
+    async def create_item(table_name: str, item: dict | Portfolio, if_not_exists: bool = False) -> str:
+        return await run_in_storage_executor(get_storage().create_item, table_name, item, if_not_exists)
+
+    @staticmethod
+    async def delete_item(table_name: str, item: dict) -> str:
+        return await run_in_storage_executor(get_storage().delete_item, table_name, item)
+
+    @staticmethod
+    async def update_user_password(table_name: str, item: dict) -> str:
+        return await run_in_storage_executor(get_storage().update_user_password, table_name, item)
+
+    @staticmethod
+    async def update_account_balance(table_name: str, item: dict | list) -> str:
+        return await run_in_storage_executor(get_storage().update_account_balance, table_name, item)
+
+    @staticmethod
+    async def update_portfolio_holdings(table_name: str, name: str, upserts: dict[str, dict],
+                                        removals: list[str]) -> str:
+        return await run_in_storage_executor(get_storage().update_portfolio_holdings, table_name, name, upserts,
+                                             removals)
+
+    @staticmethod
+    async def migrate_portfolio(table_name: str, name: str) -> bool:
+        return await run_in_storage_executor(get_storage().migrate_portfolio, table_name, name)
+
+    @staticmethod
+    async def transact_write(operations: list[Increment | Put]) -> None:
+        return await run_in_storage_executor(get_storage().transact_write, operations)
+
+    @staticmethod
+    async def query_range(table_name: str, name: str, start: str | None = None, end: str | None = None,
+                          limit: int = 100, ascending: bool = True,
+                          after: str | None = None) -> tuple[list[dict], str | None]:
+        return await run_in_storage_executor(get_storage().query_range, table_name, name, start, end, limit,
+                                             ascending, after)
+
+    @staticmethod
+    async def warm_up(table_names: list[str]) -> None:
+        await run_in_storage_executor(get_storage().warm_up, table_names)
+
+    @staticmethod
+    async def scan_items(table_name: str, segment: int = 0, total_segments: int = 1) -> list[dict]:
+        # the whole segment is collected in the worker thread, meant for small tables
+        return await run_in_storage_executor(lambda: list(get_storage().scan(table_name, segment, total_segments)))
@@ -0,0 +1,36 @@
+import logging
+import os
+
+from storage.Storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# 'dynamo' talks to AWS, 'memory' keeps everything in process for local runs, load tests and CI
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'dynamo')
+# simulated round trip for the memory backend, in milliseconds
+STORAGE_LATENCY_MS = float(os.getenv('STORAGE_LATENCY_MS', '0'))
+
+_storage: Storage | None = None
+
+
+def create_storage(backend: str) -> Storage:
+    if backend == 'dynamo':
+        from storage.Dynamo import Dynamo
+        return Dynamo()
+    if backend == 'memory':
+        from storage.Memory import Memory
+        return Memory(latency=STORAGE_LATENCY_MS / 1000)
+    raise ValueError(f'unknown storage backend {backend}')
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        logger.info(f'using {STORAGE_BACKEND} storage backend')
+        _storage = create_storage(STORAGE_BACKEND)
+    return _storage
+
+
+def set_storage(storage: Storage):
+    global _storage
+    _storage = storage
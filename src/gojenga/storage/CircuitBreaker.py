@@ -0,0 +1,48 @@
+import threading
+import time
+
+
+class CircuitBreaker:
+    """Fails calls to one table fast while it keeps throttling.
+
+    failures calls in a row that still failed after their retries open the breaker for cooldown seconds.
+    After that a single probe call is let through and the breaker stays shut to everyone else for another
+    cooldown. A successful call closes it again.
+    """
+
+    def __init__(self, failures: int, cooldown: float, timer=time.monotonic):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.timer = timer
+        self.consecutive = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        with self.lock:
+            return self.consecutive >= self.failures
+
+    def retry_after(self) -> float:
+        """0 if a call may go ahead now, otherwise the seconds until the breaker lets one through."""
+        with self.lock:
+            if self.consecutive < self.failures:
+                return 0.0
+            now = self.timer()
+            if now < self.open_until:
+                return self.open_until - now
+            # this call is the probe, a probe that never reports back only holds the breaker for one cooldown
+            self.open_until = now + self.cooldown
+            return 0.0
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive = 0
+
+    def record_failure(self) -> float:
+        """Count a failed call. Returns the seconds the breaker is now open for, 0 if it is still closed."""
+        with self.lock:
+            self.consecutive += 1
+            if self.consecutive < self.failures:
+                return 0.0
+            self.open_until = self.timer() + self.cooldown
+            return self.cooldown
@@ -1,25 +1,196 @@
+import functools
 import logging
+import os
+import random
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
-from botocore.exceptions import ClientError
-from opentelemetry import trace
+from boto3.dynamodb.conditions import Key
+from botocore.config import Config
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as EndpointConnectionFailed
 
+from common.Metrics import registry, Gauge, STORAGE_CONSUMED_CAPACITY, STORAGE_DURATION, STORAGE_ERRORS, \
+    STORAGE_RETRIES, current_route
+from common.Telemetry import get_tracer
 from models.Portfolio import Portfolio
+from storage.CircuitBreaker import CircuitBreaker
+from storage.Storage import Storage, ConditionalCheckFailed, TransactionCancelled, Increment, Put, NOT_FOUND, \
+    BELOW_MINIMUM, CONFLICT, ALREADY_EXISTS, MAX_BATCH_GET_ITEMS, MAX_BATCH_WRITE_ITEMS, SORT_KEY, \
+    StorageThrottled, StorageUnavailable, portfolio_as_map
 
-dyn_resource = boto3.resource('dynamodb')
 logger = logging.getLogger(__name__)
-tracer = trace.get_tracer(__name__)
+tracer = get_tracer(__name__)
 
+# attempts for a transaction cancelled only because another transaction held the same items
+TRANSACT_CONFLICT_ATTEMPTS = 3
+# rounds of BatchGetItem before giving up on keys DynamoDB keeps returning as unprocessed
+BATCH_GET_ATTEMPTS = 5
+# same for BatchWriteItem and its unprocessed items
+BATCH_WRITE_ATTEMPTS = 8
+# attempts of a call DynamoDB throttled, failed with a server error or could not be reached, backing off with
+# full jitter between them. 10 is what botocore's legacy mode gave DynamoDB before these retries moved here,
+# with the backoff capped at STORAGE_RETRY_MAX_SECONDS a call gives up after about 3 s of waiting on average
+STORAGE_RETRY_ATTEMPTS = int(os.getenv('STORAGE_RETRY_ATTEMPTS', '10'))
+if STORAGE_RETRY_ATTEMPTS < 1:
+    raise ValueError(f'STORAGE_RETRY_ATTEMPTS must be at least 1, got {STORAGE_RETRY_ATTEMPTS}')
+STORAGE_RETRY_BASE_SECONDS = float(os.getenv('STORAGE_RETRY_BASE_SECONDS', '0.025'))
+STORAGE_RETRY_MAX_SECONDS = float(os.getenv('STORAGE_RETRY_MAX_SECONDS', '1.0'))
+# calls in a row that failed every retry before a table's circuit breaker opens, and how long it stays open
+STORAGE_BREAKER_FAILURES = int(os.getenv('STORAGE_BREAKER_FAILURES', '5'))
+STORAGE_BREAKER_COOLDOWN_SECONDS = float(os.getenv('STORAGE_BREAKER_COOLDOWN_SECONDS', '5'))
 
-class Dynamo:
+THROTTLING_ERRORS = {'ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded'}
+TRANSIENT_ERRORS = {'InternalServerError', 'ServiceUnavailable'}
+# the same inside the cancellation reasons of a transaction
+TRANSACT_THROTTLING_REASONS = {'ThrottlingError', 'ProvisionedThroughputExceeded'}
+# connections kept to DynamoDB, at least STORAGE_MAX_WORKERS (the storage threads calling at once) plus the
+# export scan threads, or calls queue for a free connection
+DYNAMO_MAX_POOL_CONNECTIONS = int(os.getenv('DYNAMO_MAX_POOL_CONNECTIONS', '64'))
+DYNAMO_TCP_KEEPALIVE = os.getenv('DYNAMO_TCP_KEEPALIVE', 'true').lower() == 'true'
+# connections opened by warm_up before the first request
+DYNAMO_WARM_CONNECTIONS = int(os.getenv('DYNAMO_WARM_CONNECTIONS', '8'))
+
+_dyn_resource = None
+_dyn_resource_lock = threading.Lock()
+_tables: dict[str, object] = {}
+
+
+def get_dyn_resource():
+    # created on first use so importing the app does not require AWS configuration
+    global _dyn_resource
+    if _dyn_resource is None:
+        with _dyn_resource_lock:
+            if _dyn_resource is None:
+                # retries are done here rather than in botocore, so every throttle reaches the circuit breakers
+                _dyn_resource = boto3.resource('dynamodb', config=Config(
+                    retries={'total_max_attempts': 1}, max_pool_connections=DYNAMO_MAX_POOL_CONNECTIONS,
+                    tcp_keepalive=DYNAMO_TCP_KEEPALIVE))
+    return _dyn_resource
+
+
+def get_table(table_name: str):
+    # Table handles are built once per name, 'ledger' and 'ledgerTest' each get their own
+    table = _tables.get(table_name)
+    if table is None:
+        # two threads may both build one, setdefault keeps the first
+        table = _tables.setdefault(table_name, get_dyn_resource().Table(table_name))
+    return table
+
+
+def error_code(e: BaseException) -> str:
+    """The DynamoDB error code behind e, found by following the exceptions it was raised from, else its type."""
+    cause: BaseException | None = e
+    while cause is not None:
+        if isinstance(cause, ClientError):
+            return cause.response['Error']['Code']
+        cause = cause.__cause__ or cause.__context__
+    return type(e).__name__
+
+
+def _table_label(args: tuple, kwargs: dict) -> str:
+    # the table name, or for batch writes and transactions every table the items go to
+    first = args[0] if args else kwargs.get('table_name', kwargs.get('items', kwargs.get('operations')))
+    if isinstance(first, list):
+        return ','.join(sorted({item[0] if isinstance(item, tuple) else item.table_name for item in first}))
+    return str(first)
+
+
+def observed(operation: str):
+    """Record the latency and errors of a storage call by table and operation."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                STORAGE_ERRORS.inc(_table_label(args, kwargs), operation, error_code(e))
+                raise
+            finally:
+                STORAGE_DURATION.observe(time.perf_counter() - started, _table_label(args, kwargs), operation)
+        return wrapper
+    return decorate
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(table_name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if table_name not in _breakers:
+            _breakers[table_name] = CircuitBreaker(STORAGE_BREAKER_FAILURES, STORAGE_BREAKER_COOLDOWN_SECONDS)
+        return _breakers[table_name]
+
+
+registry.register(Gauge('gojenga_storage_circuit_open', 'Tables whose circuit breaker is open.', ('table',),
+                        callback=lambda: {(table,): int(b.is_open()) for table, b in list(_breakers.items())}))
+
+
+def backoff(attempt: int) -> float:
+    return random.uniform(0, min(STORAGE_RETRY_MAX_SECONDS, STORAGE_RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+def record_capacity(operation: str, consumed: dict | list | None):
+    # one entry for single table calls, a list for batches and transactions
+    for entry in [consumed] if isinstance(consumed, dict) else consumed or []:
+        STORAGE_CONSUMED_CAPACITY.inc(entry['TableName'], operation, current_route(),
+                                      amount=float(entry.get('CapacityUnits', 0)))
+
+
+def give_up(tables: list[str], code: str) -> StorageUnavailable:
+    """Count a call that failed every retry against the breakers of tables and build the error to raise."""
+    opened = max(breaker(table).record_failure() for table in tables)
+    error = StorageThrottled if code in THROTTLING_ERRORS | TRANSACT_THROTTLING_REASONS else StorageUnavailable
+    return error(f"dynamo error {code} on {','.join(tables)}", retry_after=opened or STORAGE_RETRY_MAX_SECONDS)
+
+
+def call(operation: str, tables: list[str], method, **kwargs) -> dict:
+    """Make one DynamoDB request for operation on tables, asking for its consumed capacity.
+
+    Throttling, server errors and connection failures are retried with backoff. Once the retries run out
+    they raise StorageThrottled or StorageUnavailable and count against the circuit breaker of each table.
+    Calls to a table whose breaker is open fail straight away. Other errors are raised unchanged.
+    """
+    wait = max(breaker(table).retry_after() for table in tables)
+    if wait:
+        raise StorageUnavailable(f"circuit open for {','.join(tables)}", retry_after=wait)
+    for attempt in range(1, STORAGE_RETRY_ATTEMPTS + 1):
+        try:
+            response = method(ReturnConsumedCapacity='TOTAL', **kwargs)
+        except (ClientError, EndpointConnectionFailed, HTTPClientError) as e:
+            # connection errors cover an unreachable endpoint, a dropped connection and a read timeout
+            code = e.response['Error']['Code'] if isinstance(e, ClientError) else type(e).__name__
+            if isinstance(e, ClientError) and code not in THROTTLING_ERRORS and code not in TRANSIENT_ERRORS:
+                # the table answered, a failed condition or a bad request says nothing about its capacity
+                for table in tables:
+                    breaker(table).record_success()
+                raise
+            if attempt == STORAGE_RETRY_ATTEMPTS:
+                raise give_up(tables, code) from e
+            STORAGE_RETRIES.inc(','.join(tables), operation, code)
+            time.sleep(backoff(attempt))
+            continue
+        for table in tables:
+            breaker(table).record_success()
+        record_capacity(operation, response.get('ConsumedCapacity'))
+        return response
+
+
+class Dynamo(Storage):
     @staticmethod
+    @observed('get_item')
     def get_item(table_name: str, query: dict):
         with tracer.start_as_current_span(
                 "get_item",
-                attributes={'attr.table_name': table_name, 'attr.query': query}):
+                attributes={'attr.table_name': table_name, 'attr.name': str(query.get('name'))}):
             try:
-                table = dyn_resource.Table(table_name)
-                response = table.get_item(Key=query)
+                table = get_table(table_name)
+                response = call('get_item', [table_name], table.get_item, Key=query)
 
                 if 'Item' in response:
                     return response['Item']
@@ -33,31 +204,100 @@ class Dynamo:
                 raise Exception(f"dynamo error {e.response['Error']['Code']} and msg {e.response['Error']['Message']}")
 
     @staticmethod
-    def create_item(table_name: str, item: dict | Portfolio) -> str:
+    @observed('batch_get_items')
+    def batch_get_items(table_name: str, names: list[str]) -> dict[str, dict]:
+        with tracer.start_as_current_span(
+                "batch_get_items",
+                attributes={'attr.table_name': table_name, 'attr.names': len(names)}):
+            if len(names) > MAX_BATCH_GET_ITEMS:
+                raise ValueError(f'batch_get_items takes at most {MAX_BATCH_GET_ITEMS} names')
+            items: dict[str, dict] = {}
+            request: dict = {table_name: {'Keys': [{'name': name} for name in dict.fromkeys(names)]}}
+            try:
+                for attempt in range(1, BATCH_GET_ATTEMPTS + 1):
+                    response = call('batch_get_items', [table_name], get_dyn_resource().batch_get_item,
+                                    RequestItems=request)
+                    for item in response.get('Responses', {}).get(table_name, []):
+                        items[item['name']] = item
+                    # throttled keys come back unprocessed instead of failing the call
+                    request = response.get('UnprocessedKeys') or {}
+                    if not request:
+                        return items
+                    if attempt < BATCH_GET_ATTEMPTS:
+                        time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+                logger.error(f"{len(request[table_name]['Keys'])} keys still unprocessed in {table_name}")
+                raise give_up([table_name], 'ProvisionedThroughputExceededException')
+            except ClientError as e:
+                logger.error(
+                    f"{e.response['Error']['Code'], e.response['Error']['Message']}")
+                raise Exception(f"dynamo error {e.response['Error']['Code']} and msg {e.response['Error']['Message']}")
+
+    @staticmethod
+    @observed('batch_write_items')
+    def batch_write_items(items: list[tuple[str, dict]]) -> None:
+        with tracer.start_as_current_span(
+                "batch_write_items",
+                attributes={'attr.items': len(items)}):
+            if len(items) > MAX_BATCH_WRITE_ITEMS:
+                raise ValueError(f'batch_write_items takes at most {MAX_BATCH_WRITE_ITEMS} items')
+            request: dict = {}
+            for table_name, item in items:
+                request.setdefault(table_name, []).append({'PutRequest': {'Item': item}})
+            try:
+                for attempt in range(1, BATCH_WRITE_ATTEMPTS + 1):
+                    response = call('batch_write_items', sorted(request), get_dyn_resource().batch_write_item,
+                                    RequestItems=request)
+                    # throttled puts come back unprocessed instead of failing the call
+                    request = response.get('UnprocessedItems') or {}
+                    if not request:
+                        return
+                    if attempt < BATCH_WRITE_ATTEMPTS:
+                        time.sleep(random.uniform(0, min(1.0, 0.05 * 2 ** attempt)))
+                unprocessed = sum(len(puts) for puts in request.values())
+                logger.error(f'{unprocessed} items still unprocessed')
+                raise give_up(sorted(request), 'ProvisionedThroughputExceededException')
+            except ClientError as e:
+                logger.error(
+                    f"{e.response['Error']['Code'], e.response['Error']['Message']}")
+                raise Exception(f"dynamo error {e.response['Error']['Code']} and msg {e.response['Error']['Message']}")
+
+    @staticmethod
+    @observed('create_item')
+    def create_item(table_name: str, item: dict | Portfolio, if_not_exists: bool = False) -> str:
         with tracer.start_as_current_span(
                 "create_item",
                 attributes={'table_name': table_name}):
             try:
-                table = dyn_resource.Table(table_name)
-                response = table.put_item(
+                table = get_table(table_name)
+                condition: dict = {}
+                if if_not_exists:
+                    condition = {'ConditionExpression': 'attribute_not_exists(#n)',
+                                 'ExpressionAttributeNames': {'#n': 'name'}}
+                response = call(
+                    'create_item', [table_name], table.put_item,
                     Item=item,
-                    ReturnValues="ALL_OLD"
+                    ReturnValues="ALL_OLD",
+                    **condition
                 )
                 return 'insert item succeeded'
 
             except ClientError as e:
+                if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                    raise ConditionalCheckFailed(f'item already exists in {table_name}')
                 logger.error(
                     f"{e.response['Error']['Code'], e.response['Error']['Message']}")
                 raise Exception(f"dynamo error {e.response['Error']['Code']} and msg {e.response['Error']['Message']}")
 
     @staticmethod
+    @observed('delete_item')
     def delete_item(table_name: str, item: dict) -> str:
         with tracer.start_as_current_span(
                 "delete_item",
                 attributes={'table_name': table_name}):
             try:
-                table = dyn_resource.Table(table_name)
-                response = table.delete_item(
+                table = get_table(table_name)
+                response = call(
+                    'delete_item', [table_name], table.delete_item,
                     Key=item,
                     ReturnValues="ALL_OLD"
                 )
@@ -69,6 +309,7 @@ class Dynamo:
 
     # todo create a general update handlers function
     @staticmethod
+    @observed('update_user_password')
     def update_user_password(table_name: str, item: dict) -> str:
         with tracer.start_as_current_span(
                 "update_item",
@@ -76,8 +317,9 @@ class Dynamo:
             name = item["name"]
             password = item["password"]
             try:
-                table = dyn_resource.Table(table_name)
-                response = table.update_item(
+                table = get_table(table_name)
+                response = call(
+                    'update_user_password', [table_name], table.update_item,
                     Key={'name': name},
                     UpdateExpression="set password=:p",
                     ExpressionAttributeValues={
@@ -91,6 +333,7 @@ class Dynamo:
                 raise Exception(f"dynamo error {e.response['Error']['Code']} and msg {e.response['Error']['Message']}")
 
     @staticmethod
+    @observed('update_account_balance')
     def update_account_balance(table_name: str, item: dict | list) -> str:
         with tracer.start_as_current_span(
                 "update_balance",
@@ -98,8 +341,9 @@ class Dynamo:
             name = item["name"]
             balance = item["balance"]
             try:
-                table = dyn_resource.Table(table_name)
-                response = table.update_item(
+                table = get_table(table_name)
+                response = call(
+                    'update_account_balance', [table_name], table.update_item,
                     Key={'name': name},
                     UpdateExpression="set balance=:p",
                     ExpressionAttributeValues={
@@ -110,3 +354,209 @@ class Dynamo:
                 logger.error(
                     f"{e.response['Error']['Code'], e.response['Error']['Message']}")
                 raise Exception(f"dynamo error {e.response['Error']['Code']} and msg {e.response['Error']['Message']}")
+
+    @staticmethod
+    @observed('update_portfolio_holdings')
+    def update_portfolio_holdings(table_name: str, name: str, upserts: dict[str, dict], removals: list[str]) -> str:
+        with tracer.start_as_current_span(
+                "update_portfolio_holdings",
+                attributes={'attr.table_name': table_name, 'attr.holdings': len(upserts) + len(removals)}):
+            names: dict = {'#p': 'portfolio'}
+            values: dict = {':map': 'M'}
+            clauses: list[str] = []
+            for i, (coin_id, holding) in enumerate(upserts.items()):
+                names[f'#s{i}'] = coin_id
+                values[f':s{i}'] = holding
+            for i, coin_id in enumerate(removals):
+                names[f'#r{i}'] = coin_id
+            if upserts:
+                clauses.append('SET ' + ', '.join(f'#p.#s{i} = :s{i}' for i in range(len(upserts))))
+            if removals:
+                clauses.append('REMOVE ' + ', '.join(f'#p.#r{i}' for i in range(len(removals))))
+            if not clauses:
+                return 'update item success'
+            kwargs: dict = {'Key': {'name': name}, 'UpdateExpression': ' '.join(clauses),
+                            'ConditionExpression': 'attribute_type(#p, :map)',
+                            'ExpressionAttributeNames': names, 'ExpressionAttributeValues': values}
+            table = get_table(table_name)
+            for attempt in range(2):
+                try:
+                    call('update_portfolio_holdings', [table_name], table.update_item, **kwargs)
+                    return 'update item success'
+                except ClientError as e:
+                    # a list-shaped or missing portfolio has no map to set keys in, convert it and try again
+                    if e.response['Error']['Code'] == 'ConditionalCheckFailedException' and attempt == 0:
+                        Dynamo.migrate_portfolio(table_name, name)
+                        continue
+                    logger.error(
+                        f"{e.response['Error']['Code'], e.response['Error']['Message']}")
+                    raise Exception(
+                        f"dynamo error {e.response['Error']['Code']} and msg {e.response['Error']['Message']}")
+
+    @staticmethod
+    @observed('migrate_portfolio')
+    def migrate_portfolio(table_name: str, name: str) -> bool:
+        with tracer.start_as_current_span(
+                "migrate_portfolio",
+                attributes={'attr.table_name': table_name}):
+            try:
+                table = get_table(table_name)
+                response = call('migrate_portfolio', [table_name], table.get_item, Key={'name': name},
+                                ConsistentRead=True)
+                portfolio = response.get('Item', {}).get('portfolio')
+                if isinstance(portfolio, dict):
+                    return False
+                # only replace what was read, a concurrent migration may already have run and taken writes
+                call(
+                    'migrate_portfolio', [table_name], table.update_item,
+                    Key={'name': name},
+                    UpdateExpression='SET #p = :m',
+                    ConditionExpression='attribute_not_exists(#p) OR attribute_type(#p, :list)',
+                    ExpressionAttributeNames={'#p': 'portfolio'},
+                    ExpressionAttributeValues={':m': portfolio_as_map(portfolio), ':list': 'L'})
+                return True
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                    return False
+                logger.error(
+                    f"{e.response['Error']['Code'], e.response['Error']['Message']}")
+                raise Exception(f"dynamo error {e.response['Error']['Code']} and msg {e.response['Error']['Message']}")
+
+    @staticmethod
+    def _transact_item(operation: Increment | Put) -> dict:
+        if isinstance(operation, Put):
+            put: dict = {'TableName': operation.table_name, 'Item': operation.item}
+            if operation.if_not_exists:
+                put.update({'ConditionExpression': 'attribute_not_exists(#k)',
+                            'ExpressionAttributeNames': {'#k': 'name'}})
+            return {'Put': put}
+        key_name = next(iter(operation.key))
+        condition = 'attribute_exists(#k)'
+        values: dict = {':amount': operation.amount}
+        if operation.minimum is not None:
+            condition += ' AND #a >= :floor'
+            values[':floor'] = operation.minimum - operation.amount
+        return {'Update': {
+            'TableName': operation.table_name,
+            'Key': operation.key,
+            'UpdateExpression': 'ADD #a :amount',
+            'ConditionExpression': condition,
+            'ExpressionAttributeNames': {'#k': key_name, '#a': operation.attribute},
+            'ExpressionAttributeValues': values,
+            # the old item tells a failed minimum apart from a missing item
+            'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'}}
+
+    @staticmethod
+    def _cancellation_reasons(e: ClientError, operations: list[Increment | Put]) -> list[str | None]:
+        reasons: list[str | None] = []
+        for operation, reason in zip(operations, e.response.get('CancellationReasons', [])):
+            code = reason.get('Code', 'None')
+            if code == 'None':
+                reasons.append(None)
+            elif code == 'ConditionalCheckFailed' and isinstance(operation, Put):
+                reasons.append(ALREADY_EXISTS)
+            elif code == 'ConditionalCheckFailed':
+                reasons.append(BELOW_MINIMUM if 'Item' in reason else NOT_FOUND)
+            elif code == 'TransactionConflict':
+                reasons.append(CONFLICT)
+            else:
+                reasons.append(code)
+        return reasons
+
+    @staticmethod
+    @observed('transact_write')
+    def transact_write(operations: list[Increment | Put]) -> None:
+        with tracer.start_as_current_span(
+                "transact_write",
+                attributes={'attr.operations': len(operations)}):
+            # the resource client serializes plain python values the same way Table does
+            client = get_dyn_resource().meta.client
+            items = [Dynamo._transact_item(operation) for operation in operations]
+            tables = sorted({operation.table_name for operation in operations})
+            for attempt in range(1, TRANSACT_CONFLICT_ATTEMPTS + 1):
+                try:
+                    call('transact_write', tables, client.transact_write_items, TransactItems=items)
+                    return
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'TransactionCanceledException':
+                        logger.error(
+                            f"{e.response['Error']['Code'], e.response['Error']['Message']}")
+                        raise Exception(
+                            f"dynamo error {e.response['Error']['Code']} and msg {e.response['Error']['Message']}")
+                    reasons = Dynamo._cancellation_reasons(e, operations)
+                    throttled = [reason for reason in reasons if reason in TRANSACT_THROTTLING_REASONS]
+                    retryable = all(reason in (None, CONFLICT) or reason in TRANSACT_THROTTLING_REASONS
+                                    for reason in reasons)
+                    if retryable and throttled and attempt == TRANSACT_CONFLICT_ATTEMPTS:
+                        raise give_up(tables, throttled[0]) from e
+                    if not retryable or attempt == TRANSACT_CONFLICT_ATTEMPTS:
+                        raise TransactionCancelled(reasons)
+                    time.sleep(backoff(attempt) if throttled else random.uniform(0, 0.01 * 2 ** attempt))
+
+    @staticmethod
+    @observed('query_range')
+    def query_range(table_name: str, name: str, start: str | None = None, end: str | None = None,
+                    limit: int = 100, ascending: bool = True,
+                    after: str | None = None) -> tuple[list[dict], str | None]:
+        with tracer.start_as_current_span(
+                "query_range",
+                attributes={'attr.table_name': table_name, 'attr.limit': limit}):
+            condition = Key('name').eq(name)
+            if start is not None and end is not None:
+                condition &= Key(SORT_KEY).between(start, end)
+            elif start is not None:
+                condition &= Key(SORT_KEY).gte(start)
+            elif end is not None:
+                condition &= Key(SORT_KEY).lte(end)
+            kwargs: dict = {'KeyConditionExpression': condition, 'Limit': limit, 'ScanIndexForward': ascending}
+            if after is not None:
+                kwargs['ExclusiveStartKey'] = {'name': name, SORT_KEY: after}
+            try:
+                response = call('query_range', [table_name], get_table(table_name).query, **kwargs)
+                last = response.get('LastEvaluatedKey')
+                return response.get('Items', []), last[SORT_KEY] if last else None
+            except ClientError as e:
+                logger.error(
+                    f"{e.response['Error']['Code'], e.response['Error']['Message']}")
+                raise Exception(f"dynamo error {e.response['Error']['Code']} and msg {e.response['Error']['Message']}")
+
+    @staticmethod
+    def warm_up(table_names: list[str]) -> None:
+        """Resolve credentials, build the Table handles and open DYNAMO_WARM_CONNECTIONS pooled connections
+        with concurrent DescribeTable calls, which cost no read capacity. Missing tables are only logged."""
+        if not table_names:
+            return
+        client = get_dyn_resource().meta.client
+        for table_name in table_names:
+            get_table(table_name)
+
+        def describe(table_name: str):
+            try:
+                client.describe_table(TableName=table_name)
+            except ClientError as e:
+                logger.info(f"warm up of {table_name} {e.response['Error']['Code']}")
+
+        # at least one call per table, however low DYNAMO_WARM_CONNECTIONS is set
+        calls = max(len(table_names), DYNAMO_WARM_CONNECTIONS)
+        with ThreadPoolExecutor(max_workers=min(calls, DYNAMO_MAX_POOL_CONNECTIONS)) as executor:
+            list(executor.map(describe, (table_names[i % len(table_names)] for i in range(calls))))
+        logger.info(f'storage warmed up for {len(table_names)} tables')
+
+    @staticmethod
+    def scan(table_name: str, segment: int = 0, total_segments: int = 1) -> Iterator[dict]:
+        with tracer.start_as_current_span(
+                "scan",
+                attributes={'attr.table_name': table_name, 'attr.segment': segment}):
+            try:
+                table = get_table(table_name)
+                kwargs: dict = {'Segment': segment, 'TotalSegments': total_segments}
+                while True:
+                    response = call('scan', [table_name], table.scan, **kwargs)
+                    yield from response.get('Items', [])
+                    if 'LastEvaluatedKey' not in response:
+                        return
+                    kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            except ClientError as e:
+                logger.error(
+                    f"{e.response['Error']['Code'], e.response['Error']['Message']}")
+                raise Exception(f"dynamo error {e.response['Error']['Code']} and msg {e.response['Error']['Message']}")
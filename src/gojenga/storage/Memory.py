@@ -0,0 +1,158 @@
+import copy
+import threading
+import time
+import zlib
+from collections.abc import Iterator
+
+from models.Portfolio import Portfolio
+from storage.Storage import Storage, ConditionalCheckFailed, TransactionCancelled, Increment, Put, NOT_FOUND, \
+    BELOW_MINIMUM, ALREADY_EXISTS, SORT_KEY, portfolio_as_map
+
+
+class Memory(Storage):
+    """In-process stand-in for Dynamo with the same return values and conditional semantics.
+
+    Tables are created on first write. Items are copied on the way in and out so callers never share
+    state with the store, the way they would not with a real database. latency (seconds) is slept on
+    every call to mimic a network round trip when benchmarking.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: dict[str, dict[str, dict]] = {}
+        # items of tables with a sort key: table -> name -> sort key -> item
+        self.ranges: dict[str, dict[str, dict[str, dict]]] = {}
+        self.lock = threading.Lock()
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _table(self, table_name: str) -> dict:
+        return self.tables.setdefault(table_name, {})
+
+    def _exists(self, table_name: str, item: dict) -> bool:
+        if SORT_KEY in item:
+            return item[SORT_KEY] in self.ranges.get(table_name, {}).get(item['name'], {})
+        return item['name'] in self._table(table_name)
+
+    def _put(self, table_name: str, item: dict):
+        item = copy.deepcopy(dict(item))
+        if SORT_KEY in item:
+            self.ranges.setdefault(table_name, {}).setdefault(item['name'], {})[item[SORT_KEY]] = item
+        else:
+            self._table(table_name)[item['name']] = item
+
+    def get_item(self, table_name: str, query: dict):
+        self._round_trip()
+        with self.lock:
+            item = self._table(table_name).get(query['name'])
+            if item is None:
+                return {'message': 'item not found'}
+            return copy.deepcopy(item)
+
+    def batch_get_items(self, table_name: str, names: list[str]) -> dict[str, dict]:
+        self._round_trip()
+        with self.lock:
+            table = self._table(table_name)
+            return {name: copy.deepcopy(table[name]) for name in names if name in table}
+
+    def batch_write_items(self, items: list[tuple[str, dict]]) -> None:
+        self._round_trip()
+        with self.lock:
+            for table_name, item in items:
+                self._put(table_name, item)
+
+    def create_item(self, table_name: str, item: dict | Portfolio, if_not_exists: bool = False) -> str:
+        self._round_trip()
+        with self.lock:
+            if if_not_exists and self._exists(table_name, item):
+                raise ConditionalCheckFailed(f'item already exists in {table_name}')
+            self._put(table_name, item)
+        return 'insert item succeeded'
+
+    def delete_item(self, table_name: str, item: dict) -> str:
+        self._round_trip()
+        with self.lock:
+            self._table(table_name).pop(item['name'], None)
+        return 'delete item success'
+
+    def _set_attribute(self, table_name: str, name: str, attribute: str, value) -> str:
+        self._round_trip()
+        with self.lock:
+            # like UpdateItem, a missing item is created
+            self._table(table_name).setdefault(name, {'name': name})[attribute] = copy.deepcopy(value)
+        return 'update item success'
+
+    def update_user_password(self, table_name: str, item: dict) -> str:
+        return self._set_attribute(table_name, item['name'], 'password', item['password'])
+
+    def update_account_balance(self, table_name: str, item: dict | list) -> str:
+        return self._set_attribute(table_name, item['name'], 'balance', item['balance'])
+
+    def update_portfolio_holdings(self, table_name: str, name: str, upserts: dict[str, dict],
+                                  removals: list[str]) -> str:
+        self._round_trip()
+        with self.lock:
+            item = self._table(table_name).setdefault(name, {'name': name})
+            item['portfolio'] = portfolio_as_map(item.get('portfolio'))
+            item['portfolio'].update(copy.deepcopy(upserts))
+            for coin_id in removals:
+                item['portfolio'].pop(coin_id, None)
+        return 'update item success'
+
+    def migrate_portfolio(self, table_name: str, name: str) -> bool:
+        self._round_trip()
+        with self.lock:
+            item = self._table(table_name).get(name)
+            if item is None or isinstance(item.get('portfolio'), dict):
+                return False
+            item['portfolio'] = portfolio_as_map(item.get('portfolio'))
+            return True
+
+    def transact_write(self, operations: list[Increment | Put]) -> None:
+        self._round_trip()
+        with self.lock:
+            # check every condition before touching anything so a failure applies nothing
+            reasons: list[str | None] = []
+            for operation in operations:
+                if isinstance(operation, Put):
+                    exists = self._exists(operation.table_name, operation.item)
+                    reasons.append(ALREADY_EXISTS if operation.if_not_exists and exists else None)
+                    continue
+                item = self._table(operation.table_name).get(operation.key['name'])
+                if item is None:
+                    reasons.append(NOT_FOUND)
+                elif operation.minimum is not None and \
+                        item.get(operation.attribute, 0) + operation.amount < operation.minimum:
+                    reasons.append(BELOW_MINIMUM)
+                else:
+                    reasons.append(None)
+            if any(reasons):
+                raise TransactionCancelled(reasons)
+            for operation in operations:
+                if isinstance(operation, Put):
+                    self._put(operation.table_name, operation.item)
+                    continue
+                item = self._table(operation.table_name)[operation.key['name']]
+                item[operation.attribute] = item.get(operation.attribute, 0) + operation.amount
+
+    def query_range(self, table_name: str, name: str, start: str | None = None, end: str | None = None,
+                    limit: int = 100, ascending: bool = True,
+                    after: str | None = None) -> tuple[list[dict], str | None]:
+        self._round_trip()
+        with self.lock:
+            keys = sorted(self.ranges.get(table_name, {}).get(name, {}), reverse=not ascending)
+            keys = [key for key in keys if (start is None or key >= start) and (end is None or key <= end)
+                    and (after is None or (key > after if ascending else key < after))]
+            items = [copy.deepcopy(self.ranges[table_name][name][key]) for key in keys[:limit]]
+        return items, items[-1][SORT_KEY] if len(keys) > limit else None
+
+    def scan(self, table_name: str, segment: int = 0, total_segments: int = 1) -> Iterator[dict]:
+        self._round_trip()
+        with self.lock:
+            items = [copy.deepcopy(item) for name, item in self._table(table_name).items()
+                     if zlib.crc32(name.encode()) % total_segments == segment]
+            items += [copy.deepcopy(item) for name, entries in self.ranges.get(table_name, {}).items()
+                      if zlib.crc32(name.encode()) % total_segments == segment for item in entries.values()]
+        yield from items
@@ -0,0 +1,161 @@
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from decimal import Decimal
+
+from models.Portfolio import Portfolio
+
+
+# most operations DynamoDB accepts in one TransactWriteItems call
+MAX_TRANSACT_ITEMS = 100
+# most keys DynamoDB accepts in one BatchGetItem call
+MAX_BATCH_GET_ITEMS = 100
+# most puts DynamoDB accepts in one BatchWriteItem call
+MAX_BATCH_WRITE_ITEMS = 25
+
+# sort key of tables that keep many items per name, e.g. the transaction log
+SORT_KEY = 'ts'
+
+# tables the API uses, each with a '<name>Test' twin that Is-Test requests go to
+TABLES = ('users', 'ledger', 'portfolio', 'transactions', 'snapshots', 'revoked', 'idempotency')
+
+# why an operation inside a cancelled transaction failed
+NOT_FOUND = 'not found'
+BELOW_MINIMUM = 'below minimum'
+CONFLICT = 'conflict'
+ALREADY_EXISTS = 'already exists'
+
+
+def portfolio_as_map(portfolio: list | dict | None) -> dict:
+    """Holdings keyed by coin id. Portfolios used to be stored as a list of {'name', 'amount', 'id'}."""
+    if isinstance(portfolio, dict):
+        return portfolio
+    return {coin['id']: coin for coin in portfolio or []}
+
+
+class ConditionalCheckFailed(Exception):
+    """Raised when a conditional write is rejected, e.g. creating an item that already exists."""
+
+
+class TransactionCancelled(Exception):
+    """Raised when transact_write applied nothing. reasons lines up with the operations, None where the
+    operation itself was fine."""
+
+    def __init__(self, reasons: list[str | None]):
+        super().__init__(f'transaction cancelled {reasons}')
+        self.reasons = reasons
+
+
+class StorageUnavailable(Exception):
+    """Raised when storage kept failing with transient errors, or a table's circuit breaker is open.
+    retry_after is how many seconds a caller should wait before trying again."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class StorageThrottled(StorageUnavailable):
+    """Raised when storage kept throttling a call after every retry."""
+
+
+def unavailable_cause(e: BaseException) -> StorageUnavailable | None:
+    """The StorageUnavailable that e was raised from, however many times handlers re-wrapped it."""
+    cause: BaseException | None = e
+    while cause is not None:
+        if isinstance(cause, StorageUnavailable):
+            return cause
+        cause = cause.__cause__ or cause.__context__
+    return None
+
+
+class Increment:
+    """Add amount to a numeric attribute of an existing item. With minimum set, the result may not go below it."""
+
+    def __init__(self, table_name: str, key: dict, amount: Decimal, attribute: str = 'balance',
+                 minimum: Decimal | None = None):
+        self.table_name = table_name
+        self.key = key
+        self.amount = amount
+        self.attribute = attribute
+        self.minimum = minimum
+
+
+class Put:
+    """Write a whole item. With if_not_exists set, fails when an item with the same key is already there."""
+
+    def __init__(self, table_name: str, item: dict, if_not_exists: bool = False):
+        self.table_name = table_name
+        self.item = item
+        self.if_not_exists = if_not_exists
+
+
+class Storage(ABC):
+    """Operations every storage backend provides. Items are keyed by their 'name' attribute."""
+
+    @abstractmethod
+    def get_item(self, table_name: str, query: dict):
+        ...
+
+    @abstractmethod
+    def batch_get_items(self, table_name: str, names: list[str]) -> dict[str, dict]:
+        """Read up to MAX_BATCH_GET_ITEMS items in one round trip. Names that do not exist are left out."""
+        ...
+
+    @abstractmethod
+    def batch_write_items(self, items: list[tuple[str, dict]]) -> None:
+        """Put up to MAX_BATCH_WRITE_ITEMS (table_name, item) pairs, unconditionally and not atomically."""
+        ...
+
+    @abstractmethod
+    def create_item(self, table_name: str, item: dict | Portfolio, if_not_exists: bool = False) -> str:
+        ...
+
+    @abstractmethod
+    def delete_item(self, table_name: str, item: dict) -> str:
+        ...
+
+    @abstractmethod
+    def update_user_password(self, table_name: str, item: dict) -> str:
+        ...
+
+    @abstractmethod
+    def update_account_balance(self, table_name: str, item: dict | list) -> str:
+        ...
+
+    @abstractmethod
+    def update_portfolio_holdings(self, table_name: str, name: str, upserts: dict[str, dict],
+                                  removals: list[str]) -> str:
+        """Set or remove single holdings of a portfolio in place, without reading or rewriting the rest.
+
+        A list-shaped or missing portfolio is converted to a map first.
+        """
+        ...
+
+    @abstractmethod
+    def migrate_portfolio(self, table_name: str, name: str) -> bool:
+        """Convert one item's portfolio from a list to a map keyed by coin id. Returns False when there was
+        nothing to convert."""
+        ...
+
+    @abstractmethod
+    def transact_write(self, operations: list[Increment | Put]) -> None:
+        """Apply every operation or none of them, raising TransactionCancelled on failure."""
+        ...
+
+    @abstractmethod
+    def query_range(self, table_name: str, name: str, start: str | None = None, end: str | None = None,
+                    limit: int = 100, ascending: bool = True,
+                    after: str | None = None) -> tuple[list[dict], str | None]:
+        """Items of one name in a table keyed by name and SORT_KEY, with start <= ts <= end, in sort key order.
+
+        Returns at most limit items and the sort key to pass as after for the next page, None on the last page.
+        """
+        ...
+
+    @abstractmethod
+    def scan(self, table_name: str, segment: int = 0, total_segments: int = 1) -> Iterator[dict]:
+        """Yield every item of one segment of the table."""
+        ...
+
+    def warm_up(self, table_names: list[str]) -> None:
+        """Do up front the set up the first calls to these tables would otherwise pay for. Nothing by default."""
@@ -0,0 +1,100 @@
+import unittest
+from unittest import mock
+
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+
+from storage import Dynamo
+from storage.CircuitBreaker import CircuitBreaker
+from storage.Storage import StorageThrottled, StorageUnavailable, unavailable_cause
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def client_error(code: str) -> ClientError:
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'GetItem')
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_failures_then_probes(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failures=2, cooldown=5, timer=clock)
+        assert breaker.record_failure() == 0
+        assert breaker.retry_after() == 0
+        assert breaker.record_failure() == 5
+        assert breaker.retry_after() == 5
+        clock.now = 5
+        # one probe goes through, everyone else keeps waiting
+        assert breaker.retry_after() == 0
+        assert breaker.retry_after() == 5
+        breaker.record_success()
+        assert breaker.retry_after() == 0
+        assert not breaker.is_open()
+
+
+@mock.patch.object(Dynamo.time, 'sleep', lambda seconds: None)
+class TestCall(unittest.TestCase):
+    def setUp(self):
+        Dynamo._breakers.clear()
+
+    def test_retries_throttling_and_records_capacity(self):
+        method = mock.Mock(side_effect=[client_error('ProvisionedThroughputExceededException'),
+                                        {'Item': {}, 'ConsumedCapacity': {'TableName': 'ledger',
+                                                                          'CapacityUnits': 0.5}}])
+        before = Dynamo.STORAGE_CONSUMED_CAPACITY.values.get(('ledger', 'get_item', 'background'), 0)
+        assert Dynamo.call('get_item', ['ledger'], method, Key={'name': 'kovax'}) == {
+            'Item': {}, 'ConsumedCapacity': {'TableName': 'ledger', 'CapacityUnits': 0.5}}
+        method.assert_called_with(ReturnConsumedCapacity='TOTAL', Key={'name': 'kovax'})
+        assert method.call_count == 2
+        assert Dynamo.STORAGE_CONSUMED_CAPACITY.values[('ledger', 'get_item', 'background')] == before + 0.5
+
+    def test_gives_up_then_breaker_fails_fast(self):
+        method = mock.Mock(side_effect=client_error('ThrottlingException'))
+        for _ in range(Dynamo.STORAGE_BREAKER_FAILURES):
+            with self.assertRaises(StorageThrottled):
+                Dynamo.call('get_item', ['ledger'], method)
+        calls = method.call_count
+        assert calls == Dynamo.STORAGE_BREAKER_FAILURES * Dynamo.STORAGE_RETRY_ATTEMPTS
+        with self.assertRaises(StorageUnavailable) as raised:
+            Dynamo.call('get_item', ['ledger'], method)
+        assert raised.exception.retry_after > 0
+        assert method.call_count == calls
+
+    def test_connection_failures_are_retried_then_unavailable(self):
+        method = mock.Mock(side_effect=[EndpointConnectionError(endpoint_url='http://dynamodb'),
+                                        ReadTimeoutError(endpoint_url='http://dynamodb'), {'Item': {}}])
+        assert Dynamo.call('get_item', ['ledger'], method) == {'Item': {}}
+        method = mock.Mock(side_effect=EndpointConnectionError(endpoint_url='http://dynamodb'))
+        with self.assertRaises(StorageUnavailable) as raised:
+            Dynamo.call('get_item', ['ledger'], method)
+        assert not isinstance(raised.exception, StorageThrottled)
+        assert method.call_count == Dynamo.STORAGE_RETRY_ATTEMPTS
+        assert Dynamo.breaker('ledger').consecutive == 1
+
+    def test_other_errors_are_not_retried(self):
+        method = mock.Mock(side_effect=client_error('ConditionalCheckFailedException'))
+        with self.assertRaises(ClientError):
+            Dynamo.call('create_item', ['users'], method)
+        assert method.call_count == 1
+
+    def test_unavailable_cause_follows_rewrapping(self):
+        try:
+            try:
+                try:
+                    raise StorageThrottled('throttled', retry_after=1)
+                except Exception as e:
+                    raise ValueError(e)
+            except Exception as e:
+                raise Exception(f'500 {e}')
+        except Exception as e:
+            assert isinstance(unavailable_cause(e), StorageThrottled)
+        assert unavailable_cause(ValueError('bad')) is None
+
+
+if __name__ == '__main__':
+    unittest.main()
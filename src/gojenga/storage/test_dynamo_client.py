@@ -0,0 +1,43 @@
+import unittest
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+from storage import Dynamo
+
+
+class TestDynamoClient(unittest.TestCase):
+    def setUp(self):
+        self.resource = mock.Mock()
+        self.resource.Table.side_effect = lambda name: mock.Mock(name=name)
+        patcher = mock.patch.object(Dynamo, 'get_dyn_resource', return_value=self.resource)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(Dynamo._tables.clear)
+        Dynamo._tables.clear()
+
+    def test_table_handles_are_cached_per_name(self):
+        assert Dynamo.get_table('ledger') is Dynamo.get_table('ledger')
+        assert Dynamo.get_table('ledgerTest') is not Dynamo.get_table('ledger')
+        assert self.resource.Table.call_count == 2
+
+    def test_warm_up_describes_every_table_and_skips_missing_ones(self):
+        missing = ClientError({'Error': {'Code': 'ResourceNotFoundException', 'Message': ''}}, 'DescribeTable')
+        describe = self.resource.meta.client.describe_table
+        describe.side_effect = lambda TableName: (_ for _ in ()).throw(missing) if TableName == 'usersTest' else {}
+        Dynamo.Dynamo.warm_up(['users', 'usersTest'])
+        described = {call.kwargs['TableName'] for call in describe.call_args_list}
+        assert described == {'users', 'usersTest'}
+        assert describe.call_count == max(2, Dynamo.DYNAMO_WARM_CONNECTIONS)
+        assert set(Dynamo._tables) == {'users', 'usersTest'}
+
+    def test_warm_up_without_tables_does_nothing(self):
+        with mock.patch.object(Dynamo, 'DYNAMO_WARM_CONNECTIONS', -1):
+            Dynamo.Dynamo.warm_up([])
+            Dynamo.Dynamo.warm_up(['users'])
+        assert self.resource.meta.client.describe_table.call_count == 1
+        assert set(Dynamo._tables) == {'users'}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+from decimal import Decimal
+
+from storage.Memory import Memory
+from storage.Storage import ConditionalCheckFailed, TransactionCancelled, Increment, Put, NOT_FOUND, BELOW_MINIMUM, \
+    ALREADY_EXISTS
+
+
+class TestMemory(unittest.TestCase):
+    def setUp(self):
+        self.storage = Memory()
+
+    def test_get_missing(self):
+        assert self.storage.get_item('ledgerTest', {'name': 'kovax'}) == {'message': 'item not found'}
+
+    def test_create_and_get(self):
+        resp = self.storage.create_item('ledgerTest', {'name': 'kovax', 'balance': Decimal('235.99')})
+        assert resp == 'insert item succeeded'
+        assert self.storage.get_item('ledgerTest', {'name': 'kovax'}) == {'name': 'kovax', 'balance': Decimal('235.99')}
+
+    def test_batch_get_leaves_out_missing(self):
+        self.storage.create_item('ledgerTest', {'name': 'kovax', 'balance': Decimal('1')})
+        self.storage.create_item('ledgerTest', {'name': 'david', 'balance': Decimal('2')})
+        items = self.storage.batch_get_items('ledgerTest', ['kovax', 'nobody', 'david'])
+        assert items == {'kovax': {'name': 'kovax', 'balance': Decimal('1')},
+                         'david': {'name': 'david', 'balance': Decimal('2')}}
+
+    def test_items_are_copied(self):
+        item = {'name': 'allie', 'portfolio': [{'name': 'og-bitcoin', 'amount': 2, 'id': 'bitcoin'}]}
+        self.storage.create_item('portfolioTest', item)
+        item['portfolio'].clear()
+        fetched = self.storage.get_item('portfolioTest', {'name': 'allie'})
+        fetched['portfolio'].clear()
+        assert len(self.storage.get_item('portfolioTest', {'name': 'allie'})['portfolio']) == 1
+
+    def test_create_if_not_exists(self):
+        self.storage.create_item('usersTest', {'name': 'zala', 'password': '5821'}, if_not_exists=True)
+        with self.assertRaises(ConditionalCheckFailed):
+            self.storage.create_item('usersTest', {'name': 'zala', 'password': '0000'}, if_not_exists=True)
+        assert self.storage.get_item('usersTest', {'name': 'zala'})['password'] == '5821'
+
+    def test_updates_upsert(self):
+        resp = self.storage.update_account_balance('ledgerTest', {'name': 'david', 'balance': 5})
+        assert resp == 'update item success'
+        resp = self.storage.update_user_password('usersTest', {'name': 'david', 'password': '0000'})
+        assert resp == 'update item success'
+        assert self.storage.get_item('ledgerTest', {'name': 'david'}) == {'name': 'david', 'balance': 5}
+        assert self.storage.get_item('usersTest', {'name': 'david'}) == {'name': 'david', 'password': '0000'}
+
+    def test_delete(self):
+        self.storage.create_item('ledgerTest', {'name': 'zala', 'balance': Decimal('212.38')})
+        assert self.storage.delete_item('ledgerTest', {'name': 'zala'}) == 'delete item success'
+        assert self.storage.delete_item('ledgerTest', {'name': 'zala'}) == 'delete item success'
+        assert self.storage.get_item('ledgerTest', {'name': 'zala'}) == {'message': 'item not found'}
+
+    def test_transact_write_is_all_or_nothing(self):
+        self.storage.create_item('ledgerTest', {'name': 'kovax', 'balance': Decimal('5')})
+        self.storage.create_item('ledgerTest', {'name': 'david', 'balance': Decimal('0')})
+        with self.assertRaises(TransactionCancelled) as cancelled:
+            self.storage.transact_write([
+                Increment('ledgerTest', {'name': 'kovax'}, Decimal('-6'), minimum=Decimal('0')),
+                Increment('ledgerTest', {'name': 'zala'}, Decimal('6'))])
+        assert cancelled.exception.reasons == [BELOW_MINIMUM, NOT_FOUND]
+        self.storage.transact_write([Increment('ledgerTest', {'name': 'kovax'}, Decimal('-5'), minimum=Decimal('0')),
+                                     Increment('ledgerTest', {'name': 'david'}, Decimal('5'))])
+        assert self.storage.get_item('ledgerTest', {'name': 'kovax'})['balance'] == Decimal('0')
+        assert self.storage.get_item('ledgerTest', {'name': 'david'})['balance'] == Decimal('5')
+
+    def test_transact_put_if_not_exists(self):
+        self.storage.create_item('usersTest', {'name': 'kovax', 'password': '5182'})
+        with self.assertRaises(TransactionCancelled) as cancelled:
+            self.storage.transact_write([Put('usersTest', {'name': 'kovax', 'password': '0000'}, if_not_exists=True),
+                                         Put('ledgerTest', {'name': 'kovax', 'balance': Decimal('0')})])
+        assert cancelled.exception.reasons == [ALREADY_EXISTS, None]
+        assert self.storage.get_item('ledgerTest', {'name': 'kovax'}) == {'message': 'item not found'}
+
+    def test_query_range(self):
+        for ts in ('t1', 't2', 't3', 't4'):
+            self.storage.create_item('transactionsTest', {'name': 'kovax', 'ts': ts})
+        self.storage.create_item('transactionsTest', {'name': 'david', 'ts': 't2'})
+        items, cursor = self.storage.query_range('transactionsTest', 'kovax', limit=3, ascending=False)
+        assert [item['ts'] for item in items] == ['t4', 't3', 't2'] and cursor == 't2'
+        items, cursor = self.storage.query_range('transactionsTest', 'kovax', limit=3, ascending=False, after=cursor)
+        assert [item['ts'] for item in items] == ['t1'] and cursor is None
+        items, _ = self.storage.query_range('transactionsTest', 'kovax', start='t2', end='t3')
+        assert [item['ts'] for item in items] == ['t2', 't3']
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import asyncio
 import unittest
 
 from fastapi.testclient import TestClient
@@ -26,7 +27,7 @@ class TestUtils(unittest.TestCase):
         assert response.json() == {"response": "update item success"}
 
     def test_delete_user(self):
-        resp = UserHandler.handle_create_user('zala', '5821', True)
+        resp = asyncio.run(UserHandler.handle_create_user('zala', '5821', True))
         assert resp == "insert item succeeded", 'failed to insert item before testing delete'
         response = client.delete("/user/zala", headers={'Is-Test': 'True'})
         assert response.json() == {"response": "delete item success"}
@@ -45,7 +46,7 @@ class TestUtils(unittest.TestCase):
         assert response.json() == {"response": "update item success"}
 
     def test_delete_account(self):
-        resp = AccountHandler.handle_create_account('zala', Decimal('212.38'), True)
+        resp = asyncio.run(AccountHandler.handle_create_account('zala', Decimal('212.38'), True))
         assert resp == "insert item succeeded", 'failed to insert item before testing delete'
         response = client.delete("/account/zala", headers={'Is-Test': 'True'})
         assert response.json() == {"response": "delete item success"}